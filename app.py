@@ -1,16 +1,44 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
+from transaction_api.api.middleware import CompressionMiddleware, MetricsMiddleware
+from transaction_api.api.monitoring import metrics_router
+from transaction_api.api.monitoring import router as monitoring_router
+from transaction_api.api.statistics import amounts_router
 from transaction_api.api.statistics import router as statistics_router
 from transaction_api.api.transactions import router as transactions_router
 from transaction_api.api.users import router as user_router
 from transaction_api import initialize
+from transaction_api.repository import feed as feed_repo
+from transaction_api.repository import purges as purge_repo
+from transaction_api.repository.group_commit import group_commit
+from transaction_api.services.database import db_service
+from transaction_api.settings import settings
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db_service.connect()
+    await initialize.initialize_indexes()
+    await purge_repo.resume_purges()
+    feed_repo.start_feed()
+    yield
+    await feed_repo.stop_feed()
+    await purge_repo.stop_purges()
+    await group_commit.close()
+    await db_service.close()
 
 
 def create_app(*args, **kwargs):
-    initialize.initialize_indexes()
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
 
     app.include_router(user_router)
     app.include_router(statistics_router)
+    app.include_router(amounts_router)
     app.include_router(transactions_router)
+    app.include_router(monitoring_router)
+    app.include_router(metrics_router)
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_minimum_size)
+    app.add_middleware(MetricsMiddleware)
     return app
@@ -0,0 +1,248 @@
+"""
+Drive every router of the real app against the in-memory Mongo stand-in, or a real MongoDB through either
+driver, and report throughput and latency.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from itertools import count
+from statistics import quantiles
+
+import httpx
+
+from app import create_app
+from transaction_api.models.transaction import Transaction, TransactionInput
+from transaction_api.models.user import User
+from transaction_api.repository.users import BalanceChange
+from transaction_api.services import database
+from transaction_api.services.database import (
+    AsyncDatabaseService,
+    DatabaseService,
+    ThreadpoolDatabaseService,
+)
+from transaction_api.settings import settings
+
+from .mongo import MemoryDatabaseService
+
+START = datetime(2024, 1, 1)
+
+
+class Dataset:
+    def __init__(self, users: int, transactions_per_user: int, seed: int):
+        self.random = random.Random(seed)
+        self.user_ids = [f"user{index:06d}" for index in range(users)]
+        self.transactions_per_user = transactions_per_user
+        self._ids = count()
+
+    def user_id(self) -> str:
+        return self.random.choice(self.user_ids)
+
+    def transaction_id(self) -> str:
+        return f"bench{next(self._ids):010d}"
+
+    def transaction(self, user_id: str | None = None) -> dict:
+        return {
+            "transactionId": self.transaction_id(),
+            "userId": user_id or self.user_id(),
+            "amount": round(self.random.uniform(1, 100), 2),
+            "timestamp": (START + timedelta(seconds=self.random.randrange(365 * 86400))).isoformat(),
+        }
+
+    def seed(self, service: MemoryDatabaseService | DatabaseService) -> None:
+        users = service.database.get_collection(User.collection_name)
+        transactions = service.database.get_collection(Transaction.collection_name)
+        for user_id in self.user_ids:
+            users.insert_one(
+                {
+                    "user_id": user_id,
+                    "name": f"Benchmark {user_id}",
+                    "email": f"{user_id}@example.com",
+                    "created_at": START,
+                    "balance": 0.0,
+                }
+            )
+            rows = [TransactionInput(**self.transaction(user_id)) for _ in range(self.transactions_per_user)]
+            if rows:
+                transactions.insert_many([row.model_dump() for row in rows])
+                users.update_one({"user_id": user_id}, BalanceChange.from_transactions(*rows).as_update())
+
+
+Request = Callable[[Dataset], tuple[str, str, dict | list | None]]
+
+ENDPOINTS: dict[str, Request] = {
+    "POST /users": lambda data: (
+        "POST",
+        "/users",
+        {"userId": f"new{data.transaction_id()}", "name": "Benchmark", "email": "new@example.com"},
+    ),
+    "GET /users": lambda data: ("GET", "/users?limit=100", None),
+    "GET /users/{userId}": lambda data: ("GET", f"/users/{data.user_id()}", None),
+    "POST /transactions": lambda data: ("POST", "/transactions", data.transaction()),
+    "POST /transactions/batch": lambda data: (
+        "POST",
+        "/transactions/batch",
+        [data.transaction() for _ in range(50)],
+    ),
+    "GET /transactions": lambda data: ("GET", f"/transactions?userId={data.user_id()}&limit=100", None),
+    "GET /transactions/export": lambda data: ("GET", f"/transactions/export?userId={data.user_id()}", None),
+    "GET /account-summary/{userId}": lambda data: ("GET", f"/account-summary/{data.user_id()}", None),
+}
+
+
+def use_database_service(service) -> None:
+    # Every module binds ``db_service`` at import time, so rebind it wherever it was imported.
+    original = database.db_service
+    for module in list(sys.modules.values()):
+        if getattr(module, "db_service", None) is original:
+            module.db_service = service
+
+
+async def measure(
+    client: httpx.AsyncClient, data: Dataset, request: Request, requests: int, concurrency: int
+):
+    latencies = []
+    errors = 0
+    remaining = count(requests, -1)
+
+    async def worker():
+        nonlocal errors
+        while next(remaining) > 0:
+            method, url, body = request(data)
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    percentiles = quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+    }
+
+
+def database_services(args) -> tuple:
+    """The service the app runs on, and a sync one over the same database to seed it."""
+    if not args.mongo_uri:
+        service = MemoryDatabaseService()
+        return ThreadpoolDatabaseService(service), service
+    config = settings.model_copy(
+        update={
+            "mongo_db_uri": args.mongo_uri,
+            "mongo_db_name": args.database,
+            "database_driver": args.driver,
+        }
+    )
+    seeder = DatabaseService(config)
+    seeder.client.drop_database(args.database)
+    if args.driver == "sync":
+        return ThreadpoolDatabaseService(DatabaseService(config)), seeder
+    return AsyncDatabaseService(config), seeder
+
+
+async def run(args) -> dict:
+    service, seeder = database_services(args)
+    use_database_service(service)
+    app = create_app()
+    data = Dataset(args.users, args.transactions_per_user, args.seed)
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        await asyncio.to_thread(data.seed, seeder)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for name, request in ENDPOINTS.items():
+                if args.endpoint and not any(pattern in name for pattern in args.endpoint):
+                    continue
+                await measure(client, data, request, args.warmup, args.concurrency)
+                results[name] = await measure(client, data, request, args.requests, args.concurrency)
+    if args.mongo_uri:
+        seeder.client.drop_database(args.database)
+        seeder.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        if result["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {before['rps']:.0f} -> {result['rps']:.0f} req/s")
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms")
+    return regressions
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000, help="Users seeded before the run")
+    parser.add_argument("--transactions-per-user", type=int, default=100, help="Transactions seeded per user")
+    parser.add_argument("--requests", type=int, default=1000, help="Measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=100, help="Unmeasured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--mongo-uri",
+        default=os.environ.get("MONGO_URI"),
+        help="Run against this MongoDB instead of the in-memory stand-in (default: $MONGO_URI)",
+    )
+    parser.add_argument(
+        "--database", default="transaction_api_benchmark", help="Database dropped and seeded on --mongo-uri"
+    )
+    parser.add_argument(
+        "--driver", choices=["async", "sync"], default="async", help="MongoDB driver used with --mongo-uri"
+    )
+    parser.add_argument("--endpoint", action="append", help="Only run endpoints whose name contains this")
+    parser.add_argument("--output", help="Write the results to this JSON baseline")
+    parser.add_argument("--compare", help="Fail when results regress against this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    print(f"{'endpoint':<32} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, result in results.items():
+        print(
+            f"{name:<32} {result['rps']:9.0f} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f}"
+            f" {result['p99_ms']:9.2f} {result['errors']:7d}"
+        )
+
+    if args.output:
+        config = {
+            "users": args.users,
+            "transactionsPerUser": args.transactions_per_user,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "driver": args.driver if args.mongo_uri else "memory",
+        }
+        with open(args.output, "w") as file:
+            json.dump({"config": config, "results": results}, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
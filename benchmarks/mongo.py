@@ -0,0 +1,575 @@
+"""In-memory stand-in for the subset of the sync pymongo API used by the repositories.
+
+Documents live in insertion order per collection. The leading field of every declared index gets a hash
+lookup so equality and ``$in`` filters on it do not scan the collection, and unique indexes raise
+``DuplicateKeyError`` like the server does. Wrap it in ``ThreadpoolDatabaseService`` to serve the app.
+"""
+
+import operator
+from collections import defaultdict
+from collections.abc import Iterator
+from threading import RLock
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, IndexModel, InsertOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+MISSING = object()
+DEFAULT_INDEX = {"v": 2, "key": {"_id": 1}, "name": "_id_"}
+
+
+def _get(document: dict, path: str):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+
+def _set(document: dict, path: str, value) -> None:
+    *parents, field = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[field] = value
+
+
+def _unset(document: dict, path: str) -> None:
+    *parents, field = path.split(".")
+    for part in parents:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(field, None)
+
+
+def _compare(compare):
+    def condition(value, argument) -> bool:
+        if value is MISSING or value is None:
+            return False
+        try:
+            return compare(value, argument)
+        except TypeError:
+            return False
+
+    return condition
+
+
+def _equals(value, argument) -> bool:
+    if value is MISSING:
+        return argument is None
+    return value == argument or (isinstance(value, list) and argument in value)
+
+
+OPERATORS = {
+    "$eq": _equals,
+    "$ne": lambda value, argument: not _equals(value, argument),
+    "$gt": _compare(operator.gt),
+    "$gte": _compare(operator.ge),
+    "$lt": _compare(operator.lt),
+    "$lte": _compare(operator.le),
+    "$in": lambda value, argument: any(_equals(value, item) for item in argument),
+    "$nin": lambda value, argument: not any(_equals(value, item) for item in argument),
+    "$exists": lambda value, argument: (value is not MISSING) == bool(argument),
+}
+
+
+# Aggregation expression operators, applied to their resolved arguments; ``$cond`` is resolved lazily.
+EXPRESSIONS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": _compare(operator.gt),
+    "$gte": _compare(operator.ge),
+    "$lt": _compare(operator.lt),
+    "$lte": _compare(operator.le),
+    "$abs": lambda value: None if value is None else abs(value),
+}
+
+
+def _is_operator_document(condition) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(key.startswith("$") for key in condition)
+
+
+def matches(document: dict, query: dict | None) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(document, branch) for branch in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, branch) for branch in condition):
+                return False
+        elif _is_operator_document(condition):
+            value = _get(document, key)
+            if not all(OPERATORS[name](value, argument) for name, argument in condition.items()):
+                return False
+        elif not _equals(_get(document, key), condition):
+            return False
+    return True
+
+
+def project(document: dict, projection: dict | list | None) -> dict:
+    if not projection:
+        return dict(document)
+    if isinstance(projection, list):
+        projection = dict.fromkeys(projection, True)
+    include_id = projection.get("_id", True)
+    fields = {field: bool(flag) for field, flag in projection.items() if field != "_id"}
+    if any(fields.values()):
+        result = {"_id": document["_id"]} if include_id and "_id" in document else {}
+        for field in fields:
+            if (value := _get(document, field)) is not MISSING:
+                _set(result, field, value)
+        return result
+    result = dict(document)
+    for field in fields:
+        _unset(result, field)
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def _sort_key(value):
+    # Missing and null sort before every other value, as in BSON ordering.
+    return (0, 0) if value is MISSING or value is None else (1, value)
+
+
+def sort_documents(documents: list[dict], sort) -> list[dict]:
+    if isinstance(sort, dict):
+        sort = list(sort.items())
+    for field, direction in reversed(sort or []):
+        documents.sort(key=lambda document: _sort_key(_get(document, field)), reverse=direction < 0)
+    return documents
+
+
+def apply_update(document: dict, update: dict, inserting: bool = False) -> None:
+    for name, fields in update.items():
+        for field, argument in fields.items():
+            current = _get(document, field)
+            if name == "$set" or (name == "$setOnInsert" and inserting):
+                _set(document, field, argument)
+            elif name == "$unset":
+                _unset(document, field)
+            elif name == "$inc":
+                _set(document, field, (0 if current in (MISSING, None) else current) + argument)
+            elif name == "$min":
+                if current is MISSING or (current is not None and argument < current):
+                    _set(document, field, argument)
+            elif name == "$max":
+                if current in (MISSING, None) or argument > current:
+                    _set(document, field, argument)
+            elif name == "$push":
+                _set(document, field, [*([] if current is MISSING else current), argument])
+            elif name != "$setOnInsert":
+                raise NotImplementedError(f"Update operator {name} is not supported")
+
+
+def _upsert_document(query: dict) -> dict:
+    return {
+        key: value
+        for key, value in query.items()
+        if not key.startswith("$") and not _is_operator_document(value)
+    }
+
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query, projection=None, sort=None, limit=0, skip=0):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = sort
+        self._limit = limit
+        self._skip = skip
+        self._iterator = None
+
+    def sort(self, key, direction=None):
+        self._sort = [(key, direction)] if direction is not None else key
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def skip(self, skip: int):
+        self._skip = skip
+        return self
+
+    def batch_size(self, batch_size: int):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> dict:
+        if self._iterator is None:
+            self._iterator = iter(
+                self._collection._select(self._query, self._projection, self._sort, self._limit, self._skip)
+            )
+        return next(self._iterator)
+
+    def try_next(self) -> dict | None:
+        return next(self, None)
+
+    def close(self) -> None:
+        self._iterator = iter(())
+
+
+class MemoryCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self._documents: dict = {}
+        self._indexes: dict[str, dict] = {}
+        self._lookups: dict[str, defaultdict] = {}
+        self._lock = RLock()
+
+    # Indexing
+
+    def _unique_keys(self):
+        for index in self._indexes.values():
+            if index.get("unique"):
+                yield tuple(index["key"])
+
+    def _index(self, document: dict) -> None:
+        for field, lookup in self._lookups.items():
+            lookup[_sort_key(_get(document, field))][document["_id"]] = None
+
+    def _unindex(self, document: dict) -> None:
+        for field, lookup in self._lookups.items():
+            lookup[_sort_key(_get(document, field))].pop(document["_id"], None)
+
+    def _check_unique(self, document: dict) -> None:
+        if document["_id"] in self._documents and self._documents[document["_id"]] is not document:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_", 11000)
+        for fields in self._unique_keys():
+            key = {field: _get(document, field) for field in fields}
+            for other in self._candidates({fields[0]: key[fields[0]]}):
+                if other is not document and all(_get(other, field) == value for field, value in key.items()):
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.name} dup key: {key}", 11000
+                    )
+
+    def _candidates(self, query: dict | None):
+        query = query or {}
+        if isinstance(query.get("_id"), ObjectId):
+            document = self._documents.get(query["_id"])
+            return [document] if document else []
+        for field, lookup in self._lookups.items():
+            condition = query.get(field, MISSING)
+            if _is_operator_document(condition):
+                condition = condition.get("$in", [condition["$eq"]] if "$eq" in condition else MISSING)
+            else:
+                condition = [condition] if condition is not MISSING else MISSING
+            if condition is MISSING:
+                continue
+            try:
+                ids = {}
+                for value in condition:
+                    ids.update(lookup.get(_sort_key(value), {}))
+            except TypeError:
+                # Unhashable values such as embedded documents fall back to a scan.
+                continue
+            return [self._documents[_id] for _id in list(ids)]
+        return list(self._documents.values())
+
+    def _select(self, query, projection=None, sort=None, limit=0, skip=0) -> list[dict]:
+        with self._lock:
+            documents = [document for document in self._candidates(query) if matches(document, query)]
+            if sort:
+                sort_documents(documents, sort)
+            documents = documents[skip : skip + limit if limit else None]
+            return [project(document, projection) for document in documents]
+
+    def _store(self, document: dict) -> None:
+        document.setdefault("_id", ObjectId())
+        stored = dict(document)
+        self._check_unique(stored)
+        self._documents[stored["_id"]] = stored
+        self._index(stored)
+
+    def _modify(self, document: dict, update: dict, inserting: bool = False) -> bool:
+        before = dict(document)
+        self._unindex(document)
+        apply_update(document, update, inserting)
+        try:
+            self._check_unique(document)
+        except DuplicateKeyError:
+            document.clear()
+            document.update(before)
+            raise
+        finally:
+            self._index(document)
+        return document != before
+
+    # Index management
+
+    def create_indexes(self, indexes: list[IndexModel], **kwargs) -> list[str]:
+        with self._lock:
+            for index in indexes:
+                document = {"v": 2, **index.document, "key": dict(index.document["key"])}
+                self._indexes[document["name"]] = document
+                leading = next(iter(document["key"]))
+                if leading not in self._lookups:
+                    self._lookups[leading] = defaultdict(dict)
+                    for stored in self._documents.values():
+                        self._lookups[leading][_sort_key(_get(stored, leading))][stored["_id"]] = None
+            return [index.document["name"] for index in indexes]
+
+    def list_indexes(self, **kwargs) -> Iterator[dict]:
+        return iter([DEFAULT_INDEX, *self._indexes.values()])
+
+    def drop_index(self, name: str, **kwargs) -> None:
+        with self._lock:
+            self._indexes.pop(name, None)
+
+    # Reads
+
+    def find(self, filter=None, projection=None, sort=None, limit=0, skip=0, **kwargs) -> MemoryCursor:
+        return MemoryCursor(self, filter, projection, sort, limit, skip)
+
+    def find_one(self, filter=None, projection=None, sort=None, **kwargs) -> dict | None:
+        documents = self._select(filter, projection, sort, limit=1)
+        return documents[0] if documents else None
+
+    def count_documents(self, filter, **kwargs) -> int:
+        return len(self._select(filter, {"_id": True}))
+
+    def aggregate(self, pipeline: list[dict], **kwargs) -> Iterator[dict]:
+        documents = self._select({})
+        for stage in pipeline:
+            ((name, argument),) = stage.items()
+            if name == "$match":
+                documents = [document for document in documents if matches(document, argument)]
+            elif name == "$sort":
+                documents = sort_documents(documents, argument)
+            elif name == "$limit":
+                documents = documents[:argument]
+            elif name == "$group":
+                documents = _group(documents, argument)
+            else:
+                raise NotImplementedError(f"Aggregation stage {name} is not supported")
+        return iter(documents)
+
+    # Writes
+
+    def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        with self._lock:
+            self._store(document)
+        return InsertOneResult(document["_id"], True)
+
+    def insert_many(self, documents: list[dict], ordered: bool = True, **kwargs) -> InsertManyResult:
+        errors = []
+        with self._lock:
+            for index, document in enumerate(documents):
+                try:
+                    self._store(document)
+                except DuplicateKeyError as exc:
+                    errors.append({"index": index, "code": 11000, "errmsg": str(exc), "op": document})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError(
+                {"writeErrors": errors, "nInserted": len(documents) - len(errors), "upserted": []}
+            )
+        return InsertManyResult([document["_id"] for document in documents], True)
+
+    def _update(self, filter: dict, update: dict, upsert: bool, many: bool) -> dict:
+        with self._lock:
+            matched = [document for document in self._candidates(filter) if matches(document, filter)]
+            if not many:
+                matched = matched[:1]
+            if not matched and upsert:
+                document = _upsert_document(filter)
+                apply_update(document, update, inserting=True)
+                self._store(document)
+                return {"n": 1, "nModified": 0, "upserted": document["_id"]}
+            modified = sum(self._modify(document, update) for document in matched)
+            return {"n": len(matched), "nModified": modified}
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, many=False), True)
+
+    def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, many=True), True)
+
+    def find_one_and_update(
+        self,
+        filter: dict,
+        update: dict,
+        projection=None,
+        sort=None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+        **kwargs,
+    ) -> dict | None:
+        with self._lock:
+            matched = sort_documents(
+                [document for document in self._candidates(filter) if matches(document, filter)], sort
+            )
+            if not matched:
+                if not upsert:
+                    return None
+                document = _upsert_document(filter)
+                apply_update(document, update, inserting=True)
+                self._store(document)
+                return project(self._documents[document["_id"]], projection) if return_document else None
+            before = project(matched[0], projection)
+            self._modify(matched[0], update)
+            return project(matched[0], projection) if return_document else before
+
+    def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, many=False)}, True)
+
+    def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, many=True)}, True)
+
+    def _delete(self, filter: dict, many: bool) -> int:
+        with self._lock:
+            matched = [document for document in self._candidates(filter) if matches(document, filter)]
+            for document in matched if many else matched[:1]:
+                self._unindex(document)
+                del self._documents[document["_id"]]
+            return len(matched) if many else min(len(matched), 1)
+
+    def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result = {
+            "nInserted": 0,
+            "nUpserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "nRemoved": 0,
+            "upserted": [],
+        }
+        errors = []
+        with self._lock:
+            for index, request in enumerate(requests):
+                try:
+                    if isinstance(request, InsertOne):
+                        self._store(request._doc)
+                        result["nInserted"] += 1
+                    elif isinstance(request, (UpdateOne, UpdateMany)):
+                        outcome = self._update(
+                            request._filter, request._doc, request._upsert, isinstance(request, UpdateMany)
+                        )
+                        if "upserted" in outcome:
+                            result["nUpserted"] += 1
+                            result["upserted"].append({"index": index, "_id": outcome["upserted"]})
+                        else:
+                            result["nMatched"] += outcome["n"]
+                            result["nModified"] += outcome["nModified"]
+                    elif isinstance(request, (DeleteOne, DeleteMany)):
+                        result["nRemoved"] += self._delete(request._filter, isinstance(request, DeleteMany))
+                    else:
+                        raise NotImplementedError(f"Bulk operation {type(request).__name__} is not supported")
+                except DuplicateKeyError as exc:
+                    errors.append({"index": index, "code": 11000, "errmsg": str(exc)})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError({**result, "writeErrors": errors})
+        return BulkWriteResult(result, True)
+
+
+def _group(documents: list[dict], spec: dict) -> list[dict]:
+    def resolve(document, expression):
+        if isinstance(expression, str) and expression.startswith("$"):
+            value = _get(document, expression[1:])
+            return None if value is MISSING else value
+        if _is_operator_document(expression):
+            ((name, argument),) = expression.items()
+            if name == "$literal":
+                return argument
+            if name == "$cond":
+                if isinstance(argument, dict):
+                    argument = [argument["if"], argument["then"], argument["else"]]
+                condition, then, otherwise = argument
+                return resolve(document, then if resolve(document, condition) else otherwise)
+            if name not in EXPRESSIONS:
+                raise NotImplementedError(f"Expression operator {name} is not supported")
+            arguments = argument if isinstance(argument, list) else [argument]
+            return EXPRESSIONS[name](*(resolve(document, value) for value in arguments))
+        if isinstance(expression, dict):
+            return {key: resolve(document, value) for key, value in expression.items()}
+        return expression
+
+    accumulators = {
+        "$sum": lambda values: sum(value for value in values if isinstance(value, (int, float))),
+        "$min": lambda values: min((value for value in values if value is not None), default=None),
+        "$max": lambda values: max((value for value in values if value is not None), default=None),
+        "$first": lambda values: values[0],
+        "$last": lambda values: values[-1],
+        "$push": list,
+    }
+    groups = {}
+    for document in documents:
+        key = resolve(document, spec["_id"])
+        groups.setdefault(repr(key), (key, []))[1].append(document)
+
+    results = []
+    for key, members in groups.values():
+        result = {"_id": key}
+        for field, expression in spec.items():
+            if field == "_id":
+                continue
+            ((name, argument),) = expression.items()
+            result[field] = accumulators[name]([resolve(document, argument) for document in members])
+        results.append(result)
+    return results
+
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: dict[str, MemoryCollection] = {}
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    __getitem__ = get_collection
+
+    def list_collection_names(self, **kwargs) -> list[str]:
+        return list(self._collections)
+
+    def drop_collection(self, name: str, **kwargs) -> None:
+        self._collections.pop(name, None)
+
+    def command(self, command, *args, **kwargs) -> dict:
+        if command == "ping":
+            return {"ok": 1.0}
+        raise NotImplementedError(f"Command {command!r} is not supported")
+
+
+class MemoryClient:
+    def __init__(self):
+        self._databases: dict[str, MemoryDatabase] = {}
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name)
+        return self._databases[name]
+
+    __getitem__ = get_database
+
+    def start_session(self, **kwargs):
+        raise NotImplementedError("The in-memory stand-in does not support sessions")
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryDatabaseService:
+    """Drop-in for ``DatabaseService``; wrap it in ``ThreadpoolDatabaseService`` to serve the app."""
+
+    def __init__(self, name: str = "transaction_api"):
+        self.client = MemoryClient()
+        self.database = self.client.get_database(name)
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {"driver": "memory", "connected": True, "pool": {}}
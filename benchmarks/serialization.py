@@ -0,0 +1,62 @@
+"""Compare the Pydantic response path of GET /transactions with the raw serialization mode."""
+
+import json
+import timeit
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+from transaction_api.api.raw import TRANSACTION_FIELDS, RawPageResponse
+from transaction_api.models.page import Page
+from transaction_api.models.transaction import TransactionOut
+
+
+def make_documents(rows: int) -> list[dict]:
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "transaction_id": f"txn{index:08d}",
+            "user_id": "user1",
+            "amount": index * 1.5,
+            "timestamp": start + timedelta(seconds=index),
+        }
+        for index in range(rows)
+    ]
+
+
+def model_path(documents: list[dict], adapter: TypeAdapter) -> bytes:
+    # Mirrors the repository building models and FastAPI re-validating and encoding the response model.
+    page = Page[TransactionOut](items=[TransactionOut(**document) for document in documents])
+    content = adapter.validate_python(page.model_dump(by_alias=True))
+    return json.dumps(adapter.dump_python(content, mode="json", by_alias=True)).encode()
+
+
+def raw_path(documents: list[dict]) -> bytes:
+    return RawPageResponse(documents, TRANSACTION_FIELDS, None).body
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000, help="Transactions per page")
+    parser.add_argument("--repeat", type=int, default=50, help="Pages rendered per measurement")
+    args = parser.parse_args()
+
+    documents = make_documents(args.rows)
+    adapter = TypeAdapter(Page[TransactionOut])
+    assert json.loads(model_path(documents, adapter)) == json.loads(raw_path(documents))
+
+    results = {
+        "model": min(timeit.repeat(lambda: model_path(documents, adapter), number=args.repeat, repeat=5)),
+        "raw": min(timeit.repeat(lambda: raw_path(documents), number=args.repeat, repeat=5)),
+    }
+    for name, elapsed in results.items():
+        per_page = elapsed / args.repeat * 1000
+        print(f"{name:>5}: {per_page:8.3f} ms/page  {args.rows * args.repeat / elapsed:12.0f} rows/s")
+    print(f"speedup: {results['model'] / results['raw']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
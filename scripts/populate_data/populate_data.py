@@ -1,71 +1,188 @@
-from datetime import datetime
+"""
+Generate users and transactions for load testing.
+
+Transactions per user follow a Zipf distribution (a few hot users own most of the history), timestamps
+follow a diurnal profile, and every user is generated from its own seeded random stream, so the data only
+depends on the arguments and not on the number of worker processes. Users are inserted with balances and
+counters consistent with their transactions; debits never take a balance below zero.
+"""
+
+import asyncio
+import os
 import random
-import string
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+from datetime import datetime, timedelta
+from multiprocessing import Pool
 
+from transaction_api import initialize
+from transaction_api.models.checkpoint import BalanceCheckpoint
+from transaction_api.models.rollup import TransactionRollup
+from transaction_api.models.sketch import AmountSketchDocument
 from transaction_api.models.transaction import Transaction
 from transaction_api.models.user import User
-from transaction_api.services.database import db_service
-
-
-def generate_user_id():
-    return "".join(random.choices(string.ascii_lowercase + string.digits, k=8))
-
-
-user_data = [
-    {
-        "user_id": "user1",
-        "name": "Alice Smith",
-        "email": "alice@example.com",
-        "created_at": datetime.now().isoformat(),
-        "balance": 100.0,
-    },
-    {
-        "user_id": "user2",
-        "name": "Bob Johnson",
-        "email": "bob@example.com",
-        "created_at": datetime.now().isoformat(),
-        "balance": 150.0,
-    },
-    {
-        "user_id": "user3",
-        "name": "Charlie Brown",
-        "email": "charlie@example.com",
-        "created_at": datetime.now().isoformat(),
-        "balance": 200.0,
-    },
-]
-
-
-def generate_transaction_data(user_id):
-    return {
-        "user_id": user_id,
-        "transaction_id": "".join(random.choices(string.ascii_lowercase + string.digits, k=12)),
-        "amount": random.uniform(5.0, 500.0),
-        "timestamp": datetime.now().isoformat(),
+from transaction_api.repository import partitions as partition_repo
+from transaction_api.repository import rollups as rollup_repo
+from transaction_api.repository import sketches as sketch_repo
+from transaction_api.services.database import DatabaseService, db_service
+
+# Relative transaction volume per UTC hour: quiet nights, a morning ramp and an evening peak.
+HOURLY_WEIGHTS = [2, 1, 1, 1, 1, 2, 4, 7, 9, 10, 10, 11, 12, 11, 10, 10, 11, 12, 13, 12, 10, 8, 5, 3]
+DEBIT_PROBABILITY = 0.4
+TASKS_PER_WORKER = 8
+
+# Each worker process opens its own connection pool on first use.
+loader = DatabaseService()
+
+
+def user_id(index: int) -> str:
+    return f"user{index:08d}"
+
+
+def transaction_counts(users: int, transactions: int, exponent: float, seed: int) -> list[int]:
+    """Splits ``transactions`` over the users with Zipf weights; the hot users are spread over the id range."""
+    ranks = list(range(1, users + 1))
+    random.Random(seed).shuffle(ranks)
+    weights = [rank**-exponent for rank in ranks]
+    scale = transactions / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    # Hand the remainder to the largest fractional parts so the total is exact.
+    remainders = sorted(range(users), key=lambda index: counts[index] - weights[index] * scale)
+    for index in remainders[: transactions - sum(counts)]:
+        counts[index] += 1
+    return counts
+
+
+def diurnal_timestamp(rng: random.Random, start: datetime, days: int) -> datetime:
+    hour = rng.choices(range(24), weights=HOURLY_WEIGHTS)[0]
+    return start + timedelta(
+        days=rng.randrange(days), hours=hour, seconds=rng.randrange(3600), milliseconds=rng.randrange(1000)
+    )
+
+
+def generate_user(index: int, count: int, seed: int, start: datetime, days: int) -> tuple[dict, list[dict]]:
+    rng = random.Random(f"{seed}:{index}")
+    user = user_id(index)
+    timestamps = sorted(diurnal_timestamp(rng, start, days) for _ in range(count))
+    transactions = []
+    balance = total_credits = total_debits = 0.0
+    for sequence, timestamp in enumerate(timestamps):
+        amount = round(rng.lognormvariate(3.5, 1.2), 2) or 0.01
+        if balance >= 0.01 and rng.random() < DEBIT_PROBABILITY:
+            amount = -min(amount, round(balance, 2))
+            total_debits -= amount
+        else:
+            total_credits += amount
+        balance = round(balance + amount, 2)
+        transactions.append(
+            {
+                "transaction_id": f"{user}-{sequence:08d}",
+                "user_id": user,
+                "amount": amount,
+                "timestamp": timestamp,
+            }
+        )
+
+    document = {
+        "user_id": user,
+        "name": f"Load Test {index}",
+        "email": f"{user}@example.com",
+        "created_at": (timestamps[0] if timestamps else start) - timedelta(days=rng.randrange(1, 30)),
+        "balance": balance,
+        "transaction_count": count,
+        "total_credits": round(total_credits, 2),
+        "total_debits": round(total_debits, 2),
     }
+    if timestamps:
+        document["first_transaction_at"] = timestamps[0]
+        document["last_transaction_at"] = timestamps[-1]
+    return document, transactions
+
+
+def insert_transactions(rows: list[dict]) -> None:
+    by_partition = defaultdict(list)
+    for row in rows:
+        by_partition[partition_repo.partition_name(row["timestamp"])].append(row)
+    for name, partition_rows in by_partition.items():
+        loader.database.get_collection(name).insert_many(partition_rows, ordered=False)
+
+
+def insert_users(task: tuple[int, list[int], int, datetime, int, int]) -> tuple[int, int]:
+    first_index, counts, seed, start, days, batch_size = task
+    users = loader.database.get_collection(User.collection_name)
+    user_batch, transaction_batch = [], []
+    for index, count in enumerate(counts, first_index):
+        document, rows = generate_user(index, count, seed, start, days)
+        user_batch.append(document)
+        transaction_batch.extend(rows)
+        if len(transaction_batch) >= batch_size:
+            insert_transactions(transaction_batch)
+            transaction_batch = []
+    if transaction_batch:
+        insert_transactions(transaction_batch)
+    # Users go in last, so a failed task never leaves a balance without its transactions.
+    for offset in range(0, len(user_batch), batch_size):
+        users.insert_many(user_batch[offset : offset + batch_size], ordered=False)
+    return len(user_batch), sum(counts)
+
 
+async def finish(rebuild: bool) -> None:
+    await db_service.connect()
+    # Building the indexes once after the load is much cheaper than maintaining them on every insert.
+    await initialize.initialize_indexes()
+    if rebuild:
+        print(f"Rebuilt {await rollup_repo.rebuild_rollups()} timeseries buckets")
+        print(f"Rebuilt {await sketch_repo.rebuild_sketches()} amount sketches")
+    await db_service.close()
 
-def insert_users():
-    print("Inserting users...")
-    users_collection = db_service.database.get_collection(User.collection_name)
-    for user in user_data:
-        if users_collection.find_one({"user_id": user["user_id"]}) is None:
-            users_collection.insert_one(user)
-            print(f"Inserted user: {user['user_id']}")
 
+def main(argv: list[str] | None = None) -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=100_000, help="Total transactions over all users")
+    parser.add_argument("--zipf-exponent", type=float, default=1.1, help="Skew of transactions per user")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=datetime(2024, 1, 1))
+    parser.add_argument("--days", type=int, default=365, help="Days of history after --start")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Documents per insert_many")
+    parser.add_argument("--drop", action="store_true", help="Drop the existing data before generating")
+    parser.add_argument(
+        "--skip-rebuild",
+        action="store_true",
+        help="Do not rebuild the timeseries rollups and amount sketches",
+    )
+    args = parser.parse_args(argv)
 
-def insert_transactions():
-    print("Inserting transactions...")
-    for user in user_data:
-        for _ in range(random.randint(1, 5)):
-            transaction_data = generate_transaction_data(user["user_id"])
-            db_service.database.get_collection(Transaction.collection_name).insert_one(transaction_data)
-            print(f"Inserted transaction for {user['user_id']} with ID: {transaction_data['transaction_id']}")
+    if args.drop:
+        for model in (User, TransactionRollup, BalanceCheckpoint, AmountSketchDocument):
+            loader.database.drop_collection(model.collection_name)
+        for name in loader.database.list_collection_names():
+            if name == Transaction.collection_name or partition_repo.PARTITION_PATTERN.match(name):
+                loader.database.drop_collection(name)
+        loader.close()
 
+    started = time.perf_counter()
+    counts = transaction_counts(args.users, args.transactions, args.zipf_exponent, args.seed)
+    workers = args.workers or os.cpu_count()
+    with Pool(workers) as pool:
+        task_size = max(1, args.users // (workers * TASKS_PER_WORKER))
+        tasks = [
+            (first, counts[first : first + task_size], args.seed, args.start, args.days, args.batch_size)
+            for first in range(0, args.users, task_size)
+        ]
+        users = transactions = 0
+        for inserted_users, inserted_transactions in pool.imap_unordered(insert_users, tasks):
+            users += inserted_users
+            transactions += inserted_transactions
+            elapsed = time.perf_counter() - started
+            print(
+                f"{users}/{args.users} users, {transactions} transactions ({transactions / elapsed:,.0f}/s)"
+            )
 
-def main():
-    insert_users()
-    insert_transactions()
+    asyncio.run(finish(rebuild=not args.skip_rebuild))
+    print(f"Done in {time.perf_counter() - started:.1f}s")
 
 
 if __name__ == "__main__":
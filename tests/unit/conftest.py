@@ -1,8 +1,13 @@
+from collections import defaultdict
+
 import pytest
 
 from fastapi.testclient import TestClient
 from transaction_api.models.user import User
 from transaction_api.models.transaction import Transaction
+from transaction_api.repository import archive, partitions
+from transaction_api.services.cache import account_summary_cache, user_cache
+from transaction_api.services.database import ThreadpoolDatabaseService
 
 from app import create_app
 
@@ -11,14 +16,27 @@ class FakeDb:
     def __init__(self, mocker):
         self.users_collection = mocker.MagicMock()
         self.transactions_collection = mocker.MagicMock()
+        self.transactions_collection.find_one.return_value = None
         self.database = self
         self.client = mocker.MagicMock()
+        self.collections = defaultdict(mocker.MagicMock)
 
     def get_collection(self, name):
         if name == User.collection_name:
             return self.users_collection
         if name == Transaction.collection_name:
             return self.transactions_collection
+        return self.collections[name]
+
+
+@pytest.fixture(scope="function", autouse=True)
+def clear_caches():
+    yield
+    user_cache.clear()
+    account_summary_cache.clear()
+    partitions._partitions = None
+    partitions._indexed.clear()
+    archive._markers = None
 
 
 @pytest.fixture(scope="function")
@@ -27,10 +45,25 @@ def fake_db(mocker):
 
 
 @pytest.fixture(scope="function")
-def client(mocker, fake_db):
-    mocker.patch("transaction_api.repository.users.db_service", fake_db)
-    mocker.patch("transaction_api.repository.transactions.db_service", fake_db)
-    mocker.patch("transaction_api.repository.statistics.db_service", fake_db)
+def db_service(mocker, fake_db):
+    db_service = ThreadpoolDatabaseService(fake_db)
+    mocker.patch("transaction_api.repository.users.db_service", db_service)
+    mocker.patch("transaction_api.repository.transactions.db_service", db_service)
+    mocker.patch("transaction_api.repository.statistics.db_service", db_service)
+    mocker.patch("transaction_api.repository.rollups.db_service", db_service)
+    mocker.patch("transaction_api.repository.checkpoints.db_service", db_service)
+    mocker.patch("transaction_api.repository.sketches.db_service", db_service)
+    mocker.patch("transaction_api.repository.purges.db_service", db_service)
+    mocker.patch("transaction_api.repository.partitions.db_service", db_service)
+    mocker.patch("transaction_api.repository.archive.db_service", db_service)
+    mocker.patch("transaction_api.repository.feed.db_service", db_service)
+    mocker.patch("transaction_api.initialize.db_service", db_service)
+    mocker.patch("transaction_api.diagnostics.db_service", db_service)
+    return db_service
+
+
+@pytest.fixture(scope="function")
+def client(mocker, db_service):
     mocker.patch("app.initialize.initialize_indexes")
     app = create_app()
     yield TestClient(app)
@@ -0,0 +1,122 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from transaction_api.models.transaction import Transaction
+from transaction_api.repository import archive
+
+pytest.importorskip("pyarrow")
+
+
+def _transaction(transaction_id: str, user_id: str, amount: float, timestamp: datetime) -> dict:
+    return {
+        "_id": ObjectId(),
+        "transaction_id": transaction_id,
+        "user_id": user_id,
+        "amount": amount,
+        "timestamp": timestamp,
+    }
+
+
+@pytest.fixture
+def archive_path(mocker, tmp_path):
+    mocker.patch.object(archive.settings, "archive_path", str(tmp_path))
+    mocker.patch.object(archive.settings, "cache_ttl_seconds", 0)
+    return tmp_path
+
+
+@pytest.mark.asyncio
+async def test_archive_transactions(db_service, fake_db, archive_path):
+    """
+    Test that old months are frozen, written to per-bucket files, the watermark advanced and the archived
+    rows deleted from MongoDB.
+    """
+    december = [
+        _transaction("txn1", "user1", 100.0, datetime(2023, 12, 1)),
+        _transaction("txn2", "user1", -40.0, datetime(2023, 12, 5)),
+        _transaction("txn3", "user2", 7.5, datetime(2023, 12, 9)),
+    ]
+    transactions = fake_db.database.get_collection(Transaction.collection_name)
+    transactions.aggregate.return_value = [{"_id": None, "timestamp": datetime(2023, 12, 1)}]
+    transactions.find.return_value = december
+
+    assert await archive.archive_transactions(datetime(2024, 1, 15)) == 3
+
+    assert (archive_path / "_frozen").read_text() == "2024-01-01T00:00:00"
+    assert (archive_path / "_watermark").read_text() == "2024-01-01T00:00:00"
+    assert await archive.frozen_before() == datetime(2024, 1, 1)
+    assert (archive_path / "month=2023-12" / f"bucket={archive.user_bucket('user1'):03d}").is_dir()
+    transactions.find.assert_called_once()
+    deleted = [
+        object_id
+        for call in transactions.delete_many.call_args_list
+        for object_id in call.args[0]["_id"]["$in"]
+    ]
+    assert sorted(deleted) == sorted(row["_id"] for row in december)
+
+    rows = await archive.find_transactions("user1", order="desc")
+    assert [row["transaction_id"] for row in rows] == ["txn2", "txn1"]
+    assert rows[0]["_id"] == december[1]["_id"]
+    after = await archive.find_transactions(
+        "user1", after=[rows[0]["timestamp"], rows[0]["_id"]], order="desc"
+    )
+    assert [row["transaction_id"] for row in after] == ["txn1"]
+    assert await archive.find_transactions("user1", start=datetime(2024, 1, 1)) == []
+    exported = [row async for row in archive.iter_transactions("user1")]
+    assert [row["transaction_id"] for row in exported] == ["txn1", "txn2"]
+    assert exported[1]["_id"] == december[1]["_id"]
+
+    assert await archive.summarize("user1", datetime(2023, 12, 1), datetime(2024, 2, 1)) == {
+        "balance": -40.0,
+        "transaction_count": 1,
+        "total_credits": 0.0,
+        "total_debits": 40.0,
+        "first_transaction_at": datetime(2023, 12, 5),
+        "last_transaction_at": datetime(2023, 12, 5),
+    }
+    assert sorted(
+        [summary async for summary in archive.user_summaries()], key=lambda summary: summary["_id"]
+    ) == [
+        {
+            "_id": "user1",
+            "transaction_count": 2,
+            "total_credits": 100.0,
+            "total_debits": 40.0,
+            "first_transaction_at": datetime(2023, 12, 1),
+            "last_transaction_at": datetime(2023, 12, 5),
+        },
+        {
+            "_id": "user2",
+            "transaction_count": 1,
+            "total_credits": 7.5,
+            "total_debits": 0.0,
+            "first_transaction_at": datetime(2023, 12, 9),
+            "last_transaction_at": datetime(2023, 12, 9),
+        },
+    ]
+
+    assert await archive.purge_user("user1", ObjectId()) == 2
+    assert await archive.find_transactions("user1") == []
+    assert [row["transaction_id"] for row in await archive.find_transactions("user2")] == ["txn3"]
+
+
+@pytest.mark.asyncio
+async def test_archive_transactions_completes_interrupted_deletes(db_service, fake_db, archive_path):
+    """
+    Test that the last month behind the watermark is only deleted from MongoDB, not archived again, and
+    that only the rows of its files are deleted.
+    """
+    archived = _transaction("txn1", "user1", 100.0, datetime(2023, 12, 20))
+    staging, writers = archive_path / ".staging-2023-12", {}
+    archive._write_batch(staging, writers, [archived])
+    archive._publish(staging, archive_path / "month=2023-12", writers)
+    (archive_path / "_watermark").write_text("2024-01-01T00:00:00")
+    transactions = fake_db.database.get_collection(Transaction.collection_name)
+
+    assert await archive.archive_transactions(datetime(2024, 1, 1)) == 0
+
+    transactions.aggregate.assert_not_called()
+    transactions.find.assert_not_called()
+    transactions.delete_many.assert_called_once_with({"_id": {"$in": [archived["_id"]]}})
+    assert [path.name for path in archive_path.glob("month=*")] == ["month=2023-12"]
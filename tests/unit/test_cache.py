@@ -0,0 +1,59 @@
+from transaction_api.services import cache
+from transaction_api.services.cache import TTLCache
+
+
+def test_cache_evicts_least_recently_used():
+    """Test that the least recently used entry is evicted once the cache is full."""
+    users = TTLCache(max_entries=2, ttl=60)
+    for key in ("a", "b"):
+        users.set(key, key.upper(), users.reserve(key))
+    users.get("a")
+    users.set("c", "C", users.reserve("c"))
+
+    assert users.get("b") is None
+    assert users.get("a") == "A"
+    assert users.stats() == {"size": 2, "maxEntries": 2, "hits": 2, "misses": 1, "evictions": 1}
+
+
+def test_cache_expires_entries(mocker):
+    """Test that entries are not served after their time to live."""
+    clock = mocker.patch.object(cache, "monotonic", return_value=100.0)
+    users = TTLCache(max_entries=10, ttl=5)
+    users.set("a", "A", users.reserve("a"))
+
+    clock.return_value = 106.0
+
+    assert users.get("a") is None
+    assert users.stats()["size"] == 0
+
+
+def test_cache_ignores_values_read_before_an_invalidation():
+    """Test that a value read before a concurrent write is not cached."""
+    users = TTLCache(max_entries=10, ttl=60)
+    token = users.reserve("a")
+    users.invalidate("a")
+    users.set("a", "stale", token)
+
+    assert users.get("a") is None
+
+
+def test_cache_disabled_with_zero_ttl():
+    """Test that a zero time to live disables caching."""
+    users = TTLCache(max_entries=10, ttl=0)
+    users.set("a", "A", users.reserve("a"))
+
+    assert users.get("a") is None
+
+
+def test_cache_release_only_drops_its_own_reservation():
+    """Test that releasing an outdated token keeps the newer reservation of the same key."""
+    users = TTLCache(max_entries=10, ttl=60)
+    first = users.reserve("a")
+    second = users.reserve("a")
+
+    users.release("a", first)
+    users.set("a", "A", second)
+    assert users.get("a") == "A"
+
+    users.release("b", users.reserve("b"))
+    assert users._pending == {}
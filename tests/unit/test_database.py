@@ -0,0 +1,118 @@
+from pymongo import MongoClient, monitoring
+
+from transaction_api.services import database
+from transaction_api.services.database import (
+    AsyncDatabaseService,
+    DatabaseService,
+    ThreadpoolDatabaseService,
+    client_options,
+)
+from transaction_api.services.monitoring import PoolStatistics
+from transaction_api.settings import Settings
+
+
+def test_create_database_service_async(mocker):
+    """Test that the async driver is used by default."""
+    mocker.patch.object(database.settings, "database_driver", "async")
+
+    assert isinstance(database.create_database_service(), AsyncDatabaseService)
+
+
+def test_create_database_service_sync(mocker):
+    """Test that the sync driver is wrapped for use from async repositories."""
+    mocker.patch.object(database.settings, "database_driver", "sync")
+
+    assert isinstance(database.create_database_service(), ThreadpoolDatabaseService)
+
+
+def test_client_options_from_settings():
+    """Test that pool, timeout, compression and concern settings are passed to the client."""
+    config = Settings(
+        mongo_db_host="mongo",
+        mongo_max_pool_size=50,
+        mongo_min_pool_size=5,
+        mongo_wait_queue_timeout_ms=200,
+        mongo_compressors="zstd,snappy,zlib",
+        mongo_write_concern="1",
+        mongo_read_concern="majority",
+    )
+
+    options = client_options(config)
+
+    assert options["host"] == "mongodb://mongo:27017"
+    assert options["maxPoolSize"] == 50
+    assert options["minPoolSize"] == 5
+    assert options["waitQueueTimeoutMS"] == 200
+    assert options["compressors"] == "zstd,snappy,zlib"
+    assert options["w"] == 1
+    assert options["readConcernLevel"] == "majority"
+    assert "socketTimeoutMS" not in options
+    assert "readPreference" not in options
+
+
+def test_client_options_prefers_uri():
+    """Test that a full connection string overrides host and port."""
+    options = client_options(
+        Settings(mongo_db_uri="mongodb://a:1,b:2/?replicaSet=rs0", mongo_write_concern="majority")
+    )
+
+    assert options["host"] == "mongodb://a:1,b:2/?replicaSet=rs0"
+    assert options["w"] == "majority"
+
+
+def test_database_service_connects_lazily(mocker):
+    """Test that no client is created until the database is first used."""
+    client_class = mocker.patch.object(DatabaseService, "client_class", mocker.MagicMock(spec=MongoClient))
+    service = DatabaseService(Settings(mongo_db_name="test_db"))
+
+    assert service.stats()["connected"] is False
+    client_class.assert_not_called()
+
+    assert service.database is service.database
+    client_class.assert_called_once()
+    assert client_class.call_args.kwargs["event_listeners"] == [
+        service.pool_statistics,
+        service.command_monitor,
+    ]
+    client_class.return_value.get_database.assert_called_once_with("test_db")
+
+    service.close()
+
+    client_class.return_value.close.assert_called_once()
+    assert service.stats()["connected"] is False
+
+
+def test_pool_statistics():
+    """Test that pool events are folded into utilization and wait-queue statistics."""
+    address = ("localhost", 27017)
+    pool = PoolStatistics()
+    pool.connection_created(monitoring.ConnectionCreatedEvent(address, 1))
+    pool.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+    pool.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+    pool.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, 1, 0.004))
+    pool.connection_check_out_failed(
+        monitoring.ConnectionCheckOutFailedEvent(
+            address, monitoring.ConnectionCheckOutFailedReason.TIMEOUT, 0.2
+        )
+    )
+
+    stats = pool.stats(max_pool_size=4)
+
+    assert stats["openConnections"] == 1
+    assert stats["checkedOut"] == 1
+    assert stats["utilization"] == 0.25
+    assert stats["waiting"] == 0
+    assert stats["maxWaiting"] == 2
+    assert stats["waitQueueTimeouts"] == 1
+    assert stats["maxWaitMs"] == 4.0
+
+
+def test_get_database_stats(mocker, client):
+    """Test that the pool statistics are exposed through the monitoring endpoint."""
+    mocker.patch("transaction_api.api.monitoring.db_service", DatabaseService(Settings()))
+
+    response = client.get("/monitoring/database")
+
+    assert response.status_code == 200
+    assert response.json()["connected"] is False
+    assert response.json()["pool"]["maxPoolSize"] == 100
@@ -0,0 +1,35 @@
+import pytest
+
+from transaction_api import diagnostics
+from transaction_api.models.transaction import Transaction
+
+
+@pytest.mark.asyncio
+async def test_explain_repository_queries_flags_scans_and_sorts(mocker, db_service, fake_db):
+    """Test that collection scans and in-memory sorts are reported as problems."""
+    plans = {
+        "users.get_all_users": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}},
+        "transactions.get_all_transactions": {
+            "stage": "PROJECTION_COVERED",
+            "inputStage": {"stage": "IXSCAN"},
+        },
+    }
+    queries = {name: {"find": name} for name in plans}
+    mocker.patch.object(diagnostics, "repository_queries", return_value=queries)
+    fake_db.command = mocker.MagicMock(
+        side_effect=lambda command: {"queryPlanner": {"winningPlan": plans[command["explain"]["find"]]}}
+    )
+
+    result = {plan.name: plan for plan in await diagnostics.explain_repository_queries()}
+
+    assert result["users.get_all_users"].problems == ["COLLSCAN", "SORT"]
+    assert result["transactions.get_all_transactions"].stages == ["PROJECTION_COVERED", "IXSCAN"]
+    assert result["transactions.get_all_transactions"].problems == []
+
+
+def test_repository_queries_cover_the_listing_projection():
+    """Test that the transaction listing only projects fields of the compound index."""
+    query = diagnostics.repository_queries()["transactions.get_all_transactions"]
+    indexed = {field for field, _ in Transaction.indexes[1].document["key"].items()}
+
+    assert {field for field, included in query["projection"].items() if included} <= indexed
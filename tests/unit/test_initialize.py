@@ -0,0 +1,87 @@
+import pytest
+from pymongo.errors import OperationFailure
+
+from transaction_api import initialize
+from transaction_api.models.transaction import Transaction
+from transaction_api.models.user import User
+
+
+def _index_info(index):
+    return {"v": 2, **index.document}
+
+
+@pytest.mark.asyncio
+async def test_reconcile_indexes_replaces_outdated_indexes(db_service, fake_db):
+    """Test that undeclared indexes are dropped and declared ones are created."""
+    collection = fake_db.database.get_collection(Transaction.collection_name)
+    collection.list_indexes.return_value = [
+        {"v": 2, "name": "_id_", "key": {"_id": 1}},
+        {"v": 2, "name": "timestamp_1", "key": {"timestamp": 1}},
+        {"v": 2, "name": "user_id_1", "key": {"user_id": 1}},
+    ]
+
+    dropped, created = await initialize.reconcile_indexes(Transaction.collection_name, Transaction.indexes)
+
+    assert dropped == ["timestamp_1", "user_id_1"]
+    assert created == [index.document["name"] for index in Transaction.indexes]
+    assert [call.args[0] for call in collection.drop_index.call_args_list] == dropped
+    collection.create_indexes.assert_called_once_with(Transaction.indexes)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_indexes_recreates_index_with_changed_options(db_service, fake_db):
+    """Test that an index whose options differ from the declaration is rebuilt."""
+    collection = fake_db.database.get_collection(User.collection_name)
+    collection.list_indexes.return_value = [
+        {"v": 2, "name": "_id_", "key": {"_id": 1}},
+        {"v": 2, "name": "user_id_1", "key": {"user_id": 1}},
+    ]
+
+    dropped, created = await initialize.reconcile_indexes(User.collection_name, User.indexes)
+
+    assert dropped == ["user_id_1"]
+    assert created == ["user_id_1"]
+    collection.create_indexes.assert_called_once_with(User.indexes)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_indexes_is_idempotent(db_service, fake_db):
+    """Test that nothing is changed when the declared indexes already exist."""
+    collection = fake_db.database.get_collection(Transaction.collection_name)
+    collection.list_indexes.return_value = [
+        {"v": 2, "name": "_id_", "key": {"_id": 1}},
+        *(_index_info(index) for index in Transaction.indexes),
+    ]
+
+    assert await initialize.reconcile_indexes(Transaction.collection_name, Transaction.indexes) == ([], [])
+
+    collection.drop_index.assert_not_called()
+    collection.create_indexes.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_reconcile_indexes_tolerates_concurrent_drop(db_service, fake_db):
+    """Test that an index already dropped by another process does not fail the reconcile."""
+    collection = fake_db.database.get_collection(User.collection_name)
+    collection.list_indexes.return_value = [
+        {"v": 2, "name": "_id_", "key": {"_id": 1}},
+        {"v": 2, "name": "email_1", "key": {"email": 1}},
+    ]
+    collection.drop_index.side_effect = OperationFailure("index not found", code=initialize.INDEX_NOT_FOUND)
+
+    dropped, created = await initialize.reconcile_indexes(User.collection_name, User.indexes)
+
+    assert dropped == ["email_1"]
+    collection.create_indexes.assert_called_once_with(User.indexes)
+
+
+@pytest.mark.asyncio
+async def test_initialize_indexes_only_creates_and_survives_failed_builds(db_service, fake_db, caplog):
+    """Test that startup never drops indexes and logs a failed build instead of raising."""
+    fake_db.users_collection.create_indexes.side_effect = OperationFailure("E11000 duplicate key", code=11000)
+
+    await initialize.initialize_indexes()
+
+    fake_db.users_collection.drop_index.assert_not_called()
+    fake_db.transactions_collection.create_indexes.assert_called_once_with(Transaction.indexes)
+    assert "Building the indexes of users failed" in caplog.text
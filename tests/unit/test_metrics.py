@@ -0,0 +1,179 @@
+import asyncio
+import gzip
+import zlib
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import create_app
+from transaction_api.api import middleware
+from transaction_api.models.user import User
+from transaction_api.services.metrics import RequestTimings, current_timings, request_metrics
+from transaction_api.services.monitoring import CommandMonitor, command_shape
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    request_metrics.clear()
+    yield
+    request_metrics.clear()
+
+
+def test_metrics_are_recorded_per_route(client, fake_db):
+    """Test that requests are counted under their route template and exposed in Prometheus format."""
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one.return_value = None
+
+    client.get("/users/user1")
+    client.get("/users/user2")
+    client.get("/does-not-exist")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/users/{userId}",status="404"} 2' in response.text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/users/{userId}"} 2' in response.text
+    assert 'http_request_db_seconds_bucket{method="GET",route="/users/{userId}",le="+Inf"} 2' in response.text
+    assert "http_request_serialization_seconds_sum" in response.text
+    assert "server-timing" not in response.headers
+
+
+def test_server_timing_header(mocker, db_service, fake_db):
+    """Test that the Server-Timing header splits the request into db, app and serialization time."""
+    mocker.patch.object(middleware.settings, "server_timing", True)
+    mocker.patch("app.initialize.initialize_indexes")
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one.return_value = None
+
+    response = TestClient(create_app()).get("/users/user1")
+
+    assert [part.split(";")[0] for part in response.headers["server-timing"].split(", ")] == [
+        "db",
+        "app",
+        "serialization",
+        "total",
+    ]
+
+
+def test_command_monitor_attributes_commands_to_current_request():
+    """Test that command counts and durations are attributed to the request active in the current context."""
+    monitor = CommandMonitor()
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    try:
+        for request_id, duration in ((1, 1500), (2, 500)):
+            monitor.started(SimpleNamespace(request_id=request_id, command={"find": "users"}))
+            monitor.succeeded(SimpleNamespace(request_id=request_id, duration_micros=duration))
+    finally:
+        current_timings.reset(token)
+    monitor.started(SimpleNamespace(request_id=3, command={"find": "users"}))
+    monitor.succeeded(SimpleNamespace(request_id=3, duration_micros=1000))
+
+    assert timings.commands == 2
+    assert timings.db == pytest.approx(0.002)
+
+
+def test_command_monitor_logs_slow_commands(caplog):
+    """Test that commands slower than the threshold are logged with the shape of their filter."""
+    monitor = CommandMonitor(slow_command_ms=10)
+    command = {"find": "transactions", "filter": {"user_id": "user1", "timestamp": {"$gte": 1}}, "limit": 101}
+    monitor.started(SimpleNamespace(request_id=1, command=command))
+    monitor.succeeded(SimpleNamespace(request_id=1, command_name="find", duration_micros=25000))
+    monitor.started(SimpleNamespace(request_id=2, command=command))
+    monitor.succeeded(SimpleNamespace(request_id=2, command_name="find", duration_micros=5000))
+
+    assert [record.getMessage() for record in caplog.records] == [
+        "Slow MongoDB command find on transactions took 25.0 ms, "
+        "filter {'user_id': '?', 'timestamp': {'$gte': '?'}}"
+    ]
+
+
+def test_command_shape():
+    """Test that filters are extracted from write commands and stripped of their values."""
+    assert command_shape(
+        {"update": "users", "updates": [{"q": {"user_id": "u1"}, "u": {"$inc": {"a": 1}}}]}
+    ) == [{"user_id": "?"}]
+    assert command_shape({"aggregate": "transactions", "pipeline": [{"$match": {"user_id": "u1"}}]}) == [
+        {"$match": {"user_id": "?"}}
+    ]
+    assert command_shape({"ping": 1}) is None
+
+
+def test_requests_with_too_many_commands_are_flagged(mocker, caplog):
+    """Test that the middleware logs requests issuing more commands than allowed and counts their commands."""
+    mocker.patch.object(middleware.settings, "max_commands_per_request", 2)
+
+    async def app(scope, receive, send):
+        current_timings.get().commands = 3
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    TestClient(middleware.MetricsMiddleware(app)).get("/anything")
+
+    assert [record.getMessage() for record in caplog.records] == [
+        "GET unmatched issued 3 MongoDB commands (limit 2)"
+    ]
+    assert 'http_request_db_commands_total{method="GET",route="unmatched"} 3' in request_metrics.render()
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, deflate", "gzip"),
+        ("deflate", None),
+        ("gzip;q=0, *;q=0.5", None if "zstd" not in middleware.ENCODINGS else "zstd"),
+        ("*", middleware.ENCODINGS[0]),
+        ("", None),
+    ],
+)
+def test_choose_encoding(accept_encoding, expected):
+    assert middleware.choose_encoding(accept_encoding) == expected
+
+
+def test_large_responses_are_compressed(client, fake_db):
+    """Test that responses above the size threshold are gzipped and small ones are sent as they are."""
+    users = [
+        {
+            "user_id": f"user{index:04d}",
+            "name": "Load Test",
+            "email": "load@example.com",
+            "created_at": "2024-01-01",
+        }
+        for index in range(100)
+    ]
+    fake_db.database.get_collection(User.collection_name).find.return_value = users
+
+    response = client.get("/users", params={"limit": 100}, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert len(response.json()["items"]) == 100
+
+    fake_db.database.get_collection(User.collection_name).find.return_value = users[:1]
+    response = client.get("/users", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+def test_streamed_responses_are_compressed_per_chunk():
+    """Test that every chunk of a streamed response is decodable as soon as it is sent."""
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"first", "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def send(message):
+        sent.append(message)
+
+    compression = middleware.CompressionMiddleware(app, minimum_size=1024)
+    asyncio.run(compression({"type": "http", "headers": [(b"accept-encoding", b"gzip")]}, None, send))
+
+    assert (b"content-encoding", b"gzip") in sent[0]["headers"]
+    decompressor = zlib.decompressobj(wbits=31)
+    assert decompressor.decompress(sent[1]["body"]) == b"first"
+    assert gzip.decompress(sent[1]["body"] + sent[2]["body"]) == b"first"
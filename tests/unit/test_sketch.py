@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from transaction_api.services.sketch import AmountSketch
+
+
+def test_sketch_quantiles_are_within_relative_accuracy():
+    """Test that quantiles are answered within the relative accuracy of the exact order statistic."""
+    rng = random.Random(7)
+    amounts = [rng.lognormvariate(3, 1.5) * rng.choice([1, 1, 1, -1]) for _ in range(10000)]
+    sketch = AmountSketch(relative_accuracy=0.01)
+    for amount in amounts:
+        sketch.add(amount)
+
+    ordered = sorted(amounts)
+    for q in (0.01, 0.25, 0.5, 0.95, 0.99):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.01)
+    assert sketch.quantile(0) == min(amounts)
+    assert sketch.quantile(1) == max(amounts)
+
+
+def test_sketches_merge_by_adding_bins():
+    """Test that merging two sketches equals sketching both sets of amounts."""
+    left, right, both = AmountSketch(), AmountSketch(), AmountSketch()
+    for amount in (-50.0, 0.0, 3.5, 120.0):
+        left.add(amount)
+        both.add(amount)
+    for amount in (-2.0, 3.5, 999.0):
+        right.add(amount)
+        both.add(amount)
+
+    left.merge(right)
+
+    assert left.as_document() == both.as_document()
+    assert AmountSketch.from_document(both.as_document()).quantile(0.5) == both.quantile(0.5)
+
+
+def test_sketch_histogram():
+    """Test that amounts are counted in open-ended buckets around the edges."""
+    sketch = AmountSketch()
+    for amount in (-500.0, -5.0, 0.0, 5.0, 50.0, 5000.0):
+        sketch.add(amount)
+
+    assert sketch.histogram([-100.0, 0.0, 100.0]) == [1, 1, 3, 1]
+    assert AmountSketch().quantile(0.5) is None
@@ -1,20 +1,115 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from transaction_api.models.checkpoint import BalanceCheckpoint
+from transaction_api.models.rollup import TransactionRollup
+from transaction_api.models.sketch import AmountSketchDocument
+from transaction_api.models.transaction import Transaction, TransactionInput
 from transaction_api.models.user import User
+from transaction_api.repository import rollups as rollup_repo
+from transaction_api.repository import statistics as statistics_repo
+from transaction_api.services.cache import account_summary_cache
+from transaction_api.services.sketch import AmountSketch
 
 
 def test_get_account_summary_success(client, fake_db):
     """Test retrieving account summary for a user."""
 
     user_id = "user123"
-    account_summary_data = {"userId": user_id, "currentBalance": 200.0, "transactionCount": 5}
+    account_summary_data = {
+        "userId": user_id,
+        "currentBalance": 200.0,
+        "transactionCount": 5,
+        "totalCredits": 250.0,
+        "totalDebits": 50.0,
+        "firstTransactionAt": "2023-12-01T12:00:00",
+        "lastTransactionAt": "2023-12-05T12:00:00",
+    }
 
-    fake_db.database.get_collection(User.collection_name).aggregate.return_value.try_next.return_value = (
-        account_summary_data
-    )
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one.return_value = {"_id": ObjectId(), **account_summary_data}
 
     response = client.get(f"/account-summary/{user_id}")
 
     assert response.status_code == 200
     assert response.json() == account_summary_data
+    user_collection.aggregate.assert_not_called()
+    assert user_collection.find_one.call_args.args == ({"user_id": user_id},)
+
+
+def test_get_account_summaries(client, fake_db):
+    """Test that a batch of summaries is read with one $in query and unknown users are reported."""
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one.return_value = {
+        "_id": ObjectId(),
+        "user_id": "user1",
+        "balance": 5.0,
+        "transaction_count": 1,
+    }
+    assert client.get("/account-summary/user1").status_code == 200
+    user_collection.find.return_value = [
+        {"_id": ObjectId(), "user_id": "user2", "balance": 20.0, "transaction_count": 2}
+    ]
+
+    response = client.post("/account-summary/batch", json={"userIds": ["user2", "user1", "user3", "user2"]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert list(body["summaries"]) == ["user2", "user1"]
+    assert body["summaries"]["user2"]["currentBalance"] == 20.0
+    assert body["summaries"]["user1"]["transactionCount"] == 1
+    assert body["missing"] == ["user3"]
+    user_collection.find.assert_called_once_with(
+        {"user_id": {"$in": ["user2", "user3"]}}, projection=statistics_repo.ACCOUNT_SUMMARY_PROJECTION
+    )
+    assert account_summary_cache._pending == {}
+
+
+def test_get_account_summaries_requires_user_ids(client):
+    """Test that an empty batch is rejected."""
+    assert client.post("/account-summary/batch", json={"userIds": []}).status_code == 422
+
+
+def test_get_account_summary_without_counters(client, fake_db):
+    """Test retrieving account summary for a user that has no transactions yet."""
+
+    user_id = "user123"
+    fake_db.database.get_collection(User.collection_name).find_one.return_value = {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "balance": 0.0,
+    }
+
+    response = client.get(f"/account-summary/{user_id}")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "userId": user_id,
+        "currentBalance": 0.0,
+        "transactionCount": 0,
+        "totalCredits": 0.0,
+        "totalDebits": 0.0,
+        "firstTransactionAt": None,
+        "lastTransactionAt": None,
+    }
+
+
+def test_get_account_summary_rereads_cache_of_older_version(client, fake_db):
+    """Test that a cached summary is not served under the ETag of a newer user version."""
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user = {"_id": ObjectId(), "user_id": "user1", "balance": 5.0, "transaction_count": 1, "version": 1}
+    user_collection.find_one.return_value = user
+    assert client.get("/account-summary/user1").json()["currentBalance"] == 5.0
+    # A write committed on another worker, whose cache this one does not see.
+    user_collection.find_one.return_value = {**user, "balance": 7.0, "transaction_count": 2, "version": 2}
+
+    response = client.get("/account-summary/user1")
+
+    assert response.headers["ETag"] == f'W/"{user["_id"]}.2"'
+    assert response.json()["currentBalance"] == 7.0
 
 
 def test_get_account_summary_user_not_found(client, fake_db):
@@ -22,9 +117,292 @@ def test_get_account_summary_user_not_found(client, fake_db):
 
     user_id = "nonexistent"
 
-    fake_db.database.get_collection(User.collection_name).aggregate.return_value.try_next.return_value = None
+    fake_db.database.get_collection(User.collection_name).find_one.return_value = None
 
     response = client.get(f"/account-summary/{user_id}")
 
     assert response.status_code == 404
     assert response.json() == {"detail": f"User with id '{user_id}' not found"}
+    assert account_summary_cache._pending == {}
+
+
+@pytest.mark.asyncio
+async def test_rebuild_account_summaries(db_service, fake_db):
+    """Test recomputing the per-user counters from the transactions collection."""
+
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.count_documents.return_value = 1
+    fake_db.database.get_collection(Transaction.collection_name).aggregate.return_value = [
+        {
+            "_id": "user1",
+            "transaction_count": 2,
+            "total_credits": 100.0,
+            "total_debits": 20.0,
+            "first_transaction_at": datetime(2023, 12, 1),
+            "last_transaction_at": datetime(2023, 12, 2),
+        }
+    ]
+
+    assert await statistics_repo.rebuild_account_summaries() == 1
+
+    user_collection.update_many.assert_called_once()
+    user_collection.bulk_write.assert_called_once_with(
+        [
+            UpdateOne(
+                {"user_id": "user1"},
+                {
+                    "$inc": {"transaction_count": 2, "total_credits": 100.0, "total_debits": 20.0},
+                    "$min": {"first_transaction_at": datetime(2023, 12, 1)},
+                    "$max": {"last_transaction_at": datetime(2023, 12, 2)},
+                },
+            )
+        ],
+        ordered=False,
+    )
+
+
+def test_get_account_timeseries(client, fake_db):
+    """Test that the timeseries is read from the rollup buckets of the requested range."""
+    rollups = fake_db.database.get_collection(TransactionRollup.collection_name)
+    rollups.find.return_value = [
+        {
+            "bucket": datetime(2024, 1, 1),
+            "transaction_count": 3,
+            "total_credits": 150.0,
+            "total_debits": 20.5,
+            "net_flow": 129.5,
+            "min_amount": -20.5,
+            "max_amount": 100.0,
+        }
+    ]
+
+    response = client.get(
+        "/account-summary/user1/timeseries?granularity=month&startDate=2024-01-15&endDate=2024-03-02"
+    )
+
+    assert response.status_code == 200, response.text
+    assert response.json() == {
+        "userId": "user1",
+        "granularity": "month",
+        "buckets": [
+            {
+                "bucket": "2024-01-01T00:00:00",
+                "transactionCount": 3,
+                "totalCredits": 150.0,
+                "totalDebits": 20.5,
+                "netFlow": 129.5,
+                "minAmount": -20.5,
+                "maxAmount": 100.0,
+            }
+        ],
+    }
+    assert rollups.find.call_args.args[0] == {
+        "user_id": "user1",
+        "granularity": "month",
+        "bucket": {"$gte": datetime(2024, 1, 1), "$lte": datetime(2024, 3, 1)},
+    }
+
+
+def test_get_account_timeseries_user_not_found(client, fake_db):
+    """Test that an empty timeseries of an unknown user is a 404 error."""
+    fake_db.database.get_collection(TransactionRollup.collection_name).find.return_value = []
+    fake_db.database.get_collection(User.collection_name).find_one.return_value = None
+
+    response = client.get("/account-summary/missing/timeseries")
+
+    assert response.status_code == 404
+
+
+def test_rollup_updates_fold_transactions_per_bucket():
+    """Test that transactions are folded into one upsert per user, granularity and bucket."""
+    transactions = [
+        TransactionInput(
+            transactionId="t1", userId="user1", amount=100.0, timestamp=datetime(2024, 1, 1, 10)
+        ),
+        TransactionInput(
+            transactionId="t2", userId="user1", amount=-20.0, timestamp=datetime(2024, 1, 1, 12)
+        ),
+        TransactionInput(transactionId="t3", userId="user1", amount=5.0, timestamp=datetime(2024, 1, 2, 9)),
+    ]
+
+    updates = rollup_repo.rollup_updates(transactions)
+
+    assert updates[0] == UpdateOne(
+        {"user_id": "user1", "granularity": "day", "bucket": datetime(2024, 1, 1)},
+        {
+            "$inc": {"transaction_count": 2, "total_credits": 100.0, "total_debits": 20.0, "net_flow": 80.0},
+            "$min": {"min_amount": -20.0},
+            "$max": {"max_amount": 100.0},
+        },
+        upsert=True,
+    )
+    assert [
+        (update._filter["granularity"], update._doc["$inc"]["transaction_count"]) for update in updates
+    ] == [
+        ("day", 2),
+        ("month", 3),
+        ("day", 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_rollups(db_service, fake_db):
+    """Test that every granularity is recomputed on the server and merged into the rollup collection."""
+    rollups = fake_db.database.get_collection(TransactionRollup.collection_name)
+    rollups.count_documents.return_value = 4
+    transactions = fake_db.database.get_collection(Transaction.collection_name)
+    transactions.aggregate.return_value = []
+
+    assert await rollup_repo.rebuild_rollups() == 4
+
+    rollups.delete_many.assert_called_once_with({})
+    pipelines = [call.args[0] for call in transactions.aggregate.call_args_list]
+    assert [pipeline[0]["$group"]["_id"]["bucket"]["$dateTrunc"]["unit"] for pipeline in pipelines] == [
+        "day",
+        "month",
+    ]
+    assert all(pipeline[-1]["$merge"]["into"] == TransactionRollup.collection_name for pipeline in pipelines)
+
+
+def test_get_account_summary_as_of(client, fake_db):
+    """Test that a point-in-time summary adds the transactions after the nearest checkpoint to it."""
+    checkpoints = fake_db.database.get_collection(BalanceCheckpoint.collection_name)
+    checkpoints.find_one.return_value = {
+        "balance": 100.0,
+        "transaction_count": 100,
+        "total_credits": 150.0,
+        "total_debits": 50.0,
+        "first_transaction_at": datetime(2023, 1, 1),
+        "last_transaction_at": datetime(2023, 12, 1),
+    }
+    transactions = fake_db.database.get_collection(Transaction.collection_name)
+    transactions.aggregate.return_value = [
+        {
+            "_id": None,
+            "balance": -20.0,
+            "transaction_count": 2,
+            "total_credits": 5.0,
+            "total_debits": 25.0,
+            "first_transaction_at": datetime(2023, 12, 2),
+            "last_transaction_at": datetime(2023, 12, 3),
+        }
+    ]
+
+    response = client.get("/account-summary/user1?asOf=2023-12-05T00:00:00Z")
+
+    assert response.status_code == 200, response.text
+    assert response.json() == {
+        "userId": "user1",
+        "currentBalance": 80.0,
+        "transactionCount": 102,
+        "totalCredits": 155.0,
+        "totalDebits": 75.0,
+        "firstTransactionAt": "2023-01-01T00:00:00",
+        "lastTransactionAt": "2023-12-03T00:00:00",
+    }
+    assert checkpoints.find_one.call_args.args[0] == {
+        "user_id": "user1",
+        "last_transaction_at": {"$lte": datetime(2023, 12, 5)},
+    }
+    assert transactions.aggregate.call_args.args[0][0] == {
+        "$match": {
+            "user_id": "user1",
+            "timestamp": {"$lte": datetime(2023, 12, 5), "$gt": datetime(2023, 12, 1)},
+        }
+    }
+
+
+def test_get_account_summary_as_of_before_first_transaction(client, fake_db):
+    """Test that a point-in-time summary before any transaction has a zero balance."""
+    fake_db.database.get_collection(BalanceCheckpoint.collection_name).find_one.return_value = None
+    fake_db.database.get_collection(Transaction.collection_name).aggregate.return_value = []
+    fake_db.database.get_collection(User.collection_name).find_one.return_value = {
+        "_id": ObjectId(),
+        "user_id": "user1",
+    }
+
+    response = client.get("/account-summary/user1?asOf=2020-01-01T00:00:00")
+
+    assert response.status_code == 200
+    assert response.json()["currentBalance"] == 0.0
+    assert response.json()["transactionCount"] == 0
+
+
+def test_get_account_percentiles(client, fake_db):
+    """Test that per-user percentiles are answered from the user's all-time sketch."""
+    sketch = AmountSketch()
+    for amount in (-20.0, 10.0, 30.0, 50.0, 1000.0):
+        sketch.add(amount)
+    sketches = fake_db.database.get_collection(AmountSketchDocument.collection_name)
+    sketches.find_one.return_value = sketch.as_document()
+
+    response = client.get("/account-summary/user1/percentiles?p=50&p=100")
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["userId"] == "user1"
+    assert body["count"] == 5
+    assert body["min"] == -20.0 and body["max"] == 1000.0
+    assert body["percentiles"]["p50"] == pytest.approx(30.0, rel=0.01)
+    assert body["percentiles"]["p100"] == 1000.0
+    assert sketches.find_one.call_args.args[0] == {"user_id": "user1", "month": None}
+
+
+def test_get_account_percentiles_rejects_out_of_range(client):
+    """Test that percentiles outside 0-100 are rejected."""
+    response = client.get("/account-summary/user1/percentiles?p=101")
+
+    assert response.status_code == 422
+
+
+def test_get_account_percentiles_user_not_found(client, fake_db):
+    """Test that percentiles of an unknown user return a 404."""
+    fake_db.database.get_collection(AmountSketchDocument.collection_name).find_one.return_value = None
+    fake_db.database.get_collection(User.collection_name).find_one.return_value = None
+
+    response = client.get("/account-summary/unknown/percentiles")
+
+    assert response.status_code == 404
+
+
+def test_get_histogram_merges_monthly_sketches(client, fake_db):
+    """Test that a date range merges the monthly sketches of all users for the months it touches."""
+    january, february = AmountSketch(), AmountSketch()
+    for amount in (-5.0, 5.0):
+        january.add(amount)
+    for amount in (50.0, 500.0):
+        february.add(amount)
+    sketches = fake_db.database.get_collection(AmountSketchDocument.collection_name)
+    sketches.find.return_value = [january.as_document(), february.as_document()]
+
+    response = client.get("/statistics/histogram?edge=100&edge=0&startDate=2024-01-15&endDate=2024-02-10")
+
+    assert response.status_code == 200, response.text
+    assert response.json() == {
+        "userId": None,
+        "count": 4,
+        "buckets": [
+            {"lower": None, "upper": 0.0, "count": 1},
+            {"lower": 0.0, "upper": 100.0, "count": 2},
+            {"lower": 100.0, "upper": None, "count": 1},
+        ],
+    }
+    assert sketches.find.call_args.args[0] == {
+        "user_id": None,
+        "month": {"$gte": datetime(2024, 1, 1), "$lte": datetime(2024, 2, 1)},
+    }
+
+
+def test_get_distribution_merges_global_shards(client, fake_db):
+    """Test that all-users percentiles merge every shard of the all-time sketch."""
+    first, second = AmountSketch(), AmountSketch()
+    first.add(10.0)
+    second.add(30.0)
+    sketches = fake_db.database.get_collection(AmountSketchDocument.collection_name)
+    sketches.find.return_value = [first.as_document(), second.as_document()]
+
+    response = client.get("/statistics/percentiles?p=100")
+
+    assert response.status_code == 200, response.text
+    assert response.json()["count"] == 2
+    assert sketches.find.call_args.args[0] == {"user_id": None, "month": None}
@@ -1,12 +1,43 @@
+import asyncio
+import json
+from bisect import bisect_left
 from datetime import datetime
+from unittest.mock import ANY, call
 
-from transaction_api.models.transaction import Transaction
+import pytest
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from transaction_api.api import raw
+from transaction_api.api.export import export_rows
+from transaction_api.api.feed import sse_events
+from transaction_api.models.checkpoint import BalanceCheckpoint
+from transaction_api.models.rollup import TransactionRollup
+from transaction_api.models.sketch import AmountSketchDocument
+from transaction_api.exceptions import InsufficientBalance, WriteQueueFull
+from transaction_api.models.transaction import (
+    Transaction,
+    TransactionBatchOut,
+    TransactionBatchResult,
+    TransactionId,
+    TransactionInput,
+    TransactionOut,
+)
 from transaction_api.models.user import User
+from transaction_api.repository import archive, feed, partitions
+from transaction_api.repository import transactions as transaction_repo
+from transaction_api.repository import group_commit as group_commit_module
+from transaction_api.repository import sketches as sketches_repo
+from transaction_api.repository.group_commit import GroupCommit
+from transaction_api.repository.pagination import encode_cursor
+from transaction_api.repository.users import BALANCE_CHANGE_PROJECTION, BalanceChange
+from transaction_api.services.broker import transaction_broker
+from transaction_api.services.metrics import SIZE_BUCKETS, feed_metrics, group_commit_metrics
 from .conftest import fake_db
-from .user_data import test_user_1
 
 
-def test_add_transaction_success(mocker, client, fake_db):
+def test_add_transaction_success(client, fake_db):
     """
     Test the add_transaction endpoint to ensure a transaction is added successfully
     and the user's balance is updated correctly.
@@ -17,20 +48,338 @@ def test_add_transaction_success(mocker, client, fake_db):
         "amount": 100.0,
         "timestamp": "2023-12-12T10:00:00",
     }
-    user_data = test_user_1.copy()
-    user_data["balance"] = 200
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one_and_update.return_value = {"balance": 300.0}
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+
+    response = client.post("/transactions", json=transaction_data)
+
+    assert response.status_code == 201
+    assert response.json() == {"success": True, "message": "Transaction created successfully."}
+
+    user_collection.find_one_and_update.assert_called_once_with(
+        {"user_id": "test123"},
+        {
+            "$inc": {
+                "balance": 100.0,
+                "transaction_count": 1,
+                "total_credits": 100.0,
+                "total_debits": 0.0,
+            },
+            "$min": {"first_transaction_at": datetime(2023, 12, 12, 10, 0, 0)},
+            "$max": {"last_transaction_at": datetime(2023, 12, 12, 10, 0, 0)},
+        },
+        projection=BALANCE_CHANGE_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
+        session=None,
+    )
+    user_collection.find_one.assert_not_called()
+    transaction_collection.insert_one.assert_called_once()
+    rollups = fake_db.database.get_collection(TransactionRollup.collection_name)
+    assert [update._filter["granularity"] for update in rollups.bulk_write.call_args.args[0]] == [
+        "day",
+        "month",
+    ]
+    sketches = fake_db.database.get_collection(AmountSketchDocument.collection_name)
+    sketch_updates = sketches.bulk_write.call_args.args[0]
+    assert [update._filter for update in sketch_updates] == [
+        {"user_id": "test123", "month": None},
+        {"user_id": "test123", "month": datetime(2023, 12, 1)},
+        {"user_id": None, "month": None, "shard": sketches_repo.global_shard("test123")},
+        {"user_id": None, "month": datetime(2023, 12, 1), "shard": sketches_repo.global_shard("test123")},
+    ]
+    assert sketch_updates[0]._doc == {
+        "$inc": {"count": 1, "zero_count": 0, "positive.231": 1},
+        "$min": {"min": 100.0},
+        "$max": {"max": 100.0},
+    }
+
+
+def test_add_transaction_writes_checkpoints(mocker, client, fake_db):
+    """
+    Test that a checkpoint is written every CHECKPOINT_INTERVAL transactions and that
+    backdated transactions drop the checkpoints taken after them.
+    """
+    mocker.patch("transaction_api.repository.checkpoints.settings.checkpoint_interval", 2)
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one_and_update.return_value = {
+        "balance": 10.0,
+        "transaction_count": 1,
+        "total_credits": 10.0,
+        "total_debits": 0.0,
+        "first_transaction_at": datetime(2023, 12, 1),
+        "last_transaction_at": datetime(2023, 12, 20),
+        "checkpoint_invalidations": 3,
+    }
+    user_collection.find_one.return_value = {"checkpoint_invalidations": 4}
+    checkpoints = fake_db.database.get_collection(BalanceCheckpoint.collection_name)
+
+    response = client.post(
+        "/transactions",
+        json={"transactionId": "txn1", "userId": "user1", "amount": -4.0, "timestamp": "2023-12-12T00:00:00"},
+    )
+
+    assert response.status_code == 201
+    assert user_collection.update_many.call_args_list == [
+        call({"user_id": {"$in": ["user1"]}}, {"$inc": {"version": 1}}, session=None),
+        call({"user_id": {"$in": ["user1"]}}, {"$inc": {"checkpoint_invalidations": 1}}, session=None),
+    ]
+    checkpoints.delete_many.assert_called_once_with(
+        {"user_id": "user1", "last_transaction_at": {"$gte": datetime(2023, 12, 12)}}, session=None
+    )
+    checkpoints.update_one.assert_called_once_with(
+        {"user_id": "user1", "last_transaction_at": datetime(2023, 12, 20)},
+        {
+            "$set": {
+                "balance": 6.0,
+                "transaction_count": 2,
+                "total_credits": 10.0,
+                "total_debits": 4.0,
+                "first_transaction_at": datetime(2023, 12, 1),
+                "last_transaction_at": datetime(2023, 12, 20),
+            }
+        },
+        upsert=True,
+        session=None,
+    )
+    checkpoints.delete_one.assert_not_called()
+
+
+def test_add_transaction_drops_checkpoint_raced_by_backdated_write(mocker, client, fake_db):
+    """Test that a checkpoint is dropped when a backdated write was counted after its summary was read."""
+    mocker.patch("transaction_api.repository.checkpoints.settings.checkpoint_interval", 2)
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one_and_update.return_value = {
+        "balance": 10.0,
+        "transaction_count": 1,
+        "total_credits": 10.0,
+        "total_debits": 0.0,
+        "first_transaction_at": datetime(2023, 12, 1),
+        "last_transaction_at": datetime(2023, 12, 20),
+        "checkpoint_invalidations": 3,
+    }
+    user_collection.find_one.return_value = {"checkpoint_invalidations": 4}
+    checkpoints = fake_db.database.get_collection(BalanceCheckpoint.collection_name)
+
+    response = client.post(
+        "/transactions",
+        json={"transactionId": "txn1", "userId": "user1", "amount": 1.0, "timestamp": "2023-12-21T00:00:00"},
+    )
+
+    assert response.status_code == 201
+    checkpoints.delete_many.assert_not_called()
+    checkpoints.delete_one.assert_called_once_with(
+        {"user_id": "user1", "last_transaction_at": datetime(2023, 12, 21)}, session=None
+    )
+
 
+def test_add_transaction_debit_is_guarded(client, fake_db):
+    """
+    Test the add_transaction endpoint to ensure debits are applied with a balance guard
+    in the same update, so concurrent debits cannot overdraw the account.
+    """
+    transaction_data = {
+        "transactionId": "txn123",
+        "userId": "test123",
+        "amount": -50.0,
+        "timestamp": "2023-12-12T10:00:00",
+    }
     user_collection = fake_db.database.get_collection(User.collection_name)
-    user_collection.find_one.return_value = user_data
-    user_collection.update_one = mocker.MagicMock()
+    user_collection.find_one_and_update.return_value = {"balance": 150.0}
+
+    response = client.post("/transactions", json=transaction_data)
+
+    assert response.status_code == 201
+    filters, update = user_collection.find_one_and_update.call_args.args
+    assert filters == {"user_id": "test123", "balance": {"$gte": 50.0}}
+    assert update["$inc"] == {
+        "balance": -50.0,
+        "transaction_count": 1,
+        "total_credits": 0.0,
+        "total_debits": 50.0,
+    }
+
+
+def test_add_transaction_reverts_balance_on_insert_failure(client, fake_db):
+    """
+    Test the add_transaction endpoint to ensure the balance change is compensated
+    when the transaction row cannot be stored.
+    """
+    transaction_data = {
+        "transactionId": "txn123",
+        "userId": "test123",
+        "amount": 100.0,
+        "timestamp": "2023-12-12T10:00:00",
+    }
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one_and_update.return_value = {"balance": 100.0}
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.insert_one.side_effect = RuntimeError("insert failed")
+
+    with pytest.raises(RuntimeError):
+        client.post("/transactions", json=transaction_data)
+
+    user_collection.update_one.assert_called_once_with(
+        {"user_id": "test123"},
+        {
+            "$inc": {
+                "balance": -100.0,
+                "transaction_count": -1,
+                "total_credits": -100.0,
+                "total_debits": -0.0,
+                "version": 1,
+            }
+        },
+    )
+
+
+def test_add_transaction_replay(client, fake_db):
+    """
+    Test the add_transaction endpoint to ensure a retried submission returns the original
+    success without touching the balance again.
+    """
+    transaction_data = {
+        "transactionId": "txn123",
+        "userId": "test123",
+        "amount": 100.0,
+        "timestamp": "2023-12-12T10:00:00.000123+00:00",
+    }
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.find_one.return_value = {
+        "transaction_id": "txn123",
+        "user_id": "test123",
+        "amount": 100.0,
+        "timestamp": datetime(2023, 12, 12, 10, 0, 0),
+    }
 
-    mock_update_balance = user_collection.update_one
     response = client.post("/transactions", json=transaction_data)
 
     assert response.status_code == 201
     assert response.json() == {"success": True, "message": "Transaction created successfully."}
+    assert response.headers["Idempotent-Replayed"] == "true"
+    user_collection.find_one_and_update.assert_not_called()
+    transaction_collection.insert_one.assert_not_called()
+
+
+def test_add_transaction_marks_pending_derived_writes(client, fake_db):
+    """
+    Test that the derived writes left when one fails are kept on the stored row.
+    """
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    sketches = fake_db.database.get_collection(AmountSketchDocument.collection_name)
+    sketches.bulk_write.side_effect = ConnectionError("sketches unavailable")
+
+    with pytest.raises(ConnectionError):
+        client.post(
+            "/transactions",
+            json={
+                "transactionId": "txn1",
+                "userId": "user1",
+                "amount": 5.0,
+                "timestamp": "2023-12-12T10:00:00",
+            },
+        )
+
+    transaction_collection.insert_one.assert_called_once()
+    fake_db.database.get_collection(TransactionRollup.collection_name).bulk_write.assert_called_once()
+    transaction_collection.update_many.assert_called_once_with(
+        {"transaction_id": {"$in": ["txn1"]}}, {"$set": {"pending_derived": ["sketches", "checkpoints"]}}
+    )
+
+
+def test_add_transaction_replay_writes_pending_derived(client, fake_db):
+    """
+    Test that a replay claims the derived writes left pending on the stored row and writes them.
+    """
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.find_one.return_value = {
+        "transaction_id": "txn1",
+        "user_id": "user1",
+        "amount": 5.0,
+        "timestamp": datetime(2023, 12, 12, 10, 0, 0),
+        "pending_derived": ["sketches", "checkpoints"],
+    }
+    transaction_collection.find_one_and_update.return_value = {"pending_derived": ["sketches", "checkpoints"]}
+    user_collection.find.return_value = []
+
+    response = client.post(
+        "/transactions",
+        json={"transactionId": "txn1", "userId": "user1", "amount": 5.0, "timestamp": "2023-12-12T10:00:00"},
+    )
+
+    assert response.status_code == 201
+    assert response.headers["Idempotent-Replayed"] == "true"
+    transaction_collection.find_one_and_update.assert_called_once_with(
+        {"transaction_id": "txn1", "pending_derived": {"$exists": True}},
+        {"$unset": {"pending_derived": True}},
+        projection={"_id": False, "pending_derived": True},
+    )
+    fake_db.database.get_collection(TransactionRollup.collection_name).bulk_write.assert_not_called()
+    fake_db.database.get_collection(AmountSketchDocument.collection_name).bulk_write.assert_called_once()
+    user_collection.update_many.assert_called_once_with(
+        {"user_id": {"$in": ["user1"]}}, {"$inc": {"checkpoint_invalidations": 1}}, session=None
+    )
+    user_collection.find_one_and_update.assert_not_called()
+
+
+def test_add_transaction_conflict(client, fake_db):
+    """
+    Test the add_transaction endpoint to ensure reusing a transaction id with different data
+    is rejected with a 409 error.
+    """
+    transaction_data = {
+        "transactionId": "txn123",
+        "userId": "test123",
+        "amount": 50.0,
+        "timestamp": "2023-12-12T10:00:00",
+    }
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.find_one.return_value = {
+        "transaction_id": "txn123",
+        "user_id": "test123",
+        "amount": 100.0,
+        "timestamp": datetime(2023, 12, 12, 10, 0, 0),
+    }
+
+    response = client.post("/transactions", json=transaction_data)
 
-    mock_update_balance.assert_called_once_with({"user_id": "test123"}, {"$inc": {"balance": 100.0}})
+    assert response.status_code == 409
+    assert response.json() == {"detail": "Transaction with id 'txn123' already exists with different data"}
+    user_collection.find_one_and_update.assert_not_called()
+
+
+def test_add_transaction_concurrent_duplicate(client, fake_db):
+    """
+    Test the add_transaction endpoint to ensure losing an insert race against the same submission
+    reverts the balance change and is answered as a replay.
+    """
+    transaction_data = {
+        "transactionId": "txn123",
+        "userId": "test123",
+        "amount": 100.0,
+        "timestamp": "2023-12-12T10:00:00",
+    }
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one_and_update.return_value = {"balance": 100.0}
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.insert_one.side_effect = DuplicateKeyError("duplicate key")
+    transaction_collection.find.return_value = [
+        {
+            "transaction_id": "txn123",
+            "user_id": "test123",
+            "amount": 100.0,
+            "timestamp": datetime(2023, 12, 12, 10, 0, 0),
+        }
+    ]
+
+    response = client.post("/transactions", json=transaction_data)
+
+    assert response.status_code == 201
+    assert response.headers["Idempotent-Replayed"] == "true"
+    user_collection.update_one.assert_called_once()
 
 
 def test_add_transaction_insufficient_balance(client, fake_db):
@@ -45,10 +394,9 @@ def test_add_transaction_insufficient_balance(client, fake_db):
         "timestamp": "2023-12-12T10:00:00",
     }
 
-    user_data = test_user_1.copy()
-    user_data["balance"] = 200
     user_collection = fake_db.database.get_collection(User.collection_name)
-    user_collection.find_one.return_value = user_data
+    user_collection.find_one_and_update.return_value = None
+    user_collection.find_one.return_value = {"_id": "test_id"}
 
     response = client.post("/transactions", json=transaction_data)
 
@@ -67,6 +415,7 @@ def test_add_transaction_user_not_found(client, fake_db):
         "timestamp": "2023-12-12T10:00:00",
     }
     user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one_and_update.return_value = None
     user_collection.find_one.return_value = None
 
     response = client.post("/transactions", json=transaction_data)
@@ -103,7 +452,993 @@ def test_list_transactions(client, fake_db):
     response = client.get("/transactions", params={"userId": "user123"})
 
     assert response.status_code == 200
-    assert response.json() == [
-        {"transactionId": "txn1", "userId": "user123", "amount": 100.0, "timestamp": "2023-12-10T10:00:00"},
-        {"transactionId": "txn2", "userId": "user123", "amount": -50.0, "timestamp": "2023-12-11T15:30:00"},
+    assert response.json() == {
+        "items": [
+            {
+                "transactionId": "txn1",
+                "userId": "user123",
+                "amount": 100.0,
+                "timestamp": "2023-12-10T10:00:00",
+            },
+            {
+                "transactionId": "txn2",
+                "userId": "user123",
+                "amount": -50.0,
+                "timestamp": "2023-12-11T15:30:00",
+            },
+        ],
+        "nextCursor": None,
+    }
+
+
+def test_add_transactions_batch(client, fake_db):
+    """
+    Test the add_transactions endpoint to ensure rows are checked in order against a running balance,
+    inserted with one insert_many and folded into one balance update per user.
+    """
+    transactions_data = [
+        {"transactionId": "txn1", "userId": "user1", "amount": 100.0, "timestamp": "2023-12-12T10:00:00"},
+        {"transactionId": "txn2", "userId": "user1", "amount": -150.0, "timestamp": "2023-12-12T10:01:00"},
+        {"transactionId": "txn3", "userId": "user1", "amount": -60.0, "timestamp": "2023-12-12T10:02:00"},
+        {"transactionId": "txn4", "userId": "missing", "amount": 10.0, "timestamp": "2023-12-12T10:03:00"},
+    ]
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find.side_effect = [[{"user_id": "user1", "balance": 100.0}], []]
+    user_collection.bulk_write.return_value.matched_count = 1
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+
+    response = client.post("/transactions/batch", json=transactions_data)
+
+    assert response.status_code == 200, response.text
+    assert response.json() == {
+        "succeeded": 2,
+        "failed": 2,
+        "results": [
+            {"transactionId": "txn1", "success": True, "detail": None},
+            {"transactionId": "txn2", "success": True, "detail": None},
+            {
+                "transactionId": "txn3",
+                "success": False,
+                "detail": "User with id 'user1' has insufficient balance",
+            },
+            {"transactionId": "txn4", "success": False, "detail": "User with id 'missing' not found"},
+        ],
+    }
+    balances_read, counters_read = user_collection.find.call_args_list
+    assert set(balances_read.args[0]["user_id"]["$in"]) == {"user1", "missing"}
+    assert counters_read.args[0] == {"user_id": {"$in": ["user1"]}}
+    transaction_collection.insert_many.assert_called_once_with(
+        [
+            {
+                "transaction_id": "txn1",
+                "user_id": "user1",
+                "amount": 100.0,
+                "timestamp": datetime(2023, 12, 12, 10, 0, 0),
+            },
+            {
+                "transaction_id": "txn2",
+                "user_id": "user1",
+                "amount": -150.0,
+                "timestamp": datetime(2023, 12, 12, 10, 1, 0),
+            },
+        ],
+        ordered=False,
+    )
+    user_collection.bulk_write.assert_called_once_with(
+        [
+            UpdateOne(
+                {"user_id": "user1", "balance": {"$gte": 50.0}},
+                {
+                    "$inc": {
+                        "balance": -50.0,
+                        "transaction_count": 2,
+                        "total_credits": 100.0,
+                        "total_debits": 150.0,
+                    },
+                    "$min": {"first_transaction_at": datetime(2023, 12, 12, 10, 0, 0)},
+                    "$max": {"last_transaction_at": datetime(2023, 12, 12, 10, 1, 0)},
+                    "$set": {"balance_batch_id": ANY},
+                },
+            )
+        ],
+        ordered=False,
+    )
+    user_collection.update_many.assert_any_call(
+        {"user_id": {"$in": ["user1"]}}, {"$inc": {"version": 1}}, session=None
+    )
+
+
+def test_balance_change_mixes_naive_and_aware_timestamps():
+    """Test that naive and offset-aware timestamps of one user are compared as UTC instead of failing."""
+    change = BalanceChange.from_transactions(
+        TransactionInput(transactionId="txn1", userId="user1", amount=1.0, timestamp="2024-01-01T00:00:00"),
+        TransactionInput(
+            transactionId="txn2", userId="user1", amount=1.0, timestamp="2024-01-01T02:00:00+01:00"
+        ),
+    )
+
+    assert change.first_transaction_at == datetime(2024, 1, 1, 0, 0)
+    assert change.last_transaction_at == datetime(2024, 1, 1, 1, 0)
+
+
+def test_add_transactions_batch_too_large(client, fake_db):
+    """Test that a batch above the maximum length is refused before anything is read or written."""
+    transaction = {
+        "transactionId": "txn",
+        "userId": "user1",
+        "amount": 1.0,
+        "timestamp": "2024-01-01T00:00:00",
+    }
+
+    response = client.post("/transactions/batch", json=[transaction] * 1001)
+
+    assert response.status_code == 422
+    fake_db.users_collection.find.assert_not_called()
+
+
+def test_add_transactions_batch_duplicates(client, fake_db):
+    """
+    Test the add_transactions endpoint to ensure already stored ids and ids repeated inside the batch
+    are reported as replays or conflicts and applied only once.
+    """
+    transactions_data = [
+        {"transactionId": "txn1", "userId": "user1", "amount": 10.0, "timestamp": "2023-12-12T10:00:00"},
+        {"transactionId": "txn2", "userId": "user1", "amount": 20.0, "timestamp": "2023-12-12T10:01:00"},
+        {"transactionId": "txn2", "userId": "user1", "amount": 20.0, "timestamp": "2023-12-12T10:01:00"},
+        {"transactionId": "txn3", "userId": "user1", "amount": 30.0, "timestamp": "2023-12-12T10:02:00"},
+    ]
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find.side_effect = [[{"user_id": "user1", "balance": 0.0}], []]
+    user_collection.bulk_write.return_value.matched_count = 1
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.find.return_value = [
+        {
+            "transaction_id": "txn1",
+            "user_id": "user1",
+            "amount": 10.0,
+            "timestamp": datetime(2023, 12, 12, 10, 0, 0),
+        },
+        {
+            "transaction_id": "txn3",
+            "user_id": "user1",
+            "amount": 99.0,
+            "timestamp": datetime(2023, 12, 12, 10, 2, 0),
+        },
+    ]
+
+    response = client.post("/transactions/batch", json=transactions_data)
+
+    assert response.status_code == 200, response.text
+    assert response.json() == {
+        "succeeded": 3,
+        "failed": 1,
+        "results": [
+            {"transactionId": "txn1", "success": True, "detail": "Transaction already processed"},
+            {"transactionId": "txn2", "success": True, "detail": None},
+            {"transactionId": "txn2", "success": True, "detail": "Transaction already processed"},
+            {
+                "transactionId": "txn3",
+                "success": False,
+                "detail": "Transaction with id 'txn3' already exists with different data",
+            },
+        ],
+    }
+    assert [row["transaction_id"] for row in transaction_collection.insert_many.call_args.args[0]] == ["txn2"]
+
+
+def test_add_transactions_batch_insert_race(client, fake_db):
+    """
+    Test the add_transactions endpoint to ensure rows that lose an insert race have their balance change
+    reverted and are answered from the stored row.
+    """
+    transactions_data = [
+        {"transactionId": "txn1", "userId": "user1", "amount": 10.0, "timestamp": "2023-12-12T10:00:00"},
+        {"transactionId": "txn2", "userId": "user1", "amount": 20.0, "timestamp": "2023-12-12T10:01:00"},
+    ]
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find.side_effect = [[{"user_id": "user1", "balance": 0.0}], []]
+    user_collection.bulk_write.return_value.matched_count = 1
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.find.side_effect = [
+        [],
+        [
+            {
+                "transaction_id": "txn2",
+                "user_id": "user1",
+                "amount": 20.0,
+                "timestamp": datetime(2023, 12, 12, 10, 1, 0),
+            }
+        ],
+    ]
+    transaction_collection.insert_many.side_effect = BulkWriteError(
+        {"writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}]}
+    )
+
+    response = client.post("/transactions/batch", json=transactions_data)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["results"] == [
+        {"transactionId": "txn1", "success": True, "detail": None},
+        {"transactionId": "txn2", "success": True, "detail": "Transaction already processed"},
+    ]
+    user_collection.update_one.assert_called_once_with(
+        {"user_id": "user1"},
+        {
+            "$inc": {
+                "balance": -30.0,
+                "transaction_count": -2,
+                "total_credits": -30.0,
+                "total_debits": -0.0,
+                "version": 1,
+            }
+        },
+    )
+    assert user_collection.find_one_and_update.call_args.args[1]["$inc"]["balance"] == 10.0
+    transaction_collection.delete_one.assert_not_called()
+
+
+def test_add_transactions_batch_insert_failure_rechecks_user(client, fake_db):
+    """
+    Test the add_transactions endpoint to ensure a debit that relied on a credit whose insert failed is
+    deleted again instead of overdrawing the account.
+    """
+    transactions_data = [
+        {"transactionId": "txn1", "userId": "user1", "amount": 50.0, "timestamp": "2023-12-12T10:00:00"},
+        {"transactionId": "txn2", "userId": "user1", "amount": -30.0, "timestamp": "2023-12-12T10:01:00"},
+    ]
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find.side_effect = [[{"user_id": "user1", "balance": 0.0}], []]
+    user_collection.bulk_write.return_value.matched_count = 1
+    user_collection.find_one_and_update.return_value = None
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.find.side_effect = [[], []]
+
+    def insert_many(documents, ordered):
+        # Like pymongo, assigns the ids of the documents before the server rejects one of them.
+        for document in documents:
+            document["_id"] = ObjectId()
+        raise BulkWriteError(
+            {"writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]}
+        )
+
+    transaction_collection.insert_many.side_effect = insert_many
+
+    response = client.post("/transactions/batch", json=transactions_data)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["results"] == [
+        {"transactionId": "txn1", "success": False, "detail": "Document failed validation"},
+        {
+            "transactionId": "txn2",
+            "success": False,
+            "detail": "User with id 'user1' has insufficient balance",
+        },
+    ]
+    assert user_collection.update_one.call_args.args[1]["$inc"]["balance"] == -20.0
+    assert user_collection.find_one_and_update.call_args.args[0] == {
+        "user_id": "user1",
+        "balance": {"$gte": 30.0},
+    }
+    inserted = transaction_collection.insert_many.call_args.args[0]
+    transaction_collection.delete_one.assert_called_once_with({"_id": inserted[1]["_id"]})
+
+
+def test_add_transactions_batch_nothing_accepted(client, fake_db):
+    """
+    Test the add_transactions endpoint to ensure nothing is written when every row is rejected.
+    """
+    transactions_data = [
+        {"transactionId": "txn1", "userId": "user1", "amount": -10.0, "timestamp": "2023-12-12T10:00:00"},
+    ]
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find.return_value = [{"user_id": "user1", "balance": 0.0}]
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+
+    response = client.post("/transactions/batch", json=transactions_data)
+
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 0
+    transaction_collection.insert_many.assert_not_called()
+    user_collection.bulk_write.assert_not_called()
+
+
+def test_add_transactions_batch_concurrent_balance_change(client, fake_db):
+    """
+    Test the add_transactions endpoint to ensure rows of a user whose balance changed
+    concurrently are rejected instead of overdrawing the account.
+    """
+    transactions_data = [
+        {"transactionId": "txn1", "userId": "user1", "amount": -80.0, "timestamp": "2023-12-12T10:00:00"},
+        {"transactionId": "txn2", "userId": "user2", "amount": -10.0, "timestamp": "2023-12-12T10:01:00"},
+        {"transactionId": "txn3", "userId": "user1", "amount": 5.0, "timestamp": "2023-12-12T10:02:00"},
+    ]
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find.side_effect = [
+        [{"user_id": "user1", "balance": 100.0}, {"user_id": "user2", "balance": 100.0}],
+        [{"user_id": "user2"}],
+        [],
+    ]
+    user_collection.bulk_write.return_value.matched_count = 1
+    user_collection.find_one_and_update.side_effect = [None, {"balance": 60.0}]
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+
+    response = client.post("/transactions/batch", json=transactions_data)
+
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 2
+    assert response.json()["results"][0] == {
+        "transactionId": "txn1",
+        "success": False,
+        "detail": "User with id 'user1' has insufficient balance",
+    }
+    # The rows of user1 are re-checked one by one, so the credit still goes through.
+    assert [update.args[0] for update in user_collection.find_one_and_update.call_args_list] == [
+        {"user_id": "user1", "balance": {"$gte": 80.0}},
+        {"user_id": "user1"},
     ]
+    rows = transaction_collection.insert_many.call_args.args[0]
+    assert [row["transaction_id"] for row in rows] == ["txn2", "txn3"]
+
+
+def test_list_transactions_keyset_pagination(client, fake_db):
+    """
+    Test the list_transactions endpoint to ensure pages are sorted on (timestamp, _id) in the requested
+    order and the returned cursor continues strictly after the last row of the page.
+    """
+    transactions = [
+        {
+            "_id": ObjectId("65a000000000000000000001"),
+            "transaction_id": "txn2",
+            "user_id": "user123",
+            "amount": -50.0,
+            "timestamp": datetime(2023, 12, 11, 15, 30, 0),
+        },
+        {
+            "_id": ObjectId("65a000000000000000000002"),
+            "transaction_id": "txn1",
+            "user_id": "user123",
+            "amount": 100.0,
+            "timestamp": datetime(2023, 12, 10, 10, 0, 0),
+        },
+    ]
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.find.return_value = transactions
+
+    response = client.get("/transactions", params={"userId": "user123", "limit": 1, "order": "desc"})
+
+    assert response.status_code == 200
+    assert [item["transactionId"] for item in response.json()["items"]] == ["txn2"]
+    assert transaction_collection.find.call_args.kwargs["sort"] == [("timestamp", -1), ("_id", -1)]
+    assert transaction_collection.find.call_args.kwargs["limit"] == 2
+
+    response = client.get(
+        "/transactions",
+        params={"userId": "user123", "limit": 1, "order": "desc", "cursor": response.json()["nextCursor"]},
+    )
+
+    assert transaction_collection.find.call_args.args[0] == {
+        "$and": [
+            {"user_id": {"$eq": "user123"}},
+            {
+                "$or": [
+                    {"timestamp": {"$lt": datetime(2023, 12, 11, 15, 30, 0)}},
+                    {
+                        "timestamp": datetime(2023, 12, 11, 15, 30, 0),
+                        "_id": {"$lt": ObjectId("65a000000000000000000001")},
+                    },
+                ]
+            },
+        ]
+    }
+
+
+@pytest.mark.parametrize("cursor", [encode_cursor("2023-12-11", "65a0"), "W3siJG9pZCI6IDV9XQ=="])
+def test_get_transactions_forged_cursor(client, cursor):
+    """Test that a cursor whose keyset values have the wrong types is rejected with a 400 error."""
+    response = client.get("/transactions", params={"userId": "user123", "cursor": cursor})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid pagination cursor"}
+
+
+def test_export_transactions_ndjson(mocker, client, fake_db):
+    """
+    Test the export_transactions endpoint to ensure rows are streamed from the cursor as NDJSON
+    using the configured batch size.
+    """
+    mocker.patch("transaction_api.api.transactions.settings.export_batch_size", 2)
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.find.return_value = [
+        {
+            "transaction_id": f"txn{index}",
+            "user_id": "user123",
+            "amount": 10.0 * index,
+            "timestamp": datetime(2023, 12, 10, 10, index),
+        }
+        for index in range(3)
+    ]
+
+    response = client.get("/transactions/export", params={"userId": "user123"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert len(lines) == 3
+    assert json.loads(lines[2]) == {
+        "transactionId": "txn2",
+        "userId": "user123",
+        "amount": 20.0,
+        "timestamp": "2023-12-10T10:02:00",
+    }
+    assert transaction_collection.find.call_args.kwargs["batch_size"] == 2
+    assert "limit" not in transaction_collection.find.call_args.kwargs
+
+
+def test_export_transactions_csv(client, fake_db):
+    """
+    Test the export_transactions endpoint to ensure the CSV export starts with a header row.
+    """
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.find.return_value = [
+        {
+            "transaction_id": "txn1",
+            "user_id": "user123",
+            "amount": 100.0,
+            "timestamp": datetime(2023, 12, 10, 10, 0, 0),
+        }
+    ]
+
+    response = client.get("/transactions/export", params={"userId": "user123", "format": "csv"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.splitlines() == [
+        "transactionId,userId,amount,timestamp",
+        "txn1,user123,100.0,2023-12-10T10:00:00",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_export_rows_yields_one_chunk_per_batch():
+    """
+    Test that exported rows are flushed once per batch instead of being collected in memory.
+    """
+
+    async def transactions():
+        for index in range(5):
+            yield {
+                "transaction_id": f"txn{index}",
+                "user_id": "user123",
+                "amount": 1.0,
+                "timestamp": datetime(2023, 12, 10, 10, index),
+            }
+
+    chunks = [chunk async for chunk in export_rows(transactions(), "ndjson", chunk_size=2)]
+
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 1]
+
+
+def test_list_transactions_raw_responses(mocker, client, fake_db):
+    """
+    Test the list_transactions endpoint to ensure the raw serialization mode renders Mongo documents
+    straight to the same wire format as the model path.
+    """
+    transactions = [
+        {
+            "_id": ObjectId("65a000000000000000000001"),
+            "transaction_id": "txn1",
+            "user_id": "user123",
+            "amount": 100.0,
+            "timestamp": datetime(2023, 12, 10, 10, 0, 0, 123000),
+        }
+    ]
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+    transaction_collection.find.return_value = transactions
+    model_response = client.get("/transactions", params={"userId": "user123"})
+
+    mocker.patch("transaction_api.api.transactions.settings.raw_responses", True)
+    model_validate = mocker.spy(TransactionOut, "model_validate")
+    raw_response = client.get("/transactions", params={"userId": "user123"})
+
+    assert raw_response.status_code == 200
+    assert raw_response.headers["content-type"] == "application/json"
+    assert raw_response.json() == model_response.json()
+    model_validate.assert_not_called()
+
+
+def test_raw_dumps_without_orjson_matches_orjson(mocker):
+    """
+    Test that the stdlib fallback of the raw encoder produces the same JSON as orjson.
+    """
+    value = {"userId": "user1", "amount": 1.5, "timestamp": datetime(2023, 12, 10, 10, 0, 0, 123000)}
+    fast = raw.dumps(value)
+
+    mocker.patch.object(raw, "orjson", None)
+
+    assert (
+        raw.dumps(value)
+        == fast
+        == b'{"userId":"user1","amount":1.5,"timestamp":"2023-12-10T10:00:00.123000"}'
+    )
+
+
+def test_add_transaction_ignores_cached_balance(client, fake_db):
+    """
+    Test the add_transaction endpoint to ensure a cached user balance never approves a debit.
+    """
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one.return_value = {
+        "_id": "test_id",
+        "user_id": "test123",
+        "name": "Alice",
+        "email": "alice@example.com",
+        "created_at": datetime(2023, 12, 1),
+        "balance": 1000.0,
+    }
+    assert client.get("/users/test123").status_code == 200
+    user_collection.find_one_and_update.return_value = None
+
+    response = client.post(
+        "/transactions",
+        json={
+            "transactionId": "txn1",
+            "userId": "test123",
+            "amount": -500.0,
+            "timestamp": "2023-12-12T10:00:00",
+        },
+    )
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "User with id 'test123' has insufficient balance"}
+
+
+@pytest.mark.asyncio
+async def test_group_commit_coalesces_concurrent_transactions(mocker):
+    """Test that concurrent writes share one batch and each caller gets the outcome of its own transaction."""
+    batches = []
+
+    async def add_transactions(transactions):
+        batches.append([transaction.transaction_id for transaction in transactions])
+        return TransactionBatchOut(
+            succeeded=2,
+            failed=1,
+            results=[
+                TransactionBatchResult(transactionId="txn1", success=True),
+                TransactionBatchResult(
+                    transactionId="txn2", success=True, detail="Transaction already processed"
+                ),
+                TransactionBatchResult(
+                    transactionId="txn3",
+                    success=False,
+                    detail="User with id 'user2' has insufficient balance",
+                ),
+            ],
+        )
+
+    mocker.patch.object(group_commit_module.transaction_repo, "add_transactions", add_transactions)
+    group_commit = GroupCommit(flush_size=3, flush_interval_ms=1000, max_queue_depth=10)
+    transactions = [
+        TransactionInput(
+            transactionId=f"txn{index}", userId=user_id, amount=-5.0, timestamp=datetime(2024, 1, 1)
+        )
+        for index, user_id in ((1, "user1"), (2, "user1"), (3, "user2"))
+    ]
+
+    outcomes = await asyncio.gather(
+        *(group_commit.add_transaction(transaction) for transaction in transactions), return_exceptions=True
+    )
+    await group_commit.close()
+
+    assert batches == [["txn1", "txn2", "txn3"]]
+    assert outcomes[:2] == [True, False]
+    assert isinstance(outcomes[2], InsufficientBalance)
+    assert group_commit_metrics.batch_size.counts[bisect_left(SIZE_BUCKETS, 3)] >= 1
+
+
+@pytest.mark.asyncio
+async def test_group_commit_rejects_when_queue_is_full():
+    """Test that writes are refused with a 503 once the queue is at its maximum depth."""
+    group_commit = GroupCommit(flush_size=10, flush_interval_ms=1000, max_queue_depth=0)
+    transaction = TransactionInput(
+        transactionId="txn1", userId="user1", amount=5.0, timestamp=datetime(2024, 1, 1)
+    )
+
+    with pytest.raises(WriteQueueFull) as error:
+        await group_commit.add_transaction(transaction)
+
+    assert error.value.status_code == 503
+
+
+def test_add_transaction_group_commit(mocker, client, fake_db):
+    """Test that the endpoint answers after the group commit wrote the transaction through the batch path."""
+    mocker.patch("transaction_api.api.transactions.settings.group_commit", True)
+    mocker.patch.object(group_commit_module.group_commit, "flush_interval", 0.001)
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find.side_effect = [[{"user_id": "user1", "balance": 10.0}], []]
+    user_collection.bulk_write.return_value.matched_count = 1
+    transaction_collection = fake_db.database.get_collection(Transaction.collection_name)
+
+    response = client.post(
+        "/transactions",
+        json={"transactionId": "txn1", "userId": "user1", "amount": 5.0, "timestamp": "2024-01-01T00:00:00"},
+    )
+
+    assert response.status_code == 201, response.text
+    transaction_collection.insert_many.assert_called_once()
+
+
+@pytest.fixture
+def monthly_partitions(mocker, fake_db):
+    mocker.patch.object(partitions.settings, "transaction_partitioning", "month")
+    fake_db.list_collection_names = mocker.MagicMock(
+        return_value=["transactions_2023_11", "transactions_2023_12", "transactions_2024_01", "transactions"]
+    )
+    fake_db.drop_collection = mocker.MagicMock()
+    return fake_db
+
+
+def test_add_transaction_partitioned(client, monthly_partitions):
+    """
+    Test that a transaction is checked for replays across the partitions, has its id reserved and is
+    stored in the partition of its month.
+    """
+    fake_db = monthly_partitions
+    fake_db.users_collection.find_one_and_update.return_value = {"balance": 300.0}
+    reservations = fake_db.database.get_collection(TransactionId.collection_name)
+    reservations.find.return_value = []
+    partition = fake_db.database.get_collection("transactions_2024_01")
+
+    response = client.post(
+        "/transactions",
+        json={
+            "transactionId": "txn1",
+            "userId": "user123",
+            "amount": 10.0,
+            "timestamp": "2024-01-31T23:30:00Z",
+        },
+    )
+
+    assert response.status_code == 201
+    assert reservations.find.call_args.args[0] == {"transaction_id": {"$in": ["txn1"]}}
+    partition.find.assert_not_called()
+    partition.create_indexes.assert_called_once_with(Transaction.indexes)
+    reservations.insert_one.assert_called_once_with(
+        {"transaction_id": "txn1", "timestamp": datetime.fromisoformat("2024-01-31T23:30:00+00:00")},
+        session=None,
+    )
+    partition.insert_one.assert_called_once()
+    fake_db.transactions_collection.insert_one.assert_not_called()
+
+
+def test_add_transaction_partitioned_id_reused_in_another_month(client, monthly_partitions):
+    """
+    Test that an id stored in one partition is recognised when reused with a timestamp in another month.
+    """
+    fake_db = monthly_partitions
+    reservations = fake_db.database.get_collection(TransactionId.collection_name)
+    reservations.find.return_value = [{"transaction_id": "txn1", "timestamp": datetime(2023, 12, 31, 23, 30)}]
+    december = fake_db.database.get_collection("transactions_2023_12")
+    december.find.return_value = [
+        {
+            "transaction_id": "txn1",
+            "user_id": "user123",
+            "amount": 10.0,
+            "timestamp": datetime(2023, 12, 31, 23, 30),
+        }
+    ]
+    transaction = {"transactionId": "txn1", "userId": "user123", "amount": 10.0}
+
+    response = client.post("/transactions", json={**transaction, "timestamp": "2024-01-01T00:30:00"})
+
+    assert response.status_code == 409
+    assert december.find.call_args.args[0] == {"transaction_id": {"$in": ["txn1"]}}
+    fake_db.users_collection.find_one_and_update.assert_not_called()
+    fake_db.database.get_collection("transactions_2024_01").insert_one.assert_not_called()
+
+    response = client.post("/transactions", json={**transaction, "timestamp": "2023-12-31T23:30:00"})
+
+    assert response.status_code == 201
+    assert response.headers["Idempotent-Replayed"] == "true"
+
+    december.find.return_value = []
+    response = client.post("/transactions", json={**transaction, "timestamp": "2023-12-31T23:30:00"})
+
+    # The reservation outlives a dropped or archived row, so the id is never applied again.
+    assert response.status_code == 409
+    fake_db.users_collection.find_one_and_update.assert_not_called()
+
+
+def test_list_transactions_partitioned(client, monthly_partitions):
+    """Test that a listing reads only the partitions of its range, newest first for a descending order."""
+    fake_db = monthly_partitions
+    december = fake_db.database.get_collection("transactions_2023_12")
+    january = fake_db.database.get_collection("transactions_2024_01")
+    january.find.return_value = [
+        {
+            "_id": ObjectId(),
+            "transaction_id": "txn2",
+            "user_id": "user123",
+            "amount": 5.0,
+            "timestamp": datetime(2024, 1, 2),
+        }
+    ]
+    december.find.return_value = [
+        {
+            "_id": ObjectId(),
+            "transaction_id": "txn1",
+            "user_id": "user123",
+            "amount": 10.0,
+            "timestamp": datetime(2023, 12, 30),
+        }
+    ]
+
+    response = client.get(
+        "/transactions",
+        params={
+            "userId": "user123",
+            "startDate": "2023-12-15",
+            "endDate": "2024-01-10",
+            "order": "desc",
+            "limit": 2,
+        },
+    )
+
+    assert response.status_code == 200
+    assert [item["transactionId"] for item in response.json()["items"]] == ["txn2", "txn1"]
+    assert january.find.call_args.kwargs["limit"] == 3
+    assert december.find.call_args.kwargs["limit"] == 2
+    fake_db.database.get_collection("transactions_2023_11").find.assert_not_called()
+    fake_db.transactions_collection.find.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_drop_partition(db_service, monthly_partitions):
+    """Test that only an existing month partition is dropped."""
+    assert await partitions.drop_partition(datetime(2023, 12, 1))
+    monthly_partitions.drop_collection.assert_called_once_with("transactions_2023_12")
+    assert not await partitions.drop_partition(datetime(2022, 1, 1))
+    assert monthly_partitions.drop_collection.call_count == 1
+
+
+def test_list_transactions_reads_archive_first(mocker, client, fake_db):
+    """Test that an ascending listing reaching before the watermark continues from the archive into MongoDB."""
+    mocker.patch.object(archive, "watermark", mocker.AsyncMock(return_value=datetime(2024, 1, 1)))
+    archived = mocker.patch.object(
+        archive,
+        "find_transactions",
+        mocker.AsyncMock(
+            return_value=[
+                {
+                    "_id": ObjectId(),
+                    "transaction_id": "txn1",
+                    "user_id": "user123",
+                    "amount": 10.0,
+                    "timestamp": datetime(2023, 12, 30),
+                }
+            ]
+        ),
+    )
+    fake_db.transactions_collection.find.return_value = [
+        {
+            "_id": ObjectId(),
+            "transaction_id": "txn2",
+            "user_id": "user123",
+            "amount": 5.0,
+            "timestamp": datetime(2024, 1, 2),
+        }
+    ]
+
+    response = client.get(
+        "/transactions", params={"userId": "user123", "startDate": "2023-12-15", "limit": 5}
+    )
+
+    assert response.status_code == 200
+    assert [item["transactionId"] for item in response.json()["items"]] == ["txn1", "txn2"]
+    archived.assert_awaited_once_with("user123", datetime(2023, 12, 15), None, None, "asc", 6)
+    find = fake_db.transactions_collection.find.call_args
+    assert find.args[0] == {
+        "$and": [
+            {"user_id": {"$eq": "user123"}, "timestamp": {"$gte": datetime(2023, 12, 15)}},
+            {"timestamp": {"$gte": datetime(2024, 1, 1)}},
+        ]
+    }
+    assert find.kwargs["limit"] == 5
+
+
+def test_add_transaction_refused_before_archive_watermark(mocker, client, fake_db):
+    """Test that archived months, and months an archive run is moving, do not accept new transactions."""
+    mocker.patch.object(archive, "frozen_before", mocker.AsyncMock(return_value=datetime(2024, 1, 1)))
+
+    response = client.post(
+        "/transactions",
+        json={
+            "transactionId": "txn1",
+            "userId": "user123",
+            "amount": 10.0,
+            "timestamp": "2023-12-31T23:00:00",
+        },
+    )
+
+    assert response.status_code == 409
+    assert response.json() == {"detail": "Transaction with id 'txn1' is older than the archived history"}
+    fake_db.users_collection.find_one_and_update.assert_not_called()
+    fake_db.transactions_collection.insert_one.assert_not_called()
+
+
+def test_list_transactions_not_modified(client, fake_db):
+    """Test that a listing is tagged with the user's version and a matching If-None-Match skips the query."""
+    user_id = ObjectId()
+    fake_db.users_collection.find_one.return_value = {"_id": user_id, "version": 3}
+    fake_db.transactions_collection.find.return_value = []
+
+    response = client.get("/transactions", params={"userId": "user123"})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'W/"{user_id}.3"'
+    assert response.headers["cache-control"] == "no-cache"
+
+    fake_db.transactions_collection.find.reset_mock()
+    response = client.get(
+        "/transactions", params={"userId": "user123"}, headers={"If-None-Match": response.headers["etag"]}
+    )
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == f'W/"{user_id}.3"'
+    fake_db.transactions_collection.find.assert_not_called()
+
+    fake_db.users_collection.find_one.return_value = {"_id": user_id, "version": 4}
+    response = client.get(
+        "/transactions", params={"userId": "user123"}, headers={"If-None-Match": f'"{user_id}.3"'}
+    )
+    assert response.status_code == 200
+
+
+def _stored(transaction_id: str, user_id: str = "user1") -> dict:
+    return {
+        "_id": ObjectId(),
+        "transaction_id": transaction_id,
+        "user_id": user_id,
+        "amount": 10.0,
+        "timestamp": datetime(2024, 1, 1),
+    }
+
+
+@pytest.mark.asyncio
+async def test_add_transaction_publishes_to_feed(db_service, fake_db):
+    """Test that committed transactions, single or batched, reach the live feed of their user only."""
+    fake_db.users_collection.find_one_and_update.return_value = {"balance": 0.0}
+    fake_db.users_collection.find.return_value = [
+        {
+            "user_id": "user1",
+            "balance": 10.0,
+            "transaction_count": 1,
+            "total_credits": 10.0,
+            "total_debits": 0.0,
+            "first_transaction_at": datetime(2024, 1, 1),
+            "last_transaction_at": datetime(2024, 1, 1),
+        }
+    ]
+    fake_db.users_collection.bulk_write.return_value.matched_count = 1
+    fake_db.transactions_collection.find.return_value = []
+    transaction = TransactionInput(
+        transactionId="txn1", userId="user1", amount=10.0, timestamp=datetime.now()
+    )
+    other = TransactionInput(transactionId="txn2", userId="user2", amount=10.0, timestamp=datetime.now())
+    batched = TransactionInput(transactionId="txn3", userId="user1", amount=5.0, timestamp=datetime.now())
+
+    with transaction_broker.subscribe("user1", 10) as subscription:
+        assert await transaction_repo.add_transaction(transaction)
+        await transaction_repo.add_transactions([other, batched])
+        transaction_broker.close()
+
+        assert (await subscription.get())["transaction_id"] == "txn1"
+        assert (await subscription.get())["transaction_id"] == "txn3"
+        assert await subscription.get() is None
+
+
+@pytest.mark.asyncio
+async def test_feed_buffer_overflow_ends_feed():
+    """Test that a full buffer cuts the feed off after what it holds instead of blocking the publisher."""
+    feed_metrics.clear()
+    with transaction_broker.subscribe("user1", 1) as subscription:
+        transaction_broker.publish([_stored("txn1"), _stored("txn2")])
+
+        assert feed_metrics.overflows == 1
+        assert feed_metrics.subscribers == 1
+        assert (await subscription.get())["transaction_id"] == "txn1"
+        assert await subscription.get() is None
+    assert feed_metrics.subscribers == 0
+
+
+@pytest.mark.asyncio
+async def test_follow_resumes_from_last_event(mocker, db_service, fake_db):
+    """Test that a resumed feed first reads the gap once, then skips live duplicates and sends heartbeats."""
+    mocker.patch.object(feed.settings, "feed_heartbeat_seconds", 0.01)
+    last, missed = _stored("txn1"), _stored("txn2")
+    fake_db.transactions_collection.find.return_value = [missed]
+    follow = feed.follow("user1", last["_id"])
+
+    assert await anext(follow) == missed
+    fake_db.transactions_collection.find.assert_called_once_with(
+        {
+            "user_id": "user1",
+            "_id": {"$gte": ObjectId.from_datetime(last["_id"].generation_time), "$ne": last["_id"]},
+        },
+        projection=transaction_repo.TRANSACTION_OUT_PROJECTION,
+        sort=[("_id", 1)],
+        limit=1001,
+    )
+    live = _stored("txn3")
+    transaction_broker.publish([missed, live])
+    assert await anext(follow) == live
+    assert await anext(follow) is None
+    await follow.aclose()
+
+
+@pytest.mark.asyncio
+async def test_follow_ends_after_a_buffer_of_gap(mocker, db_service, fake_db):
+    """Test that a gap longer than the feed buffer is sent a buffer at a time, ending the feed after each."""
+    mocker.patch.object(feed.settings, "feed_buffer_size", 2)
+    last, *missed = [_stored(f"txn{index}") for index in range(4)]
+    fake_db.transactions_collection.find.return_value = missed
+
+    sent = [transaction async for transaction in feed.follow("user1", last["_id"])]
+
+    assert sent == missed[:2]
+    assert fake_db.transactions_collection.find.call_args.kwargs["limit"] == 3
+    assert feed_metrics.subscribers == 0
+
+
+@pytest.mark.asyncio
+async def test_sse_events():
+    """Test that transactions are sent as identified events and heartbeats as comments."""
+    transaction = _stored("txn1")
+
+    async def transactions():
+        yield transaction
+        yield None
+
+    events = [event async for event in sse_events(transactions())]
+
+    assert events == [
+        b"retry: 1000\n\n",
+        f"id: {transaction['_id']}\nevent: transaction\ndata: ".encode()
+        + b'{"transactionId":"txn1","userId":"user1","amount":10.0,"timestamp":"2024-01-01T00:00:00"}\n\n',
+        b": keepalive\n\n",
+    ]
+
+
+def test_stream_transactions_rejects_unknown_user_and_event_id(client, fake_db):
+    """Test that the stream is refused before it opens for an unknown user or a malformed event id."""
+    fake_db.users_collection.find_one.return_value = None
+    response = client.get("/transactions/stream", params={"userId": "user1"})
+    assert response.status_code == 404
+    assert response.json() == {"detail": "User with id 'user1' not found"}
+
+    response = client.get(
+        "/transactions/stream", params={"userId": "user1"}, headers={"Last-Event-ID": "nope"}
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid last event id"}
+
+
+def test_stream_transactions_websocket(mocker, client, fake_db):
+    """Test that the WebSocket feed resumes from the last event and sends heartbeats while idle."""
+    mocker.patch.object(feed.settings, "feed_heartbeat_seconds", 0.01)
+    fake_db.users_collection.find_one.return_value = {"_id": ObjectId()}
+    missed = _stored("txn2")
+    fake_db.transactions_collection.find.return_value = [missed]
+
+    with client.websocket_connect(f"/transactions/stream?userId=user1&lastEventId={ObjectId()}") as websocket:
+        assert websocket.receive_json() == {
+            "event": "transaction",
+            "id": str(missed["_id"]),
+            "transaction": {
+                "transactionId": "txn2",
+                "userId": "user1",
+                "amount": 10.0,
+                "timestamp": "2024-01-01T00:00:00",
+            },
+        }
+        assert websocket.receive_json() == {"event": "heartbeat"}
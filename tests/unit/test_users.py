@@ -1,7 +1,16 @@
 from datetime import datetime
+
+import pytest
+from bson import ObjectId
 from freezegun import freeze_time
 
+from transaction_api.models.purge import UserPurge
+from transaction_api.models.rollup import TransactionRollup
+from transaction_api.models.transaction import Transaction
 from transaction_api.models.user import User
+from transaction_api.repository import purges as purge_repo
+from transaction_api.repository.pagination import encode_cursor
+from transaction_api.services.cache import user_cache
 from .user_data import test_user_1, test_user_1_json, test_user_2, test_user_2_json
 
 
@@ -81,10 +90,60 @@ def test_get_users(client, fake_db):
     response = client.get("/users")
 
     assert response.status_code == 200
-    assert response.json() == [
-        test_user_1_json,
-        test_user_2_json,
-    ]
+    assert response.json() == {
+        "items": [
+            test_user_1_json,
+            test_user_2_json,
+        ],
+        "nextCursor": None,
+    }
+
+
+def test_get_users_paginated(client, fake_db):
+    """Test paging through users with a limit and the returned cursor.
+
+    Ensures only one page plus a look-ahead row is requested and the cursor resumes after the last user.
+    """
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find.return_value = [test_user_1, test_user_2]
+
+    response = client.get("/users", params={"limit": 1})
+
+    assert response.status_code == 200
+    assert response.json()["items"] == [test_user_1_json]
+    next_cursor = response.json()["nextCursor"]
+    assert user_collection.find.call_args.kwargs["limit"] == 2
+    assert user_collection.find.call_args.kwargs["sort"] == [("user_id", 1)]
+
+    user_collection.find.return_value = [test_user_2]
+    response = client.get("/users", params={"limit": 1, "cursor": next_cursor})
+
+    assert response.json() == {"items": [test_user_2_json], "nextCursor": None}
+    assert user_collection.find.call_args.args[0] == {"user_id": {"$gt": "user1"}}
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not-a-cursor",
+        # [{"$oid": 5}]: valid base64 and JSON, but not an ObjectId.
+        "W3siJG9pZCI6IDV9XQ==",
+    ],
+)
+def test_get_users_invalid_cursor(client, cursor):
+    """Test that a malformed cursor is rejected with a 400 error."""
+    response = client.get("/users", params={"cursor": cursor})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid pagination cursor"}
+
+
+def test_get_users_forged_cursor(client):
+    """Test that a well-formed cursor holding a value of the wrong type is rejected with a 400 error."""
+    response = client.get("/users", params={"cursor": encode_cursor({"$ne": None})})
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid pagination cursor"}
 
 
 def test_get_user_by_id(client, fake_db):
@@ -114,21 +173,30 @@ def test_get_user_not_found(client, fake_db):
 
     assert response.status_code == 404
     assert response.json() == {"detail": "User with id 'nonexistent' not found"}
+    assert user_cache._pending == {}
 
 
-def test_delete_user_success(client, fake_db):
+def test_delete_user_success(mocker, client, fake_db):
     """Test deleting an existing user.
 
-    Verifies the endpoint successfully deletes a user when the user exists in the database.
+    Verifies the endpoint deletes the user with a single conditional delete and
+    schedules the purge of its transactions in the background.
     """
+    schedule_purge = mocker.patch("transaction_api.repository.purges.schedule_purge")
     user_collection = fake_db.database.get_collection(User.collection_name)
-    user_collection.find_one.return_value = {"_id": "existing_id"}
-    user_collection.delete_one.return_value = None
+    user_collection.delete_one.return_value.deleted_count = 1
+    purges = fake_db.database.get_collection(UserPurge.collection_name)
 
     response = client.delete("/users/user1")
 
     assert response.status_code == 200
     assert response.json() == {"success": True, "message": "User deleted successfully."}
+    user_collection.delete_one.assert_called_once_with({"user_id": "user1"})
+    user_collection.find_one.assert_not_called()
+    assert purges.update_one.call_args.args[0] == {"user_id": "user1"}
+    assert purges.update_one.call_args.args[1]["$set"]["status"] == "pending"
+    assert purges.update_one.call_args.kwargs["upsert"] is True
+    schedule_purge.assert_called_once_with("user1")
 
 
 def test_delete_user_not_found(client, fake_db):
@@ -137,9 +205,140 @@ def test_delete_user_not_found(client, fake_db):
     Ensures the endpoint returns a 404 error if the user to be deleted does not exist.
     """
     user_collection = fake_db.database.get_collection(User.collection_name)
-    user_collection.find_one.return_value = None
+    user_collection.delete_one.return_value.deleted_count = 0
 
     response = client.delete("/users/nonexistent")
 
     assert response.status_code == 404
     assert response.json() == {"detail": "User with id 'nonexistent' not found"}
+    fake_db.database.get_collection(UserPurge.collection_name).update_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_purge_user_deletes_transactions_in_batches(mocker, db_service, fake_db):
+    """Test that a purge deletes the user's transactions in bounded batches and records its progress."""
+    mocker.patch.object(purge_repo.settings, "purge_batch_size", 2)
+    mocker.patch.object(purge_repo.settings, "purge_batch_pause_ms", 0)
+    cutoff = ObjectId()
+    purges = fake_db.database.get_collection(UserPurge.collection_name)
+    purges.find_one_and_update.return_value = {"_id": ObjectId(), "cutoff": cutoff}
+    transactions = fake_db.database.get_collection(Transaction.collection_name)
+    transactions.find.side_effect = [[{"_id": 1}, {"_id": 2}], [{"_id": 3}]]
+    transactions.delete_many.side_effect = [mocker.Mock(deleted_count=2), mocker.Mock(deleted_count=1)]
+
+    await purge_repo.purge_user("user1")
+
+    assert transactions.find.call_args.args[0] == {"user_id": "user1", "_id": {"$lte": cutoff}}
+    assert transactions.find.call_args.kwargs["limit"] == 2
+    assert [call.args[0] for call in transactions.delete_many.call_args_list] == [
+        {"_id": {"$in": [1, 2]}},
+        {"_id": {"$in": [3]}},
+    ]
+    progress, finished = purges.update_one.call_args_list[-3:-1], purges.update_one.call_args_list[-1]
+    assert [call.args[1]["$inc"] for call in progress] == [
+        {"purged_transactions": 2},
+        {"purged_transactions": 1},
+    ]
+    assert finished.args[0] == {"user_id": "user1", "cutoff": cutoff}
+    assert finished.args[1]["$set"]["status"] == "done"
+    fake_db.database.get_collection(TransactionRollup.collection_name).delete_many.assert_called_once_with(
+        {"user_id": "user1", "_id": {"$lte": cutoff}}
+    )
+
+
+@pytest.mark.asyncio
+async def test_purge_user_keeps_documents_of_recreated_user(db_service, fake_db):
+    """
+    Test that a purge running after the user was re-created under the same id only deletes the
+    transactions and derived documents written before the deletion.
+    """
+    cutoff = ObjectId()
+    purges = fake_db.database.get_collection(UserPurge.collection_name)
+    purges.find_one_and_update.return_value = {"_id": ObjectId(), "cutoff": cutoff}
+    fake_db.database.get_collection(Transaction.collection_name).find.return_value = []
+
+    await purge_repo.purge_user("user1")
+
+    assert fake_db.database.get_collection(Transaction.collection_name).find.call_args.args[0] == {
+        "user_id": "user1",
+        "_id": {"$lte": cutoff},
+    }
+    for model in purge_repo.DERIVED_MODELS:
+        fake_db.database.get_collection(model.collection_name).delete_many.assert_called_once_with(
+            {"user_id": "user1", "_id": {"$lte": cutoff}}
+        )
+
+
+def test_get_user_purge(client, fake_db):
+    """Test reading the progress of a purge."""
+    fake_db.database.get_collection(UserPurge.collection_name).find_one.return_value = {
+        "user_id": "user1",
+        "status": "running",
+        "purged_transactions": 2000,
+        "requested_at": datetime(2024, 12, 14, 19, 3, 9),
+        "updated_at": datetime(2024, 12, 14, 19, 3, 12),
+    }
+
+    response = client.get("/users/user1/purge")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "userId": "user1",
+        "status": "running",
+        "purgedTransactions": 2000,
+        "requestedAt": "2024-12-14T19:03:09",
+        "updatedAt": "2024-12-14T19:03:12",
+        "finishedAt": None,
+    }
+
+
+def test_get_user_purge_not_found(client, fake_db):
+    """Test that users without a purge return a 404."""
+    fake_db.database.get_collection(UserPurge.collection_name).find_one.return_value = None
+
+    response = client.get("/users/user1/purge")
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "No purge found for user with id 'user1'"}
+
+
+def test_get_users_raw_responses(mocker, client, fake_db):
+    """Test retrieving users with the raw serialization mode.
+
+    Ensures documents are renamed to the wire format without building response models.
+    """
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find.return_value = [
+        {**user, "created_at": datetime.fromisoformat(user["created_at"])}
+        for user in (test_user_1, test_user_2)
+    ]
+    mocker.patch("transaction_api.api.users.settings.raw_responses", True)
+
+    response = client.get("/users")
+
+    assert response.status_code == 200
+    assert response.json() == {"items": [test_user_1_json, test_user_2_json], "nextCursor": None}
+
+
+def test_get_user_by_id_is_cached(mocker, client, fake_db):
+    """Test that repeated lookups of the same user are served from the cache.
+
+    Ensures deleting the user invalidates the cached entry.
+    """
+    user_collection = fake_db.database.get_collection(User.collection_name)
+    user_collection.find_one.return_value = test_user_1
+    before = client.get("/monitoring/cache").json()["users"]
+
+    assert client.get("/users/user1").json() == test_user_1_json
+    assert client.get("/users/user1").json() == test_user_1_json
+    assert user_collection.find_one.call_count == 1
+    after = client.get("/monitoring/cache").json()["users"]
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
+    assert after["size"] == 1
+
+    mocker.patch("transaction_api.repository.purges.schedule_purge")
+    client.delete("/users/user1")
+    user_collection.find_one.return_value = None
+
+    assert client.get("/users/user1").status_code == 404
@@ -0,0 +1,46 @@
+from fastapi import Request, Response, status
+
+from transaction_api.exceptions import NotModified
+from transaction_api.repository import users as user_repo
+
+NOT_MODIFIED = {
+    str(status.HTTP_304_NOT_MODIFIED): {
+        "description": "The representation tagged by `If-None-Match` is still current",
+    }
+}
+
+
+def _weak(etag: str) -> str:
+    return etag.strip().removeprefix("W/")
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison: the same representation may be sent with different content encodings.
+    return any(tag.strip() == "*" or _weak(tag) == _weak(etag) for tag in if_none_match.split(","))
+
+
+def etag_version(etag: str | None) -> str | None:
+    """The user version an ETag of ``user_etag`` was made from."""
+    return etag and _weak(etag).strip('"')
+
+
+def etag_headers(etag: str | None) -> dict[str, str]:
+    # Clients may keep the response but must revalidate it before every use.
+    return {"ETag": etag, "Cache-Control": "no-cache"} if etag else {}
+
+
+async def user_etag(request: Request, response: Response) -> str | None:
+    """
+    Tags the response of a per-user read with the user's version and answers 304 without running the
+    endpoint when the client's copy is still current. The version is read before the data and a write
+    bumps it only once its rows are stored, so a write in between only makes the tag older than the
+    body, never newer. Cached bodies must be read again when their version is not the tag's.
+    """
+    user_id = request.path_params.get("userId") or request.query_params.get("userId")
+    if user_id is None or (version := await user_repo.get_user_version(user_id)) is None:
+        return None
+    etag = f'W/"{version}"'
+    if (if_none_match := request.headers.get("if-none-match")) and _matches(if_none_match, etag):
+        raise NotModified(etag)
+    response.headers.update(etag_headers(etag))
+    return etag
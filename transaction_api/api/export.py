@@ -0,0 +1,47 @@
+import csv
+from collections.abc import AsyncIterator
+from io import StringIO
+from typing import Literal
+
+from .raw import TRANSACTION_FIELDS, dumps, to_wire
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _ndjson(transactions: list[dict]) -> bytes:
+    return b"".join(dumps(to_wire(transaction, TRANSACTION_FIELDS)) + b"\n" for transaction in transactions)
+
+
+def _csv_rows(rows) -> bytes:
+    buffer = StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def _csv(transactions: list[dict]) -> bytes:
+    return _csv_rows(
+        [
+            [
+                transaction[field].isoformat() if field == "timestamp" else transaction[field]
+                for field in TRANSACTION_FIELDS
+            ]
+            for transaction in transactions
+        ]
+    )
+
+
+async def export_rows(transactions: AsyncIterator[dict], export_format: ExportFormat, chunk_size: int):
+    encode = _ndjson if export_format == "ndjson" else _csv
+    if export_format == "csv":
+        yield _csv_rows([TRANSACTION_FIELDS.values()])
+
+    chunk = []
+    async for transaction in transactions:
+        chunk.append(transaction)
+        if len(chunk) == chunk_size:
+            yield encode(chunk)
+            chunk = []
+    if chunk:
+        yield encode(chunk)
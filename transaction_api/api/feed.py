@@ -0,0 +1,44 @@
+from collections.abc import AsyncIterator
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from transaction_api.exceptions import InvalidEventId
+
+from .raw import TRANSACTION_FIELDS, dumps, to_wire
+
+EVENT_STREAM = "text/event-stream"
+# How long an EventSource waits before reconnecting after the stream ended.
+RETRY_MS = 1000
+
+
+def parse_event_id(event_id: str | None) -> ObjectId | None:
+    if not event_id:
+        return None
+    try:
+        return ObjectId(event_id)
+    except InvalidId as exc:
+        raise InvalidEventId() from exc
+
+
+def feed_message(transaction: dict) -> dict:
+    return {
+        "event": "transaction",
+        "id": str(transaction["_id"]),
+        "transaction": to_wire(transaction, TRANSACTION_FIELDS),
+    }
+
+
+async def sse_events(transactions: AsyncIterator[dict | None]) -> AsyncIterator[bytes]:
+    # Sent right away, so the client sees the stream open before the first transaction.
+    yield f"retry: {RETRY_MS}\n\n".encode()
+    async for transaction in transactions:
+        if transaction is None:
+            # A comment line: keeps proxies from closing an idle stream and detects gone clients.
+            yield b": keepalive\n\n"
+            continue
+        yield (
+            f"id: {transaction['_id']}\nevent: transaction\ndata: ".encode()
+            + dumps(to_wire(transaction, TRANSACTION_FIELDS))
+            + b"\n\n"
+        )
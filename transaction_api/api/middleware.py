@@ -0,0 +1,170 @@
+import logging
+import zlib
+from functools import wraps
+from time import perf_counter
+
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+from transaction_api.services.metrics import RequestTimings, current_timings, request_metrics
+from transaction_api.settings import settings
+
+UNMATCHED_ROUTE = "unmatched"
+
+logger = logging.getLogger(__name__)
+
+
+def _record_handler_finished(call):
+    @wraps(call)
+    async def endpoint(*args, **kwargs):
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            if timings := current_timings.get():
+                timings.handler_finished = perf_counter()
+
+    return endpoint
+
+
+class TimedRoute(APIRoute):
+    """Marks when the endpoint returns, so the time until the response starts counts as serialization."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dependant.call = _record_handler_finished(self.dependant.call)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.server_timing = settings.server_timing
+        self.max_commands = settings.max_commands_per_request
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        status = 500
+
+        async def send_with_timings(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timings.response_started = perf_counter()
+                if self.server_timing:
+                    headers = [
+                        *message.get("headers", []),
+                        (b"server-timing", timings.server_timing().encode()),
+                    ]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            current_timings.reset(token)
+            route = scope["route"].path if "route" in scope else UNMATCHED_ROUTE
+            request_metrics.observe(scope["method"], route, status, timings)
+            if self.max_commands is not None and timings.commands > self.max_commands:
+                logger.warning(
+                    "%s %s issued %d MongoDB commands (limit %d)",
+                    scope["method"],
+                    route,
+                    timings.commands,
+                    self.max_commands,
+                )
+
+
+# In order of preference.
+ENCODINGS = ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    accepted = {}
+    for coding in accept_encoding.split(","):
+        name, _, parameters = coding.partition(";")
+        quality = 1.0
+        if (parameters := parameters.strip()).startswith("q="):
+            try:
+                quality = float(parameters[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor().compressobj()
+            self._sync = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+            self._sync = zlib.Z_SYNC_FLUSH
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        # Streamed chunks are flushed as they come, so a slow stream is never held back in the compressor.
+        data = self._compressor.compress(data)
+        return data + (self._compressor.flush() if last else self._compressor.flush(self._sync))
+
+
+class CompressionMiddleware:
+    """Compresses responses of at least ``minimum_size`` bytes, and every streamed response, when accepted."""
+
+    def __init__(self, app, minimum_size: int | None = None):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http" and self.minimum_size is not None:
+            encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            body, more_body = message.get("body", b""), message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                if "content-encoding" in headers or (not more_body and len(body) < self.minimum_size):
+                    await send(start)
+                    start = None
+                    return await send(message)
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                del headers["Content-Length"]
+                if not more_body:
+                    body = compressor.compress(body, last=True)
+                    headers["Content-Length"] = str(len(body))
+                    await send({**start, "headers": headers.raw})
+                    start = None
+                    return await send({**message, "body": body})
+                await send({**start, "headers": headers.raw})
+                start = None
+
+            if compressor is None:
+                return await send(message)
+            await send({**message, "body": compressor.compress(body, last=not more_body)})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,76 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from transaction_api.services.cache import account_summary_cache, user_cache
+from transaction_api.services.database import db_service
+from transaction_api.services.metrics import feed_metrics, group_commit_metrics, request_metrics
+
+from .middleware import TimedRoute
+
+router = APIRouter(prefix="/monitoring", tags=["monitoring"], route_class=TimedRoute)
+metrics_router = APIRouter(tags=["monitoring"])
+
+
+@router.get(
+    "/cache",
+    responses={
+        "200": {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "users": {"size": 10, "maxEntries": 10000, "hits": 90, "misses": 10, "evictions": 0},
+                        "accountSummaries": {
+                            "size": 2,
+                            "maxEntries": 10000,
+                            "hits": 5,
+                            "misses": 2,
+                            "evictions": 0,
+                        },
+                    }
+                }
+            }
+        }
+    },
+)
+async def get_cache_stats() -> dict:
+    return {"users": user_cache.stats(), "accountSummaries": account_summary_cache.stats()}
+
+
+@router.get(
+    "/database",
+    responses={
+        "200": {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "driver": "async",
+                        "connected": True,
+                        "pool": {
+                            "openConnections": 12,
+                            "checkedOut": 8,
+                            "maxPoolSize": 100,
+                            "utilization": 0.08,
+                            "waiting": 0,
+                            "maxWaiting": 3,
+                            "checkouts": 15230,
+                            "checkoutFailures": 0,
+                            "waitQueueTimeouts": 0,
+                            "averageWaitMs": 0.04,
+                            "maxWaitMs": 12.5,
+                        },
+                    }
+                }
+            }
+        }
+    },
+)
+async def get_database_stats() -> dict:
+    return db_service.stats()
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        request_metrics.render() + group_commit_metrics.render() + feed_metrics.render(),
+        media_type="text/plain; version=0.0.4",
+    )
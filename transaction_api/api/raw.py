@@ -0,0 +1,41 @@
+import json
+from datetime import datetime
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+TRANSACTION_FIELDS = {
+    "transaction_id": "transactionId",
+    "user_id": "userId",
+    "amount": "amount",
+    "timestamp": "timestamp",
+}
+USER_FIELDS = {"user_id": "userId", "name": "name", "email": "email", "created_at": "createdAt"}
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+
+def to_wire(document: dict, fields: dict[str, str]) -> dict:
+    return {wire_name: document[field] for field, wire_name in fields.items()}
+
+
+class RawPageResponse(Response):
+    media_type = "application/json"
+
+    def __init__(self, documents: list[dict], fields: dict[str, str], next_cursor: str | None, **kwargs):
+        items = [to_wire(document, fields) for document in documents]
+        super().__init__(dumps({"items": items, "nextCursor": next_cursor}), **kwargs)
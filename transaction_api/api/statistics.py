@@ -1,20 +1,93 @@
-from fastapi import APIRouter, status
+from datetime import date, datetime
 
+from fastapi import APIRouter, Depends, Query, status
+
+from transaction_api.models.rollup import AccountTimeseries, Granularity
+from transaction_api.models.sketch import AmountDistribution, AmountHistogram
+from transaction_api.repository import checkpoints as checkpoint_repo
+from transaction_api.repository import rollups as rollup_repo
+from transaction_api.repository import sketches as sketch_repo
 from transaction_api.repository import statistics as statistics_repo
-from transaction_api.repository.statistics import AccountSummary
+from transaction_api.repository.statistics import (
+    AccountSummary,
+    AccountSummaryBatch,
+    AccountSummaryBatchRequest,
+)
 
-from .utils import UserId
+from .conditional import NOT_MODIFIED, etag_version, user_etag
+from .middleware import TimedRoute
+from .utils import HistogramEdges, Percentile, Percentiles, UserId
 
-router = APIRouter(prefix="/account-summary", tags=["statistics"])
+router = APIRouter(prefix="/account-summary", tags=["statistics"], route_class=TimedRoute)
+amounts_router = APIRouter(prefix="/statistics", tags=["statistics"], route_class=TimedRoute)
+USER_NOT_FOUND = {
+    str(status.HTTP_404_NOT_FOUND): {
+        "content": {"application/json": {"example": {"detail": "User with id 'user_id' not found"}}}
+    }
+}
 
 
-@router.get(
-    "/{userId}",
-    responses={
-        str(status.HTTP_404_NOT_FOUND): {
-            "content": {"application/json": {"example": {"detail": "User with id 'user_id' not found"}}}
-        }
-    },
-)
-def get_account_summary(user_id: str = UserId) -> AccountSummary:
-    return statistics_repo.get_account_summary(user_id)
+@router.post("/batch")
+async def get_account_summaries(request: AccountSummaryBatchRequest) -> AccountSummaryBatch:
+    return await statistics_repo.get_account_summaries(request.user_ids)
+
+
+@router.get("/{userId}", responses=USER_NOT_FOUND | NOT_MODIFIED)
+async def get_account_summary(
+    user_id: str = UserId,
+    as_of: datetime | None = Query(
+        None, alias="asOf", description="Summarize only the transactions up to this timestamp"
+    ),
+    etag: str | None = Depends(user_etag),
+) -> AccountSummary:
+    if as_of is not None:
+        return await checkpoint_repo.get_account_summary_as_of(user_id, as_of)
+    return await statistics_repo.get_account_summary(user_id, etag_version(etag))
+
+
+@router.get("/{userId}/timeseries", responses=USER_NOT_FOUND)
+async def get_account_timeseries(
+    user_id: str = UserId,
+    granularity: Granularity = Query("day"),
+    start_date: date | None = Query(None, alias="startDate"),
+    end_date: date | None = Query(None, alias="endDate"),
+) -> AccountTimeseries:
+    return await rollup_repo.get_timeseries(user_id, granularity, start_date, end_date)
+
+
+@router.get("/{userId}/percentiles", responses=USER_NOT_FOUND)
+async def get_account_percentiles(
+    user_id: str = UserId,
+    percentiles: list[Percentile] = Percentiles,
+    start_date: date | None = Query(None, alias="startDate"),
+    end_date: date | None = Query(None, alias="endDate"),
+) -> AmountDistribution:
+    return await sketch_repo.get_distribution(user_id, percentiles, start_date, end_date)
+
+
+@router.get("/{userId}/histogram", responses=USER_NOT_FOUND)
+async def get_account_histogram(
+    user_id: str = UserId,
+    edges: list[float] = HistogramEdges,
+    start_date: date | None = Query(None, alias="startDate"),
+    end_date: date | None = Query(None, alias="endDate"),
+) -> AmountHistogram:
+    return await sketch_repo.get_histogram(user_id, edges, start_date, end_date)
+
+
+@amounts_router.get("/percentiles")
+async def get_percentiles(
+    percentiles: list[Percentile] = Percentiles,
+    start_date: date | None = Query(None, alias="startDate"),
+    end_date: date | None = Query(None, alias="endDate"),
+) -> AmountDistribution:
+    return await sketch_repo.get_distribution(None, percentiles, start_date, end_date)
+
+
+@amounts_router.get("/histogram")
+async def get_histogram(
+    edges: list[float] = HistogramEdges,
+    start_date: date | None = Query(None, alias="startDate"),
+    end_date: date | None = Query(None, alias="endDate"),
+) -> AmountHistogram:
+    return await sketch_repo.get_histogram(None, edges, start_date, end_date)
@@ -1,12 +1,35 @@
 from datetime import date
 
-from fastapi import APIRouter, Depends, Query, status
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Response, WebSocket, status
+from fastapi import WebSocketDisconnect, WebSocketException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from transaction_api.models.transaction import TransactionInput, TransactionOut
+from transaction_api.models.page import Page
+from transaction_api.models.transaction import (
+    TransactionBatchOut,
+    TransactionInput,
+    TransactionOut,
+)
+from transaction_api.exceptions import UserDoesNotExist
+from transaction_api.repository import feed as feed_repo
 from transaction_api.repository import transactions as transaction_repo
+from transaction_api.repository import users as user_repo
+from transaction_api.repository.group_commit import group_commit
+from transaction_api.repository.pagination import MAX_PAGE_SIZE, SortOrder
+from transaction_api.settings import settings
+
+from .conditional import NOT_MODIFIED, etag_headers, user_etag
+from .export import MEDIA_TYPES, ExportFormat, export_rows
+from .feed import EVENT_STREAM, feed_message, parse_event_id, sse_events
+from .middleware import TimedRoute
+from .raw import TRANSACTION_FIELDS, RawPageResponse, dumps
+from .utils import PageCursor, PageLimit
 
-router = APIRouter(prefix="/transactions", tags=["transactions"])
+router = APIRouter(prefix="/transactions", tags=["transactions"], route_class=TimedRoute)
 
 
 @router.post(
@@ -36,21 +59,158 @@ router = APIRouter(prefix="/transactions", tags=["transactions"])
                 }
             }
         },
+        str(status.HTTP_503_SERVICE_UNAVAILABLE): {
+            "description": "Group commit queue is full",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Too many transactions waiting to be written, retry later"}
+                }
+            },
+        },
+        str(status.HTTP_409_CONFLICT): {
+            "content": {
+                "application/json": {
+                    "example": {
+                        "detail": "Transaction with id 'transaction_id' already exists with different data"
+                    }
+                }
+            }
+        },
     },
 )
-def add_transaction(transaction: TransactionInput) -> dict:
-    transaction_repo.add_transaction(transaction)
+async def add_transaction(transaction: TransactionInput, response: Response) -> dict:
+    if settings.group_commit:
+        created = await group_commit.add_transaction(transaction)
+    else:
+        created = await transaction_repo.add_transaction(transaction)
+    if not created:
+        response.headers["Idempotent-Replayed"] = "true"
     return {"success": True, "message": "Transaction created successfully."}
 
 
-class TransactionFilters(BaseModel):
+@router.post("/batch")
+async def add_transactions(
+    transactions: list[TransactionInput] = Body(..., max_length=MAX_PAGE_SIZE),
+) -> TransactionBatchOut:
+    return await transaction_repo.add_transactions(transactions)
+
+
+class TransactionRangeFilters(BaseModel):
     user_id: str = Field(Query(..., alias="userId"))
     start_date: date | None = Field(Query(None, alias="startDate"))
     end_date: date | None = Field(Query(None, alias="endDate"))
 
 
-@router.get("")
-def list_transactions(
+class TransactionFilters(TransactionRangeFilters):
+    limit: int = Field(PageLimit)
+    cursor: str | None = Field(PageCursor)
+    order: SortOrder = Field(Query("asc", description="Sort by timestamp ascending or descending"))
+
+
+@router.get("", responses=NOT_MODIFIED)
+async def list_transactions(
     filters: TransactionFilters = Depends(),
-) -> list[TransactionOut]:
-    return transaction_repo.get_all_transactions(**filters.model_dump())
+    etag: str | None = Depends(user_etag),
+) -> Page[TransactionOut]:
+    if settings.raw_responses:
+        transactions, next_cursor = await transaction_repo.find_transactions(**filters.model_dump())
+        return RawPageResponse(transactions, TRANSACTION_FIELDS, next_cursor, headers=etag_headers(etag))
+    return await transaction_repo.get_all_transactions(**filters.model_dump())
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={
+        str(status.HTTP_200_OK): {
+            "content": {
+                MEDIA_TYPES["ndjson"]: {
+                    "example": '{"transactionId": "trxn123", "userId": "user1", "amount": 100.5, '
+                    '"timestamp": "2024-12-14T19:03:09.027930"}'
+                },
+                MEDIA_TYPES["csv"]: {
+                    "example": "transactionId,userId,amount,timestamp\r\n"
+                    "trxn123,user1,100.5,2024-12-14T19:03:09.027930\r\n"
+                },
+            }
+        }
+    },
+)
+async def export_transactions(
+    filters: TransactionRangeFilters = Depends(),
+    export_format: ExportFormat = Query("ndjson", alias="format"),
+) -> StreamingResponse:
+    transactions = transaction_repo.iter_transactions(**filters.model_dump())
+    return StreamingResponse(
+        export_rows(transactions, export_format, settings.export_batch_size),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filters.user_id}.{export_format}"'},
+    )
+
+
+LastEventId = Query(
+    None,
+    alias="lastEventId",
+    description="Resume after this event: the transactions stored since are sent first",
+)
+
+
+async def _follow(user_id: str, last_event_id: str | None) -> AsyncIterator[dict | None]:
+    resume_after = parse_event_id(last_event_id)
+    if not await user_repo.user_exists(user_id):
+        raise UserDoesNotExist(user_id)
+    return feed_repo.follow(user_id, resume_after)
+
+
+@router.get(
+    "/stream",
+    response_class=StreamingResponse,
+    responses={
+        str(status.HTTP_200_OK): {
+            "content": {
+                EVENT_STREAM: {
+                    "example": "id: 675dd6a5c1b2f3a4d5e6f708\nevent: transaction\n"
+                    'data: {"transactionId": "trxn123", "userId": "user1", "amount": 100.5, '
+                    '"timestamp": "2024-12-14T19:03:09.027930"}\n\n'
+                }
+            }
+        },
+        str(status.HTTP_404_NOT_FOUND): {
+            "content": {"application/json": {"example": {"detail": "User with id 'user_id' not found"}}}
+        },
+    },
+)
+async def stream_transactions(
+    user_id: str = Query(..., alias="userId"),
+    last_event_id: str | None = LastEventId,
+    last_event_id_header: str | None = Header(None, alias="Last-Event-ID", include_in_schema=False),
+) -> StreamingResponse:
+    # EventSource sends the header when it reconnects; the query parameter serves the first connection.
+    transactions = await _follow(user_id, last_event_id_header or last_event_id)
+    return StreamingResponse(
+        sse_events(transactions),
+        media_type=EVENT_STREAM,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/stream")
+async def stream_transactions_websocket(
+    websocket: WebSocket,
+    user_id: str = Query(..., alias="userId"),
+    last_event_id: str | None = LastEventId,
+) -> None:
+    try:
+        transactions = await _follow(user_id, last_event_id)
+    except HTTPException as error:
+        raise WebSocketException(status.WS_1008_POLICY_VIOLATION, error.detail) from error
+    await websocket.accept()
+    try:
+        async with aclosing(transactions):
+            async for transaction in transactions:
+                message = {"event": "heartbeat"} if transaction is None else feed_message(transaction)
+                await websocket.send_text(dumps(message).decode())
+    except WebSocketDisconnect:
+        return
+    # Fell a whole buffer behind, or shutting down: the client reconnects from its last event.
+    await websocket.close(status.WS_1013_TRY_AGAIN_LATER)
@@ -1,12 +1,18 @@
 from fastapi import APIRouter, status
 from fastapi.responses import JSONResponse
 
+from transaction_api.models.page import Page
+from transaction_api.models.purge import UserPurge
 from transaction_api.models.user import UserInput, UserOut
+from transaction_api.repository import purges as purge_repo
 from transaction_api.repository import users as user_repo
+from transaction_api.settings import settings
 
-from .utils import UserId
+from .middleware import TimedRoute
+from .raw import USER_FIELDS, RawPageResponse
+from .utils import PageCursor, PageLimit, UserId
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], route_class=TimedRoute)
 
 
 @router.post(
@@ -24,8 +30,8 @@ router = APIRouter(prefix="/users", tags=["users"])
     },
     status_code=status.HTTP_201_CREATED,
 )
-def add_user(user: UserInput):
-    user_repo.add_user(user)
+async def add_user(user: UserInput):
+    await user_repo.add_user(user)
     return JSONResponse(
         status_code=status.HTTP_201_CREATED,
         content={"success": True, "message": "User created successfully."},
@@ -33,8 +39,11 @@ def add_user(user: UserInput):
 
 
 @router.get("")
-def get_users() -> list[UserOut]:
-    return user_repo.get_all_users()
+async def get_users(limit: int = PageLimit, cursor: str | None = PageCursor) -> Page[UserOut]:
+    if settings.raw_responses:
+        users, next_cursor = await user_repo.find_users(limit, cursor)
+        return RawPageResponse(users, USER_FIELDS, next_cursor)
+    return await user_repo.get_all_users(limit, cursor)
 
 
 @router.get(
@@ -45,8 +54,8 @@ def get_users() -> list[UserOut]:
         },
     },
 )
-def get_user(user_id: str = UserId) -> UserOut:
-    return user_repo.get_user_by_id(user_id)
+async def get_user(user_id: str = UserId) -> UserOut:
+    return await user_repo.get_user_by_id(user_id)
 
 
 @router.delete(
@@ -62,6 +71,20 @@ def get_user(user_id: str = UserId) -> UserOut:
         },
     },
 )
-def deleter_user(user_id: str = UserId) -> dict:
-    user_repo.delete_user(user_id)
+async def deleter_user(user_id: str = UserId) -> dict:
+    await user_repo.delete_user(user_id)
     return {"success": True, "message": "User deleted successfully."}
+
+
+@router.get(
+    "/{userId}/purge",
+    responses={
+        str(status.HTTP_404_NOT_FOUND): {
+            "content": {
+                "application/json": {"example": {"detail": "No purge found for user with id 'user_id'"}}
+            }
+        },
+    },
+)
+async def get_user_purge(user_id: str = UserId) -> UserPurge:
+    return await purge_repo.get_purge(user_id)
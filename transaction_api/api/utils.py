@@ -1,3 +1,22 @@
-from fastapi import Path
+from typing import Annotated
+
+from fastapi import Path, Query
+from pydantic import Field
+
+from transaction_api.repository.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from transaction_api.repository.sketches import DEFAULT_HISTOGRAM_EDGES, DEFAULT_PERCENTILES
 
 UserId = Path(alias="userId")
+PageLimit = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+PageCursor = Query(None, description="Opaque cursor returned as `nextCursor` by the previous page")
+Percentile = Annotated[float, Field(ge=0, le=100)]
+Percentiles = Query(
+    DEFAULT_PERCENTILES,
+    alias="p",
+    description="Percentiles between 0 and 100; repeat the parameter for several. Answers are within `SKETCH_RELATIVE_ACCURACY` of the exact amount",
+)
+HistogramEdges = Query(
+    DEFAULT_HISTOGRAM_EDGES,
+    alias="edge",
+    description="Bucket edges; repeat the parameter for several. The first and last buckets are open-ended",
+)
@@ -0,0 +1,122 @@
+import asyncio
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+
+from transaction_api import diagnostics, initialize
+from transaction_api.repository import archive as archive_repo
+from transaction_api.repository import partitions as partition_repo
+from transaction_api.repository import rollups as rollup_repo
+from transaction_api.repository import sketches as sketch_repo
+from transaction_api.repository import statistics as statistics_repo
+from transaction_api.repository import users as user_repo
+
+
+async def rebuild_statistics(args) -> None:
+    updated = await statistics_repo.rebuild_account_summaries()
+    print(f"Rebuilt account summaries for {updated} users")
+
+
+async def rebuild_rollups(args) -> None:
+    buckets = await rollup_repo.rebuild_rollups()
+    print(f"Rebuilt {buckets} timeseries buckets")
+
+
+async def rebuild_sketches(args) -> None:
+    sketches = await sketch_repo.rebuild_sketches()
+    print(f"Rebuilt {sketches} amount sketches")
+
+
+async def reconcile_indexes(args) -> None:
+    for collection_name, indexes in await initialize.indexed_collections():
+        dropped, created = await initialize.reconcile_indexes(collection_name, indexes)
+        print(f"{collection_name}: dropped {dropped or 'nothing'}, created {created or 'nothing'}")
+
+
+async def drop_partition(args) -> None:
+    if not await partition_repo.drop_partition(args.month):
+        print(f"No transaction partition for {args.month:%Y-%m}")
+        sys.exit(1)
+    await user_repo.bump_versions()
+    print(f"Dropped the transactions of {args.month:%Y-%m}")
+
+
+async def archive_transactions(args) -> None:
+    archived = await archive_repo.archive_transactions(args.before)
+    print(f"Archived {archived} transactions before {args.before:%Y-%m}")
+
+
+async def explain_queries(args) -> None:
+    failed = False
+    for plan in await diagnostics.explain_repository_queries():
+        status = f"FAIL ({', '.join(plan.problems)})" if plan.problems else "ok"
+        print(f"{plan.name}: {' <- '.join(plan.stages)} [{status}]")
+        failed = failed or bool(plan.problems)
+    if failed:
+        sys.exit(1)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = ArgumentParser(prog="python -m transaction_api.cli")
+    commands = parser.add_subparsers(required=True)
+
+    rebuild_parser = commands.add_parser(
+        "rebuild-statistics",
+        help="Recompute the per-user transaction counters from the transactions collection. "
+        "Run it while writes are paused.",
+    )
+    rebuild_parser.set_defaults(command=rebuild_statistics)
+
+    rollups_parser = commands.add_parser(
+        "rebuild-rollups",
+        help="Recompute the daily and monthly timeseries buckets from the transactions collection. "
+        "Run it while writes are paused.",
+    )
+    rollups_parser.set_defaults(command=rebuild_rollups)
+
+    sketches_parser = commands.add_parser(
+        "rebuild-sketches",
+        help="Recompute the percentile sketches of transaction amounts from the transactions collection. "
+        "Run it while writes are paused.",
+    )
+    sketches_parser.set_defaults(command=rebuild_sketches)
+
+    indexes_parser = commands.add_parser(
+        "reconcile-indexes", help="Drop undeclared indexes and create the missing declared ones."
+    )
+    indexes_parser.set_defaults(command=reconcile_indexes)
+
+    partition_parser = commands.add_parser(
+        "drop-partition",
+        help="Drop the transactions of one month when TRANSACTION_PARTITIONING=month. "
+        "The account summaries, rollups and sketches keep their history.",
+    )
+    partition_parser.add_argument(
+        "month", type=lambda value: datetime.strptime(value, "%Y-%m"), help="YYYY-MM"
+    )
+    partition_parser.set_defaults(command=drop_partition)
+
+    archive_parser = commands.add_parser(
+        "archive-transactions",
+        help="Move every transaction older than a month from MongoDB to the Parquet files under ARCHIVE_PATH. "
+        "Rerun it to complete an interrupted run.",
+    )
+    archive_parser.add_argument(
+        "before",
+        type=lambda value: datetime.strptime(value, "%Y-%m"),
+        help="First month kept in MongoDB, YYYY-MM",
+    )
+    archive_parser.set_defaults(command=archive_transactions)
+
+    explain_parser = commands.add_parser(
+        "explain-queries",
+        help="Explain every repository query and fail if any of them scans the collection or sorts in memory.",
+    )
+    explain_parser.set_defaults(command=explain_queries)
+
+    args = parser.parse_args(argv)
+    asyncio.run(args.command(args))
+
+
+if __name__ == "__main__":
+    main()
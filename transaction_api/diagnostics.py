@@ -0,0 +1,148 @@
+from datetime import date, datetime
+
+from bson import ObjectId
+from pydantic import BaseModel
+
+from transaction_api.models.rollup import TransactionRollup
+from transaction_api.models.sketch import AmountSketchDocument
+from transaction_api.models.transaction import TransactionInput
+from transaction_api.models.user import User
+from transaction_api.repository import feed as feed_repo
+from transaction_api.repository import partitions
+from transaction_api.repository import rollups as rollup_repo
+from transaction_api.repository import sketches as sketch_repo
+from transaction_api.repository import statistics as statistics_repo
+from transaction_api.repository import transactions as transaction_repo
+from transaction_api.repository import users as user_repo
+from transaction_api.repository.pagination import DEFAULT_PAGE_SIZE, encode_cursor, keyset_filter, keyset_sort
+from transaction_api.services.database import db_service
+from transaction_api.settings import settings
+
+PROBE_USER_ID = "explain-probe"
+FORBIDDEN_STAGES = {"COLLSCAN", "SORT"}
+
+
+class QueryPlan(BaseModel):
+    name: str
+    stages: list[str]
+
+    @property
+    def problems(self) -> list[str]:
+        return sorted(FORBIDDEN_STAGES.intersection(self.stages))
+
+
+def _probe_transaction() -> TransactionInput:
+    return TransactionInput(
+        transactionId="explain-probe", userId=PROBE_USER_ID, amount=-1.0, timestamp=datetime.now()
+    )
+
+
+def repository_queries() -> dict[str, dict]:
+    change = user_repo.BalanceChange.from_transactions(_probe_transaction())
+    transaction_filters = transaction_repo.transaction_filters(
+        PROBE_USER_ID, date(2024, 1, 1), date(2024, 2, 1)
+    )
+    transaction_cursor = encode_cursor(datetime(2024, 1, 15), ObjectId())
+    transaction_collection = partitions.partition_name(datetime(2024, 1, 15))
+    return {
+        "users.get_user_by_id": {"find": User.collection_name, "filter": {"user_id": PROBE_USER_ID}},
+        "users.get_all_users": {
+            "find": User.collection_name,
+            "filter": {},
+            "projection": user_repo.USER_OUT_PROJECTION,
+            "sort": dict(keyset_sort(user_repo.USER_KEYSET)),
+            "limit": DEFAULT_PAGE_SIZE + 1,
+        },
+        "users.get_user_version": {
+            "find": User.collection_name,
+            "filter": {"user_id": PROBE_USER_ID},
+            "projection": user_repo.USER_VERSION_PROJECTION,
+        },
+        "users.get_user_balances": {
+            "find": User.collection_name,
+            "filter": {"user_id": {"$in": [PROBE_USER_ID]}},
+        },
+        "users.apply_balance_change": {
+            "findAndModify": User.collection_name,
+            "query": change.guard(PROBE_USER_ID),
+            "update": change.as_update(),
+        },
+        "statistics.get_account_summary": {
+            "find": User.collection_name,
+            "filter": {"user_id": PROBE_USER_ID},
+            "projection": statistics_repo.ACCOUNT_SUMMARY_PROJECTION,
+        },
+        "statistics.get_account_summaries": {
+            "find": User.collection_name,
+            "filter": {"user_id": {"$in": [PROBE_USER_ID]}},
+            "projection": statistics_repo.ACCOUNT_SUMMARY_PROJECTION,
+        },
+        "rollups.get_timeseries": {
+            "find": TransactionRollup.collection_name,
+            "filter": {
+                "user_id": PROBE_USER_ID,
+                "granularity": "day",
+                "bucket": {"$gte": datetime(2024, 1, 1), "$lte": datetime(2024, 2, 1)},
+            },
+            "projection": rollup_repo.TIMESERIES_PROJECTION,
+            "sort": {"bucket": 1},
+        },
+        "purges.purge_transactions": {
+            "find": transaction_collection,
+            "filter": {"user_id": PROBE_USER_ID, "_id": {"$lte": ObjectId()}},
+            "projection": {"_id": True},
+            "limit": settings.purge_batch_size,
+        },
+        "sketches.get_sketch": {
+            "find": AmountSketchDocument.collection_name,
+            "filter": {
+                "user_id": PROBE_USER_ID,
+                "month": {"$gte": datetime(2024, 1, 1), "$lte": datetime(2024, 2, 1)},
+            },
+            "projection": sketch_repo.SKETCH_PROJECTION,
+        },
+        "feed.find_since": {
+            "find": transaction_collection,
+            "filter": feed_repo.resume_filter(PROBE_USER_ID, ObjectId()),
+            "projection": transaction_repo.TRANSACTION_OUT_PROJECTION,
+            "sort": dict(feed_repo.FEED_SORT),
+        },
+        "transactions.get_all_transactions": {
+            "find": transaction_collection,
+            "filter": transaction_filters,
+            "projection": transaction_repo.TRANSACTION_OUT_PROJECTION,
+            "sort": dict(keyset_sort(transaction_repo.TRANSACTION_KEYSET, "desc")),
+            "limit": DEFAULT_PAGE_SIZE + 1,
+        },
+        "transactions.get_all_transactions.next_page": {
+            "find": transaction_collection,
+            "filter": {
+                "$and": [
+                    transaction_filters,
+                    keyset_filter(transaction_repo.TRANSACTION_KEYSET, transaction_cursor, "desc"),
+                ]
+            },
+            "projection": transaction_repo.TRANSACTION_OUT_PROJECTION,
+            "sort": dict(keyset_sort(transaction_repo.TRANSACTION_KEYSET, "desc")),
+            "limit": DEFAULT_PAGE_SIZE + 1,
+        },
+    }
+
+
+def _stages(plan) -> list[str]:
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _stages(item)]
+    if not isinstance(plan, dict):
+        return []
+    stages = [plan["stage"]] if "stage" in plan else []
+    for value in plan.values():
+        stages.extend(_stages(value))
+    return stages
+
+
+async def explain_repository_queries() -> list[QueryPlan]:
+    plans = []
+    for name, command in repository_queries().items():
+        explained = await db_service.database.command({"explain": command, "verbosity": "queryPlanner"})
+        plans.append(QueryPlan(name=name, stages=_stages(explained["queryPlanner"]["winningPlan"])))
+    return plans
@@ -4,3 +4,47 @@ from fastapi import HTTPException
 class UserDoesNotExist(HTTPException):
     def __init__(self, user_id: str, status_code: int = 404):
         super().__init__(status_code, detail=f"User with id '{user_id}' not found")
+
+
+class InsufficientBalance(HTTPException):
+    def __init__(self, user_id: str, status_code: int = 400):
+        super().__init__(status_code, detail=f"User with id '{user_id}' has insufficient balance")
+
+
+class PurgeDoesNotExist(HTTPException):
+    def __init__(self, user_id: str, status_code: int = 404):
+        super().__init__(status_code, detail=f"No purge found for user with id '{user_id}'")
+
+
+class WriteQueueFull(HTTPException):
+    def __init__(self, status_code: int = 503):
+        super().__init__(status_code, detail="Too many transactions waiting to be written, retry later")
+
+
+class NotModified(HTTPException):
+    def __init__(self, etag: str, status_code: int = 304):
+        super().__init__(status_code, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+class InvalidCursor(HTTPException):
+    def __init__(self, status_code: int = 400):
+        super().__init__(status_code, detail="Invalid pagination cursor")
+
+
+class InvalidEventId(HTTPException):
+    def __init__(self, status_code: int = 400):
+        super().__init__(status_code, detail="Invalid last event id")
+
+
+class TransactionArchived(HTTPException):
+    def __init__(self, transaction_id: str, status_code: int = 409):
+        super().__init__(
+            status_code, detail=f"Transaction with id '{transaction_id}' is older than the archived history"
+        )
+
+
+class TransactionConflict(HTTPException):
+    def __init__(self, transaction_id: str, status_code: int = 409):
+        super().__init__(
+            status_code, detail=f"Transaction with id '{transaction_id}' already exists with different data"
+        )
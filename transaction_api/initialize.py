@@ -1,8 +1,85 @@
-from transaction_api.models.transaction import Transaction
+import logging
+
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+from transaction_api.models.checkpoint import BalanceCheckpoint
+from transaction_api.models.purge import UserPurge
+from transaction_api.models.rollup import TransactionRollup
+from transaction_api.models.sketch import AmountSketchDocument
+from transaction_api.models.transaction import Transaction, TransactionId
 from transaction_api.models.user import User
+from transaction_api.repository import partitions
 from transaction_api.services.database import db_service
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX = "_id_"
+INDEX_NOT_FOUND = 27
+INDEXED_MODELS = (
+    User,
+    Transaction,
+    TransactionId,
+    TransactionRollup,
+    BalanceCheckpoint,
+    AmountSketchDocument,
+    UserPurge,
+)
+
+
+def _same_index(existing: dict, declared: dict) -> bool:
+    if list(existing["key"].items()) != list(declared["key"].items()):
+        return False
+    options = set(existing) | set(declared)
+    options -= {"name", "key", "v", "ns"}
+    return all(existing.get(option, False) == declared.get(option, False) for option in options)
+
+
+async def reconcile_indexes(collection_name: str, indexes: list[IndexModel]) -> tuple[list[str], list[str]]:
+    collection = db_service.database.get_collection(collection_name)
+    declared = {index.document["name"]: index.document for index in indexes}
+    existing = {index["name"]: index async for index in await collection.list_indexes()}
+
+    dropped = []
+    for name, index in existing.items():
+        if name != DEFAULT_INDEX and (name not in declared or not _same_index(index, declared[name])):
+            try:
+                await collection.drop_index(name)
+            except OperationFailure as exc:
+                # Already dropped by a concurrent reconcile.
+                if exc.code != INDEX_NOT_FOUND:
+                    raise
+            dropped.append(name)
+
+    missing = [
+        index
+        for index in indexes
+        if index.document["name"] not in existing or index.document["name"] in dropped
+    ]
+    if missing:
+        await collection.create_indexes(missing)
+    return dropped, [index.document["name"] for index in missing]
+
+
+async def indexed_collections() -> list[tuple[str, list[IndexModel]]]:
+    """Every collection with declared indexes; each transaction partition carries the Transaction indexes."""
+    collections = []
+    for model in INDEXED_MODELS:
+        if model is TransactionId and not partitions.partitioned():
+            continue
+        names = await partitions.list_partitions() if model is Transaction else [model.collection_name]
+        collections.extend((name, model.indexes) for name in names)
+    return collections
+
 
-def initialize_indexes():
-    db_service.database.get_collection(User.collection_name).create_indexes(User.indexes)
-    db_service.database.get_collection(Transaction.collection_name).create_indexes(Transaction.indexes)
+async def initialize_indexes():
+    """
+    Creates the declared indexes that are missing. Outdated indexes are only dropped by the
+    ``reconcile-indexes`` command, so workers starting together never race on drops, and a build that
+    fails (e.g. a new unique index over duplicate data) is reported without stopping the application.
+    """
+    for collection_name, indexes in await indexed_collections():
+        try:
+            await db_service.database.get_collection(collection_name).create_indexes(indexes)
+        except OperationFailure:
+            logger.exception("Building the indexes of %s failed, run reconcile-indexes", collection_name)
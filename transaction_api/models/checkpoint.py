@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import ClassVar
+
+from pydantic import BaseModel
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+
+class BalanceCheckpoint(BaseModel):
+    """Snapshot of the account summary counters covering every transaction up to ``last_transaction_at``."""
+
+    collection_name: ClassVar[str] = "balance_checkpoints"
+    indexes: ClassVar[list[list]] = [
+        IndexModel([("user_id", ASCENDING), ("last_transaction_at", DESCENDING)], unique=True),
+    ]
+
+    user_id: str
+    balance: float
+    transaction_count: int
+    total_credits: float
+    total_debits: float
+    first_transaction_at: datetime
+    last_transaction_at: datetime
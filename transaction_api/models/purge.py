@@ -0,0 +1,40 @@
+from datetime import datetime
+from typing import ClassVar, Literal
+
+from pydantic import BaseModel, ConfigDict, Field
+from pymongo import ASCENDING, IndexModel
+
+PurgeStatus = Literal["pending", "running", "done"]
+
+
+class UserPurge(BaseModel):
+    """Background removal of a deleted user's transactions and derived documents."""
+
+    collection_name: ClassVar[str] = "user_purges"
+    indexes: ClassVar[list[list]] = [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING)]),
+    ]
+
+    user_id: str = Field(alias="userId")
+    status: PurgeStatus
+    purged_transactions: int = Field(0, alias="purgedTransactions")
+    requested_at: datetime = Field(alias="requestedAt")
+    updated_at: datetime = Field(alias="updatedAt")
+    finished_at: datetime | None = Field(None, alias="finishedAt")
+
+    model_config = ConfigDict(
+        populate_by_name=True,
+        json_schema_extra={
+            "examples": [
+                {
+                    "userId": "user1",
+                    "status": "running",
+                    "purgedTransactions": 25000,
+                    "requestedAt": "2024-12-14T19:03:09.027000",
+                    "updatedAt": "2024-12-14T19:03:12.410000",
+                    "finishedAt": None,
+                }
+            ]
+        },
+    )
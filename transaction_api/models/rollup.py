@@ -0,0 +1,65 @@
+from datetime import datetime
+from typing import ClassVar, Literal
+
+from pydantic import BaseModel, ConfigDict, Field
+from pymongo import ASCENDING, IndexModel
+
+Granularity = Literal["day", "month"]
+
+
+class TransactionRollup(BaseModel):
+    collection_name: ClassVar[str] = "transaction_rollups"
+    indexes: ClassVar[list[list]] = [
+        IndexModel([("user_id", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)], unique=True),
+    ]
+
+    user_id: str
+    granularity: Granularity
+    bucket: datetime
+    transaction_count: int
+    total_credits: float
+    total_debits: float
+    net_flow: float
+    min_amount: float
+    max_amount: float
+
+
+class TimeseriesBucket(BaseModel):
+    bucket: datetime
+    transaction_count: int = Field(alias="transactionCount")
+    total_credits: float = Field(alias="totalCredits")
+    total_debits: float = Field(alias="totalDebits")
+    net_flow: float = Field(alias="netFlow")
+    min_amount: float = Field(alias="minAmount")
+    max_amount: float = Field(alias="maxAmount")
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class AccountTimeseries(BaseModel):
+    user_id: str = Field(alias="userId")
+    granularity: Granularity
+    buckets: list[TimeseriesBucket]
+
+    model_config = ConfigDict(
+        populate_by_name=True,
+        json_schema_extra={
+            "examples": [
+                {
+                    "userId": "user1",
+                    "granularity": "day",
+                    "buckets": [
+                        {
+                            "bucket": "2024-12-13T00:00:00",
+                            "transactionCount": 3,
+                            "totalCredits": 150.0,
+                            "totalDebits": 20.5,
+                            "netFlow": 129.5,
+                            "minAmount": -20.5,
+                            "maxAmount": 100.0,
+                        }
+                    ],
+                }
+            ]
+        },
+    )
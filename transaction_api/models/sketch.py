@@ -0,0 +1,79 @@
+from datetime import datetime
+from typing import ClassVar
+
+from pydantic import BaseModel, ConfigDict, Field
+from pymongo import ASCENDING, IndexModel
+
+
+class AmountSketchDocument(BaseModel):
+    """
+    Bins of an ``AmountSketch``; ``user_id`` is None for all users and ``month`` is None for all time.
+    The all-users sketches are split into ``shard`` documents, which per-user sketches do not have.
+    """
+
+    collection_name: ClassVar[str] = "amount_sketches"
+    indexes: ClassVar[list[list]] = [
+        IndexModel([("user_id", ASCENDING), ("month", ASCENDING), ("shard", ASCENDING)], unique=True),
+    ]
+
+    user_id: str | None
+    month: datetime | None
+    shard: int | None = None
+    count: int
+    zero_count: int
+    positive: dict[str, int]
+    negative: dict[str, int]
+    min: float
+    max: float
+
+
+class AmountDistribution(BaseModel):
+    user_id: str | None = Field(None, alias="userId")
+    count: int
+    min: float | None
+    max: float | None
+    percentiles: dict[str, float | None]
+
+    model_config = ConfigDict(
+        populate_by_name=True,
+        json_schema_extra={
+            "examples": [
+                {
+                    "userId": "user1",
+                    "count": 1200,
+                    "min": -950.0,
+                    "max": 4980.5,
+                    "percentiles": {"p50": 42.1, "p95": 870.3, "p99": 2310.9},
+                }
+            ]
+        },
+    )
+
+
+class HistogramBucket(BaseModel):
+    lower: float | None
+    upper: float | None
+    count: int
+
+
+class AmountHistogram(BaseModel):
+    user_id: str | None = Field(None, alias="userId")
+    count: int
+    buckets: list[HistogramBucket]
+
+    model_config = ConfigDict(
+        populate_by_name=True,
+        json_schema_extra={
+            "examples": [
+                {
+                    "userId": "user1",
+                    "count": 3,
+                    "buckets": [
+                        {"lower": None, "upper": 0.0, "count": 1},
+                        {"lower": 0.0, "upper": 100.0, "count": 1},
+                        {"lower": 100.0, "upper": None, "count": 1},
+                    ],
+                }
+            ]
+        },
+    )
@@ -8,8 +8,18 @@ from pydantic import BaseModel, BeforeValidator, ConfigDict, Field
 class Transaction(BaseModel):
     collection_name: ClassVar[str] = "transactions"
     indexes: ClassVar[list[list]] = [
-        IndexModel([("timestamp", ASCENDING)]),
-        IndexModel([("user_id", ASCENDING)]),
+        IndexModel([("transaction_id", ASCENDING)], unique=True),
+        IndexModel(
+            [
+                ("user_id", ASCENDING),
+                ("timestamp", ASCENDING),
+                ("_id", ASCENDING),
+                ("transaction_id", ASCENDING),
+                ("amount", ASCENDING),
+            ]
+        ),
+        # Resuming a live feed reads a user's transactions inserted after the last event.
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)]),
     ]
 
     id: Annotated[str, BeforeValidator(str)] = Field(alias="_id")
@@ -21,6 +31,18 @@ class Transaction(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
 
+class TransactionId(BaseModel):
+    """
+    Reservation of a transaction id with monthly partitions, whose unique indexes each see a single month.
+    """
+
+    collection_name: ClassVar[str] = "transaction_ids"
+    indexes: ClassVar[list[list]] = [IndexModel([("transaction_id", ASCENDING)], unique=True)]
+
+    transaction_id: str
+    timestamp: datetime
+
+
 class BaseTransaction(BaseModel):
     transaction_id: str = Field(alias="transactionId")
     user_id: str = Field(alias="userId")
@@ -58,3 +80,37 @@ class TransactionOut(BaseTransaction):
             ]
         },
     )
+
+
+class TransactionBatchResult(BaseModel):
+    transaction_id: str = Field(alias="transactionId")
+    success: bool
+    detail: str | None = None
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class TransactionBatchOut(BaseModel):
+    succeeded: int
+    failed: int
+    results: list[TransactionBatchResult]
+
+    model_config = ConfigDict(
+        title="TransactionBatch",
+        json_schema_extra={
+            "examples": [
+                {
+                    "succeeded": 1,
+                    "failed": 1,
+                    "results": [
+                        {"transactionId": "trxn123", "success": True, "detail": None},
+                        {
+                            "transactionId": "trxn124",
+                            "success": False,
+                            "detail": "User with id 'user_id' has insufficient balance",
+                        },
+                    ],
+                }
+            ]
+        },
+    )
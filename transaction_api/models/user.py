@@ -7,7 +7,7 @@ from pymongo import ASCENDING, IndexModel
 
 class User(BaseModel):
     collection_name: ClassVar = "users"
-    indexes: ClassVar[list[list]] = [IndexModel([("user_id", ASCENDING)])]
+    indexes: ClassVar[list[list]] = [IndexModel([("user_id", ASCENDING)], unique=True)]
 
     id: Annotated[str, BeforeValidator(str)] = Field(alias="_id")
     user_id: str
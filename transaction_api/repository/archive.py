@@ -0,0 +1,464 @@
+import asyncio
+import os
+import shutil
+import zlib
+from collections.abc import AsyncIterator, Iterator
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import monotonic
+
+from bson import ObjectId
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from pyarrow import fs
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pa = None
+
+from transaction_api.models.transaction import Transaction
+from transaction_api.services.database import db_service
+from transaction_api.settings import settings
+
+from . import partitions
+from .pagination import SortOrder
+
+WATERMARK_FILE = "_watermark"
+# Writes before this month are refused; set ahead of the watermark while a run archives the months.
+FROZEN_FILE = "_frozen"
+ARCHIVE_FIELDS = ["_id", "transaction_id", "user_id", "amount", "timestamp"]
+ARCHIVE_SCHEMA = (
+    pa.schema(
+        [
+            ("_id", pa.string()),
+            ("transaction_id", pa.string()),
+            ("user_id", pa.string()),
+            ("amount", pa.float64()),
+            ("timestamp", pa.timestamp("ms")),
+        ]
+    )
+    if pa
+    else None
+)
+
+# Expiry, watermark and frozen month of the archive, refreshed every CACHE_TTL_SECONDS.
+_markers: tuple[float, datetime | None, datetime | None] | None = None
+
+
+def enabled() -> bool:
+    return settings.archive_path is not None
+
+
+def _root() -> Path:
+    if not enabled():
+        raise RuntimeError("ARCHIVE_PATH is not set")
+    if pa is None:
+        raise RuntimeError("ARCHIVE_PATH requires pyarrow to be installed")
+    return Path(settings.archive_path)
+
+
+def month_start(timestamp: datetime) -> datetime:
+    timestamp = partitions.naive_utc(timestamp)
+    return datetime(timestamp.year, timestamp.month, 1)
+
+
+def user_bucket(user_id: str) -> int:
+    # crc32 rather than hash(), which is salted per process.
+    return zlib.crc32(user_id.encode()) % settings.archive_user_buckets
+
+
+def _bucket_file(month_dir: Path, bucket: int) -> Path:
+    return month_dir / f"bucket={bucket:03d}" / "data.parquet"
+
+
+def _read_marker(name: str) -> datetime | None:
+    try:
+        return datetime.fromisoformat((Path(settings.archive_path) / name).read_text().strip())
+    except FileNotFoundError:
+        return None
+
+
+def _write_marker(name: str, month: datetime) -> None:
+    path = _root() / name
+    staged = path.with_suffix(".tmp")
+    staged.write_text(month.isoformat())
+    os.replace(staged, path)
+
+
+async def _read_markers() -> tuple[datetime | None, datetime | None]:
+    global _markers
+    if not enabled():
+        return None, None
+    if _markers is None or _markers[0] < monotonic():
+        _markers = (
+            monotonic() + settings.cache_ttl_seconds,
+            await run_in_threadpool(_read_marker, WATERMARK_FILE),
+            await run_in_threadpool(_read_marker, FROZEN_FILE),
+        )
+    return _markers[1:]
+
+
+async def watermark() -> datetime | None:
+    """Transactions before this month are read from the archive, later ones from MongoDB."""
+    return (await _read_markers())[0]
+
+
+async def frozen_before() -> datetime | None:
+    """Transactions before this month are refused: they are archived or being archived."""
+    return max(filter(None, await _read_markers()), default=None)
+
+
+async def hot_filter() -> dict:
+    """Restricts a MongoDB query to the transactions that are not archived yet."""
+    if (until := await watermark()) is None:
+        return {}
+    # Rows of an interrupted archive run are already in the files; they are ignored until deleted.
+    return {"timestamp": {"$gte": until}}
+
+
+def _archived_files(until: datetime, start: datetime | None, end: datetime | None, bucket: int | None):
+    """Files of the archived months overlapping [start, end], all buckets when ``bucket`` is None."""
+    files = []
+    for month_dir in sorted(_root().glob("month=*")):
+        month = datetime.strptime(month_dir.name, "month=%Y-%m")
+        if month >= until or (start and partitions.next_month(month) <= start) or (end and month > end):
+            continue
+        if bucket is None:
+            files.extend(sorted(month_dir.glob("bucket=*/data.parquet")))
+        elif (path := _bucket_file(month_dir, bucket)).exists():
+            files.append(path)
+    return files
+
+
+def _user_filter(
+    until: datetime, user_id: str, start: datetime | None, end: datetime | None, include_end: bool = False
+) -> "ds.Expression":
+    expression = (ds.field("user_id") == user_id) & (ds.field("timestamp") < until)
+    if start:
+        expression &= ds.field("timestamp") >= start
+    if end:
+        expression &= ds.field("timestamp") <= end if include_end else ds.field("timestamp") < end
+    return expression
+
+
+def _dataset(files: list[Path]) -> "ds.Dataset":
+    # Memory-mapped reads of only the requested columns; the user_id and timestamp statistics of the
+    # row groups let the scan skip most of a month file.
+    return ds.dataset(
+        [str(path) for path in files],
+        schema=ARCHIVE_SCHEMA,
+        format="parquet",
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def _scan(
+    until: datetime,
+    user_id: str,
+    start: datetime | None,
+    end: datetime | None,
+    columns: list[str],
+    include_end: bool = False,
+) -> "pa.Table":
+    files = _archived_files(until, start, end, user_bucket(user_id))
+    if not files:
+        return ARCHIVE_SCHEMA.empty_table().select(columns)
+    return _dataset(files).to_table(
+        columns=columns, filter=_user_filter(until, user_id, start, end, include_end)
+    )
+
+
+def _find(
+    until: datetime,
+    user_id: str,
+    start: datetime | None,
+    end: datetime | None,
+    after: list | None,
+    order: SortOrder,
+    limit: int | None,
+) -> list[dict]:
+    table = _scan(until, user_id, start, end, ARCHIVE_FIELDS)
+    if after:
+        timestamp, object_id = partitions.naive_utc(after[0]), str(after[1])
+        if order == "asc":
+            keep = pc.or_(
+                pc.greater(table["timestamp"], timestamp),
+                pc.and_(pc.equal(table["timestamp"], timestamp), pc.greater(table["_id"], object_id)),
+            )
+        else:
+            keep = pc.or_(
+                pc.less(table["timestamp"], timestamp),
+                pc.and_(pc.equal(table["timestamp"], timestamp), pc.less(table["_id"], object_id)),
+            )
+        table = table.filter(keep)
+    direction = "ascending" if order == "asc" else "descending"
+    # Equal-length hex strings sort like the ObjectIds they encode.
+    table = table.sort_by([("timestamp", direction), ("_id", direction)])
+    if limit is not None:
+        table = table.slice(0, limit)
+    rows = table.to_pylist()
+    for row in rows:
+        row["_id"] = ObjectId(row["_id"])
+    return rows
+
+
+async def find_transactions(
+    user_id: str,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    after: list | None = None,
+    order: SortOrder = "asc",
+    limit: int | None = None,
+) -> list[dict]:
+    """Archived transactions of a user from ``start`` (inclusive) to ``end`` (exclusive), keyset-ordered."""
+    if (until := await watermark()) is None or (start and start >= until):
+        return []
+    return await run_in_threadpool(_find, until, user_id, start, end, after, order, limit)
+
+
+def _export_batches(
+    until: datetime, user_id: str, start: datetime | None, end: datetime | None
+) -> Iterator[list[dict]]:
+    # Files are sorted by user, timestamp and _id and read month by month, so the rows come out
+    # keyset-ordered without sorting them in memory.
+    for path in _archived_files(until, start, end, user_bucket(user_id)):
+        for batch in _dataset([path]).to_batches(
+            columns=ARCHIVE_FIELDS,
+            filter=_user_filter(until, user_id, start, end),
+            batch_size=settings.archive_batch_size,
+            use_threads=False,
+        ):
+            rows = batch.to_pylist()
+            for row in rows:
+                row["_id"] = ObjectId(row["_id"])
+            if rows:
+                yield rows
+
+
+async def iter_transactions(
+    user_id: str, start: datetime | None = None, end: datetime | None = None
+) -> AsyncIterator[dict]:
+    """Archived transactions of a user from ``start`` to ``end``, keyset-ordered and read a batch at a time."""
+    if (until := await watermark()) is None or (start and start >= until):
+        return
+    batches = _export_batches(until, user_id, start, end)
+    while batch := await run_in_threadpool(next, batches, None):
+        for row in batch:
+            yield row
+
+
+def _summarize(until: datetime, user_id: str, after: datetime | None, as_of: datetime) -> dict | None:
+    table = _scan(until, user_id, after, as_of, ["amount", "timestamp"], include_end=True)
+    if after:
+        table = table.filter(pc.greater(table["timestamp"], after))
+    if not table.num_rows:
+        return None
+    amounts = table["amount"]
+    return {
+        "balance": pc.sum(amounts).as_py(),
+        "transaction_count": table.num_rows,
+        "total_credits": pc.sum(pc.if_else(pc.greater(amounts, 0), amounts, 0.0)).as_py() or 0.0,
+        "total_debits": pc.sum(pc.if_else(pc.less(amounts, 0), pc.abs(amounts), 0.0)).as_py() or 0.0,
+        "first_transaction_at": pc.min(table["timestamp"]).as_py(),
+        "last_transaction_at": pc.max(table["timestamp"]).as_py(),
+    }
+
+
+async def summarize(user_id: str, after: datetime | None, as_of: datetime) -> dict | None:
+    """Counters of the archived transactions of a user after ``after`` up to ``as_of`` (inclusive)."""
+    if (until := await watermark()) is None or (after and after >= until):
+        return None
+    return await run_in_threadpool(_summarize, until, user_id, after, as_of)
+
+
+def _user_summaries(path: Path) -> list[dict]:
+    table = pq.read_table(path, columns=["user_id", "amount", "timestamp"], memory_map=True)
+    amounts = table["amount"]
+    table = table.append_column("credit", pc.if_else(pc.greater(amounts, 0), amounts, 0.0))
+    table = table.append_column("debit", pc.if_else(pc.less(amounts, 0), pc.abs(amounts), 0.0))
+    grouped = table.group_by("user_id").aggregate(
+        [("amount", "count"), ("credit", "sum"), ("debit", "sum"), ("timestamp", "min"), ("timestamp", "max")]
+    )
+    return [
+        {
+            "_id": row["user_id"],
+            "transaction_count": row["amount_count"],
+            "total_credits": row["credit_sum"],
+            "total_debits": row["debit_sum"],
+            "first_transaction_at": row["timestamp_min"],
+            "last_transaction_at": row["timestamp_max"],
+        }
+        for row in grouped.to_pylist()
+    ]
+
+
+async def user_summaries() -> AsyncIterator[dict]:
+    """Per-user counters of every archive file, in the shape of the summary rebuild's ``$group``."""
+    if (until := await watermark()) is None:
+        return
+    for path in await run_in_threadpool(_archived_files, until, None, None, None):
+        for summary in await run_in_threadpool(_user_summaries, path):
+            yield summary
+
+
+def _batches(path: Path, columns: list[str]) -> Iterator[list[dict]]:
+    for batch in pq.ParquetFile(path, memory_map=True).iter_batches(
+        batch_size=settings.archive_batch_size, columns=columns
+    ):
+        yield batch.to_pylist()
+
+
+async def iter_archived(columns: list[str]) -> AsyncIterator[dict]:
+    """Every archived transaction, month by month."""
+    if (until := await watermark()) is None:
+        return
+    for path in await run_in_threadpool(_archived_files, until, None, None, None):
+        batches = _batches(path, columns)
+        while batch := await run_in_threadpool(next, batches, None):
+            for row in batch:
+                yield row
+
+
+def _purge_file(path: Path, user_id: str, cutoff: str) -> int:
+    table = pq.read_table(path, memory_map=True)
+    kept = table.filter(
+        pc.invert(pc.and_(pc.equal(table["user_id"], user_id), pc.less_equal(table["_id"], cutoff)))
+    )
+    if kept.num_rows < table.num_rows:
+        staged = path.with_suffix(".tmp")
+        pq.write_table(kept, staged, compression="zstd")
+        os.replace(staged, path)
+    return table.num_rows - kept.num_rows
+
+
+async def purge_user(user_id: str, cutoff: ObjectId) -> int:
+    """Rewrites the archive files of the user's bucket without its transactions up to ``cutoff``."""
+    if (until := await watermark()) is None:
+        return 0
+    purged = 0
+    for path in await run_in_threadpool(_archived_files, until, None, None, user_bucket(user_id)):
+        purged += await run_in_threadpool(_purge_file, path, user_id, str(cutoff))
+    return purged
+
+
+def _open_writer(staging: Path, bucket: int) -> "pq.ParquetWriter":
+    path = _bucket_file(staging, bucket)
+    path.parent.mkdir(parents=True)
+    return pq.ParquetWriter(path, ARCHIVE_SCHEMA, compression="zstd")
+
+
+def _write_batch(staging: Path, writers: dict, rows: list[dict]) -> None:
+    buckets = {}
+    for row in rows:
+        buckets.setdefault(user_bucket(row["user_id"]), []).append({**row, "_id": str(row["_id"])})
+    for bucket, bucket_rows in buckets.items():
+        if bucket not in writers:
+            writers[bucket] = _open_writer(staging, bucket)
+        writers[bucket].write_table(pa.Table.from_pylist(bucket_rows, schema=ARCHIVE_SCHEMA))
+
+
+def _publish(staging: Path, month_dir: Path, writers: dict) -> None:
+    for writer in writers.values():
+        writer.close()
+    shutil.rmtree(month_dir, ignore_errors=True)
+    os.replace(staging, month_dir)
+
+
+async def _archive_month(month: datetime) -> int:
+    root = _root()
+    month_dir = root / f"month={month:%Y-%m}"
+    staging = root / f".staging-{month:%Y-%m}"
+    await run_in_threadpool(shutil.rmtree, staging, True)
+    # Sorted on the (user_id, timestamp, _id, ...) index, so the row groups of a file cover narrow
+    # user ranges and the files need no sort after loading.
+    cursor = partitions.collection(month).find(
+        {"timestamp": {"$gte": month, "$lt": partitions.next_month(month)}},
+        projection={field: True for field in ARCHIVE_FIELDS},
+        sort=[("user_id", 1), ("timestamp", 1), ("_id", 1)],
+        batch_size=settings.archive_batch_size,
+    )
+    writers = {}
+    archived = 0
+    batch = []
+    async for transaction in cursor:
+        batch.append(transaction)
+        if len(batch) == settings.archive_batch_size:
+            await run_in_threadpool(_write_batch, staging, writers, batch)
+            archived += len(batch)
+            batch = []
+    if batch:
+        await run_in_threadpool(_write_batch, staging, writers, batch)
+        archived += len(batch)
+    if writers:
+        await run_in_threadpool(_publish, staging, month_dir, writers)
+    return archived
+
+
+def _archived_ids(month: datetime) -> Iterator[list[ObjectId]]:
+    for path in sorted((_root() / f"month={month:%Y-%m}").glob("bucket=*/data.parquet")):
+        for batch in _batches(path, ["_id"]):
+            yield [ObjectId(row["_id"]) for row in batch]
+
+
+async def _delete_month(month: datetime) -> None:
+    """Deletes the transactions of a month that its files hold from MongoDB, and no others."""
+    transactions = partitions.collection(month)
+    batches = _archived_ids(month)
+    while ids := await run_in_threadpool(next, batches, None):
+        await transactions.delete_many({"_id": {"$in": ids}})
+    if partitions.partitioned() and await transactions.find_one({}, projection={"_id": True}) is None:
+        await partitions.drop_partition(month)
+
+
+async def _first_month(current: datetime | None) -> datetime | None:
+    if current is not None:
+        # Earlier months are deleted already, the last archived one only when its run finished.
+        return month_start(current - timedelta(days=1))
+    if partitions.partitioned():
+        names = await partitions.list_partitions()
+        return partitions.partition_month(names[0]) if names else None
+    # The first timestamp of each user is one key of the (user_id, timestamp, _id) index, so this reads
+    # one index entry per user rather than scanning the collection.
+    cursor = await db_service.database.get_collection(Transaction.collection_name).aggregate(
+        [
+            {"$sort": {"user_id": 1, "timestamp": 1}},
+            {"$group": {"_id": "$user_id", "timestamp": {"$first": "$timestamp"}}},
+            {"$group": {"_id": None, "timestamp": {"$min": "$timestamp"}}},
+        ]
+    )
+    oldest = await cursor.to_list()
+    return month_start(oldest[0]["timestamp"]) if oldest else None
+
+
+async def archive_transactions(before: datetime) -> int:
+    """
+    Moves every transaction before the month of ``before`` from MongoDB to the archive. Writes to those
+    months are refused first, and the run waits until every worker has seen it; then one month at a time
+    its files are written, the watermark is advanced past it and the rows of its files are deleted.
+    An interrupted run is completed by running it again.
+    """
+    global _markers
+    _root().mkdir(parents=True, exist_ok=True)
+    before = month_start(before)
+    frozen = await run_in_threadpool(_read_marker, FROZEN_FILE)
+    if frozen is None or frozen < before:
+        await run_in_threadpool(_write_marker, FROZEN_FILE, before)
+        _markers = None
+        # Workers cache the markers for CACHE_TTL_SECONDS; until then they may still accept a write that
+        # the month's snapshot would miss.
+        await asyncio.sleep(settings.cache_ttl_seconds)
+    current = await run_in_threadpool(_read_marker, WATERMARK_FILE)
+    month = await _first_month(current)
+    archived = 0
+    while month is not None and month < before:
+        if current is None or month >= current:
+            archived += await _archive_month(month)
+            current = partitions.next_month(month)
+            await run_in_threadpool(_write_marker, WATERMARK_FILE, current)
+            _markers = None
+        await _delete_month(month)
+        month = partitions.next_month(month)
+    return archived
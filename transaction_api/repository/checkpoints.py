@@ -0,0 +1,169 @@
+from datetime import datetime
+
+from pymongo import DeleteMany
+
+from transaction_api.exceptions import UserDoesNotExist
+from transaction_api.models.checkpoint import BalanceCheckpoint
+from transaction_api.models.transaction import TransactionInput
+from transaction_api.models.user import User
+from transaction_api.services.database import db_service
+from transaction_api.settings import settings
+
+from . import archive
+from . import partitions
+from . import users as user_repo
+from .partitions import naive_utc
+from .statistics import AccountSummary
+
+CHECKPOINT_FIELDS = [
+    "balance",
+    "transaction_count",
+    "total_credits",
+    "total_debits",
+    "first_transaction_at",
+    "last_transaction_at",
+]
+CHECKPOINT_PROJECTION = {"_id": False, **dict.fromkeys(CHECKPOINT_FIELDS, True)}
+# Counter on the user document, raised by every write that may drop checkpoints.
+INVALIDATIONS = "checkpoint_invalidations"
+
+
+def summary_after(previous: dict, change: user_repo.BalanceChange) -> dict:
+    timestamps = [
+        timestamp
+        for timestamp in (previous.get("first_transaction_at"), previous.get("last_transaction_at"))
+        if timestamp is not None
+    ] + [naive_utc(change.first_transaction_at), naive_utc(change.last_transaction_at)]
+    return {
+        "balance": previous.get("balance", 0.0) + change.amount,
+        "transaction_count": previous.get("transaction_count", 0) + change.transaction_count,
+        "total_credits": previous.get("total_credits", 0.0) + change.total_credits,
+        "total_debits": previous.get("total_debits", 0.0) + change.total_debits,
+        "first_transaction_at": min(timestamps),
+        "last_transaction_at": max(timestamps),
+    }
+
+
+def _taken_after(transaction: TransactionInput) -> dict:
+    # A checkpoint at or after a backdated transaction may or may not include it, depending on how the
+    # writes interleaved, so it is dropped; readers fall back to the nearest earlier checkpoint.
+    return {"user_id": transaction.user_id, "last_transaction_at": {"$gte": naive_utc(transaction.timestamp)}}
+
+
+def _checkpoint_update(user_id: str, summary: dict) -> tuple[dict, dict]:
+    return (
+        {"user_id": user_id, "last_transaction_at": summary["last_transaction_at"]},
+        {"$set": {field: summary[field] for field in CHECKPOINT_FIELDS}},
+    )
+
+
+async def _invalidate(user_ids: list[str], session=None) -> None:
+    # Counted before the checkpoints are dropped, so a checkpoint taken concurrently sees it in _take.
+    await db_service.database.get_collection(User.collection_name).update_many(
+        {"user_id": {"$in": user_ids}}, {"$inc": {INVALIDATIONS: 1}}, session=session
+    )
+
+
+async def _take(user_id: str, summary: dict, invalidations: int, session=None) -> None:
+    """Stores a checkpoint of ``summary``, read from the user when ``invalidations`` was current."""
+    checkpoints = db_service.database.get_collection(BalanceCheckpoint.collection_name)
+    filters, update = _checkpoint_update(user_id, summary)
+    await checkpoints.update_one(filters, update, upsert=True, session=session)
+    user = await db_service.database.get_collection(User.collection_name).find_one(
+        {"user_id": user_id}, projection={"_id": False, INVALIDATIONS: True}, session=session
+    )
+    if user is None or user.get(INVALIDATIONS, 0) != invalidations:
+        # A backdated transaction missing from the summary may have dropped the checkpoints after it
+        # before this one existed.
+        await checkpoints.delete_one(filters, session=session)
+
+
+async def record_transaction(transaction: TransactionInput, previous: dict, session=None) -> None:
+    """Keeps checkpoints consistent with a stored transaction, given the user counters before it."""
+    invalidations = previous.get(INVALIDATIONS, 0)
+    last_transaction_at = previous.get("last_transaction_at")
+    if last_transaction_at is not None and naive_utc(transaction.timestamp) <= last_transaction_at:
+        await _invalidate([transaction.user_id], session)
+        invalidations += 1
+        await db_service.database.get_collection(BalanceCheckpoint.collection_name).delete_many(
+            _taken_after(transaction), session=session
+        )
+
+    summary = summary_after(previous, user_repo.BalanceChange.from_transactions(transaction))
+    if summary["transaction_count"] % settings.checkpoint_interval == 0:
+        await _take(transaction.user_id, summary, invalidations, session)
+
+
+async def record_transactions(transactions: list[TransactionInput]) -> None:
+    """Batch variant of ``record_transaction``; checkpoints are taken from the user counters after the batch."""
+    if not transactions:
+        return
+    added = {}
+    for transaction in transactions:
+        added[transaction.user_id] = added.get(transaction.user_id, 0) + 1
+    # Without the counters from before the batch, any of its transactions may be backdated.
+    await _invalidate(list(added))
+    await db_service.database.get_collection(BalanceCheckpoint.collection_name).bulk_write(
+        [DeleteMany(_taken_after(transaction)) for transaction in transactions], ordered=False
+    )
+
+    users = db_service.database.get_collection(User.collection_name).find(
+        {"user_id": {"$in": list(added)}},
+        projection={"user_id": True, INVALIDATIONS: True, **CHECKPOINT_PROJECTION},
+    )
+    async for user in users:
+        count = user.get("transaction_count", 0)
+        if (
+            count // settings.checkpoint_interval
+            > (count - added[user["user_id"]]) // settings.checkpoint_interval
+        ):
+            await _take(user["user_id"], user, user.get(INVALIDATIONS, 0))
+
+
+async def get_account_summary_as_of(user_id: str, as_of: datetime) -> AccountSummary:
+    """Replays only the transactions between the nearest earlier checkpoint and ``as_of``."""
+    as_of = naive_utc(as_of)
+    checkpoint = await db_service.database.get_collection(BalanceCheckpoint.collection_name).find_one(
+        {"user_id": user_id, "last_transaction_at": {"$lte": as_of}},
+        projection=CHECKPOINT_PROJECTION,
+        sort=[("last_transaction_at", -1)],
+    )
+    timestamp = {"$lte": as_of}
+    if checkpoint:
+        timestamp["$gt"] = checkpoint["last_transaction_at"]
+    replayed = []
+    if archived := await archive.summarize(user_id, timestamp.get("$gt"), as_of):
+        replayed.append(archived)
+    if watermark := await archive.watermark():
+        timestamp["$gte"] = watermark
+    start = max(filter(None, [timestamp.get("$gt"), watermark]), default=None)
+    for name in await partitions.partitions_between(start, as_of):
+        cursor = await db_service.database.get_collection(name).aggregate(
+            [
+                {"$match": {"user_id": user_id, "timestamp": timestamp}},
+                {
+                    "$group": {
+                        "_id": None,
+                        "balance": {"$sum": "$amount"},
+                        "transaction_count": {"$sum": 1},
+                        "total_credits": {"$sum": {"$cond": [{"$gt": ["$amount", 0]}, "$amount", 0]}},
+                        "total_debits": {
+                            "$sum": {"$cond": [{"$lt": ["$amount", 0]}, {"$abs": "$amount"}, 0]}
+                        },
+                        "first_transaction_at": {"$min": "$timestamp"},
+                        "last_transaction_at": {"$max": "$timestamp"},
+                    }
+                },
+            ]
+        )
+        replayed += await cursor.to_list(1)
+    if not checkpoint and not replayed and not await user_repo.user_exists(user_id):
+        raise UserDoesNotExist(user_id)
+
+    summary = {"user_id": user_id, "balance": 0.0}
+    for part in filter(None, [checkpoint, *replayed]):
+        for field in ("balance", "transaction_count", "total_credits", "total_debits"):
+            summary[field] = summary.get(field, 0) + part[field]
+        summary["first_transaction_at"] = summary.get("first_transaction_at") or part["first_transaction_at"]
+        summary["last_transaction_at"] = part["last_transaction_at"]
+    return AccountSummary(**summary)
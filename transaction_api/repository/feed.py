@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+import logging
+from collections.abc import AsyncIterator
+
+from bson import ObjectId
+
+from transaction_api.models.transaction import Transaction
+from transaction_api.services.broker import transaction_broker
+from transaction_api.services.database import db_service
+from transaction_api.settings import settings
+
+from . import partitions
+from .transactions import TRANSACTION_OUT_PROJECTION
+
+logger = logging.getLogger(__name__)
+
+FEED_SORT = [("_id", 1)]
+# Inserts into ``transactions`` or any of its monthly partitions.
+INSERTS_PIPELINE = [
+    {
+        "$match": {
+            "operationType": "insert",
+            "ns.coll": {"$regex": rf"^{Transaction.collection_name}(_\d{{4}}_\d{{2}})?$"},
+        }
+    },
+    {"$project": {f"fullDocument.{field}": True for field in TRANSACTION_OUT_PROJECTION}},
+]
+WATCH_MAX_AWAIT_MS = 1000
+WATCH_RETRY_SECONDS = 1.0
+
+_task: asyncio.Task | None = None
+
+
+def resume_filter(user_id: str, last_event_id: ObjectId) -> dict:
+    # ObjectIds of different workers are only ordered to the second, so that whole second is read again.
+    return {
+        "user_id": user_id,
+        "_id": {"$gte": ObjectId.from_datetime(last_event_id.generation_time), "$ne": last_event_id},
+    }
+
+
+async def find_since(user_id: str, last_event_id: ObjectId, limit: int) -> tuple[list[dict], bool]:
+    """
+    The first ``limit`` transactions of a user inserted since the one of ``last_event_id``, in insertion
+    order, and whether more follow them. The id comes from the client, so the gap is read a bounded
+    page at a time.
+    """
+    filters = resume_filter(user_id, last_event_id)
+    transactions = []
+    # Backdated transactions go to older partitions, so every partition may hold part of the gap.
+    for name in await partitions.list_partitions():
+        transactions += await (
+            db_service.database.get_collection(name)
+            .find(filters, projection=TRANSACTION_OUT_PROJECTION, sort=FEED_SORT, limit=limit + 1)
+            .to_list()
+        )
+        transactions = sorted(transactions, key=lambda transaction: transaction["_id"])[: limit + 1]
+    return transactions[:limit], len(transactions) > limit
+
+
+async def follow(user_id: str, last_event_id: ObjectId | None = None) -> AsyncIterator[dict | None]:
+    """
+    Yields the transactions of a user stored since ``last_event_id``, then each one as it is committed,
+    and None after every ``feed_heartbeat_seconds`` without one. Ends when the client fell a whole
+    buffer behind, also while catching up, or the worker shuts down; the client then resumes from the
+    last transaction it got.
+    """
+    with transaction_broker.subscribe(user_id, settings.feed_buffer_size) as subscription:
+        # Subscribed before the gap is read, so a transaction committed in between is not missed.
+        sent = set()
+        if last_event_id is not None:
+            transactions, truncated = await find_since(user_id, last_event_id, settings.feed_buffer_size)
+            for transaction in transactions:
+                sent.add(transaction["_id"])
+                yield transaction
+            if truncated:
+                return
+        while True:
+            try:
+                transaction = await asyncio.wait_for(subscription.get(), settings.feed_heartbeat_seconds)
+            except TimeoutError:
+                yield None
+                continue
+            if transaction is None:
+                return
+            if transaction["_id"] not in sent:
+                yield transaction
+
+
+async def watch_transactions() -> None:
+    """Publishes the transactions inserted by every worker, read from a MongoDB change stream."""
+    resume_after = None
+    while True:
+        try:
+            stream = await db_service.database.watch(
+                INSERTS_PIPELINE, resume_after=resume_after, max_await_time_ms=WATCH_MAX_AWAIT_MS
+            )
+            try:
+                while True:
+                    if change := await stream.try_next():
+                        resume_after = change["_id"]
+                        transaction_broker.publish([change["fullDocument"]])
+            finally:
+                await stream.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Transaction change stream failed, restarting")
+            await asyncio.sleep(WATCH_RETRY_SECONDS)
+
+
+def start_feed() -> None:
+    global _task
+    if settings.transaction_feed != "change_stream" or _task is not None:
+        return
+    _task = asyncio.get_running_loop().create_task(watch_transactions(), context=contextvars.Context())
+
+
+async def stop_feed() -> None:
+    global _task
+    transaction_broker.close()
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
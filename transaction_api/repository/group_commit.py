@@ -0,0 +1,122 @@
+import asyncio
+import contextvars
+import logging
+from time import perf_counter
+
+from transaction_api.exceptions import (
+    InsufficientBalance,
+    TransactionArchived,
+    TransactionConflict,
+    UserDoesNotExist,
+    WriteQueueFull,
+)
+from transaction_api.models.transaction import TransactionBatchResult, TransactionInput
+from transaction_api.services.metrics import group_commit_metrics
+from transaction_api.settings import settings
+
+from . import transactions as transaction_repo
+
+logger = logging.getLogger(__name__)
+
+
+def _outcome(result: TransactionBatchResult, transaction: TransactionInput) -> bool:
+    # Same contract as transaction_repo.add_transaction: True when created, False for a replay.
+    if result.success:
+        return result.detail != transaction_repo.ALREADY_PROCESSED
+    for error in (
+        UserDoesNotExist(transaction.user_id),
+        InsufficientBalance(transaction.user_id),
+        TransactionConflict(transaction.transaction_id),
+        TransactionArchived(transaction.transaction_id),
+    ):
+        if error.detail == result.detail:
+            raise error
+    raise RuntimeError(result.detail)
+
+
+class GroupCommit:
+    """
+    Coalesces concurrent single-transaction writes of this worker into ``add_transactions`` batches.
+    A batch is written when it reaches ``flush_size`` or ``flush_interval_ms`` after its first
+    transaction, and only one batch is written at a time, so batches grow while MongoDB is busy.
+    """
+
+    def __init__(self, flush_size: int, flush_interval_ms: float, max_queue_depth: int):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue_depth = max_queue_depth
+        self._queue: list[tuple[TransactionInput, asyncio.Future]] = []
+        self._task: asyncio.Task | None = None
+        self._queued: asyncio.Event | None = None
+        self._full: asyncio.Event | None = None
+        self._closing = False
+
+    async def add_transaction(self, transaction: TransactionInput) -> bool:
+        if len(self._queue) >= self.max_queue_depth:
+            group_commit_metrics.rejected += 1
+            raise WriteQueueFull()
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._queued, self._full = asyncio.Event(), asyncio.Event()
+            # A fresh context, so the commands of a flush are not attributed to the request that started it.
+            self._task = loop.create_task(self._run(), context=contextvars.Context())
+
+        future = loop.create_future()
+        self._queue.append((transaction, future))
+        group_commit_metrics.queue_depth = len(self._queue)
+        self._queued.set()
+        if len(self._queue) >= self.flush_size:
+            self._full.set()
+        return _outcome(await future, transaction)
+
+    async def _run(self) -> None:
+        while not self._closing or self._queue:
+            if not self._closing:
+                await self._queued.wait()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except TimeoutError:
+                    pass
+            await self.flush()
+
+    async def flush(self) -> None:
+        batch, self._queue = self._queue[: self.flush_size], self._queue[self.flush_size :]
+        group_commit_metrics.queue_depth = len(self._queue)
+        if len(self._queue) < self.flush_size:
+            self._full.clear()
+        if not self._queue:
+            self._queued.clear()
+        if not batch:
+            return
+
+        started = perf_counter()
+        try:
+            written = await transaction_repo.add_transactions([transaction for transaction, _ in batch])
+        except Exception as error:
+            logger.exception("Group commit of %d transactions failed", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            group_commit_metrics.observe_flush(len(batch), perf_counter() - started)
+        for (_, future), result in zip(batch, written.results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self) -> None:
+        """Writes the queued transactions and stops the flushing task."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._queued.set()
+        self._full.set()
+        await self._task
+        self._task, self._closing = None, False
+
+
+group_commit = GroupCommit(
+    settings.group_commit_flush_size,
+    settings.group_commit_flush_interval_ms,
+    settings.group_commit_max_queue_depth,
+)
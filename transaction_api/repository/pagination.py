@@ -0,0 +1,49 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Literal
+
+from bson import json_util
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+
+from transaction_api.exceptions import InvalidCursor
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+SortOrder = Literal["asc", "desc"]
+
+
+def encode_cursor(*values) -> str:
+    return urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, types: tuple[type, ...]) -> list:
+    """The keyset values of a cursor; anything but one value of each of ``types`` is an invalid cursor."""
+    try:
+        values = json_util.loads(urlsafe_b64decode(cursor.encode()))
+    # Extended JSON such as {"$oid": 5} fails inside bson with errors other than ValueError.
+    except (ValueError, TypeError, KeyError, InvalidId, OverflowError) as exc:
+        raise InvalidCursor() from exc
+    if (
+        not isinstance(values, list)
+        or len(values) != len(types)
+        or not all(isinstance(value, kind) for value, kind in zip(values, types))
+    ):
+        raise InvalidCursor()
+    return values
+
+
+def keyset_sort(fields: dict[str, type], order: SortOrder = "asc") -> list[tuple[str, int]]:
+    direction = ASCENDING if order == "asc" else DESCENDING
+    return [(field, direction) for field in fields]
+
+
+def keyset_filter(fields: dict[str, type], cursor: str, order: SortOrder = "asc") -> dict:
+    values = decode_cursor(cursor, tuple(fields.values()))
+    names = list(fields)
+    operator = "$gt" if order == "asc" else "$lt"
+    branches = [
+        {**dict(zip(names[:position], values[:position])), names[position]: {operator: values[position]}}
+        for position in range(len(fields))
+    ]
+    return branches[0] if len(branches) == 1 else {"$or": branches}
@@ -0,0 +1,99 @@
+import re
+from datetime import datetime, timezone
+from time import monotonic
+
+from transaction_api.models.transaction import Transaction
+from transaction_api.services.database import db_service
+from transaction_api.settings import settings
+
+PARTITION_PATTERN = re.compile(rf"^{Transaction.collection_name}_(\d{{4}})_(\d{{2}})$")
+
+# Names of the existing partitions, refreshed every CACHE_TTL_SECONDS.
+_partitions: tuple[float, list[str]] | None = None
+_indexed: set[str] = set()
+
+
+def partitioned() -> bool:
+    return settings.transaction_partitioning == "month"
+
+
+def naive_utc(timestamp: datetime) -> datetime:
+    # MongoDB stores datetimes as UTC and returns them naive.
+    if timestamp.tzinfo:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def partition_name(timestamp: datetime) -> str:
+    if not partitioned():
+        return Transaction.collection_name
+    return f"{Transaction.collection_name}_{naive_utc(timestamp):%Y_%m}"
+
+
+def partition_month(name: str) -> datetime:
+    year, month = PARTITION_PATTERN.match(name).groups()
+    return datetime(int(year), int(month), 1)
+
+
+def next_month(month: datetime) -> datetime:
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def collection(timestamp: datetime):
+    return db_service.database.get_collection(partition_name(timestamp))
+
+
+async def list_partitions() -> list[str]:
+    """Transaction collections in ascending time order; just ``transactions`` when not partitioned."""
+    global _partitions
+    if not partitioned():
+        return [Transaction.collection_name]
+    if _partitions is None or _partitions[0] < monotonic():
+        names = await db_service.database.list_collection_names(
+            filter={"name": {"$regex": PARTITION_PATTERN.pattern}}
+        )
+        _partitions = (
+            monotonic() + settings.cache_ttl_seconds,
+            sorted(filter(PARTITION_PATTERN.match, names)),
+        )
+    return _partitions[1]
+
+
+async def partitions_between(
+    start: datetime | None = None, end: datetime | None = None, order: str = "asc"
+) -> list[str]:
+    """Partitions that can hold timestamps from ``start`` to ``end`` (both inclusive)."""
+    start, end = start and naive_utc(start), end and naive_utc(end)
+    names = [
+        name
+        for name in await list_partitions()
+        if not partitioned()
+        or (
+            (start is None or next_month(partition_month(name)) > start)
+            and (end is None or partition_month(name) <= end)
+        )
+    ]
+    return names[::-1] if order == "desc" else names
+
+
+async def ensure_partition(name: str) -> None:
+    """Creates the indexes of a partition before its first write from this worker."""
+    global _partitions
+    if not partitioned() or name in _indexed:
+        return
+    await db_service.database.get_collection(name).create_indexes(Transaction.indexes)
+    _indexed.add(name)
+    if _partitions is not None and name not in _partitions[1]:
+        _partitions = None
+
+
+async def drop_partition(month: datetime) -> bool:
+    """Retires every transaction of a month by dropping its collection."""
+    global _partitions
+    name = partition_name(month)
+    if not partitioned() or name not in await list_partitions():
+        return False
+    await db_service.database.drop_collection(name)
+    _indexed.discard(name)
+    _partitions = None
+    return True
@@ -0,0 +1,146 @@
+import asyncio
+import contextvars
+import logging
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from transaction_api.exceptions import PurgeDoesNotExist
+from transaction_api.models.checkpoint import BalanceCheckpoint
+from transaction_api.models.purge import UserPurge
+from transaction_api.models.rollup import TransactionRollup
+from transaction_api.models.sketch import AmountSketchDocument
+from transaction_api.services.database import db_service
+from transaction_api.settings import settings
+
+from . import archive
+from . import partitions
+
+logger = logging.getLogger(__name__)
+
+PURGE_PROJECTION = {"_id": False, **{field: True for field in UserPurge.model_fields}}
+# Per-user documents derived from the transactions; the all-users sketches keep the deleted history.
+DERIVED_MODELS = (TransactionRollup, BalanceCheckpoint, AmountSketchDocument)
+UNFINISHED = ["pending", "running"]
+
+_tasks: dict[str, asyncio.Task] = {}
+
+
+async def request_purge(user_id: str) -> None:
+    """Records the purge of a deleted user and starts it in the background of this worker."""
+    now = datetime.now()
+    await db_service.database.get_collection(UserPurge.collection_name).update_one(
+        {"user_id": user_id},
+        {
+            # Transactions of a user re-created under the same id get later ObjectIds and are kept.
+            "$set": {"status": "pending", "cutoff": ObjectId(), "requested_at": now, "updated_at": now},
+            "$setOnInsert": {"purged_transactions": 0},
+            "$unset": {"finished_at": ""},
+        },
+        upsert=True,
+    )
+    schedule_purge(user_id)
+
+
+def schedule_purge(user_id: str) -> None:
+    if user_id in _tasks:
+        # The running purge starts over when it finds the request renewed.
+        return
+    # A fresh context, so the purge's commands are not attributed to the request that scheduled it.
+    _tasks[user_id] = task = asyncio.get_running_loop().create_task(
+        purge_user(user_id), context=contextvars.Context()
+    )
+    task.add_done_callback(lambda _: _tasks.pop(user_id, None))
+
+
+async def purge_user(user_id: str) -> None:
+    purges = db_service.database.get_collection(UserPurge.collection_name)
+    job = await purges.find_one_and_update(
+        {"user_id": user_id, "status": {"$in": UNFINISHED}},
+        {"$set": {"status": "running", "updated_at": datetime.now()}},
+        projection={"cutoff": True},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not job:
+        return
+
+    try:
+        for model in DERIVED_MODELS:
+            # Upserted with a server-generated _id, so, like the transactions, documents first written after
+            # the deletion belong to a user re-created under the same id and are kept.
+            await db_service.database.get_collection(model.collection_name).delete_many(
+                {"user_id": user_id, "_id": {"$lte": job["cutoff"]}}
+            )
+        await _purge_transactions(user_id, job["cutoff"])
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        # Left running; it is picked up again on the next start.
+        logger.exception("Purge of the transactions of user %s failed", user_id)
+        return
+
+    now = datetime.now()
+    finished = await purges.update_one(
+        {"user_id": user_id, "cutoff": job["cutoff"]},
+        {"$set": {"status": "done", "updated_at": now, "finished_at": now}},
+    )
+    if not finished.modified_count:
+        await purge_user(user_id)
+
+
+async def _purge_transactions(user_id: str, cutoff: ObjectId) -> None:
+    for name in await partitions.list_partitions():
+        await _purge_partition(user_id, cutoff, name)
+    if archived := await archive.purge_user(user_id, cutoff):
+        await db_service.database.get_collection(UserPurge.collection_name).update_one(
+            {"user_id": user_id},
+            {"$inc": {"purged_transactions": archived}, "$set": {"updated_at": datetime.now()}},
+        )
+
+
+async def _purge_partition(user_id: str, cutoff: ObjectId, name: str) -> None:
+    # Bounded deletes keep every write short instead of one multi-million document delete_many.
+    transactions = db_service.database.get_collection(name)
+    purges = db_service.database.get_collection(UserPurge.collection_name)
+    filters = {"user_id": user_id, "_id": {"$lte": cutoff}}
+    while True:
+        batch = await transactions.find(
+            filters, projection={"_id": True}, limit=settings.purge_batch_size
+        ).to_list()
+        if batch:
+            deleted = await transactions.delete_many({"_id": {"$in": [row["_id"] for row in batch]}})
+            await purges.update_one(
+                {"user_id": user_id},
+                {
+                    "$inc": {"purged_transactions": deleted.deleted_count},
+                    "$set": {"updated_at": datetime.now()},
+                },
+            )
+        if len(batch) < settings.purge_batch_size:
+            return
+        await asyncio.sleep(settings.purge_batch_pause_ms / 1000)
+
+
+async def resume_purges() -> None:
+    unfinished = db_service.database.get_collection(UserPurge.collection_name).find(
+        {"status": {"$in": UNFINISHED}}, projection={"_id": False, "user_id": True}
+    )
+    async for job in unfinished:
+        schedule_purge(job["user_id"])
+
+
+async def stop_purges() -> None:
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def get_purge(user_id: str) -> UserPurge:
+    purge = await db_service.database.get_collection(UserPurge.collection_name).find_one(
+        {"user_id": user_id}, projection=PURGE_PROJECTION
+    )
+    if not purge:
+        raise PurgeDoesNotExist(user_id)
+    return UserPurge(**purge)
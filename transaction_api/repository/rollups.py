@@ -0,0 +1,142 @@
+from collections.abc import Iterable
+from itertools import product
+from datetime import date, datetime, time
+
+from pymongo import UpdateOne
+
+from transaction_api.exceptions import UserDoesNotExist
+from transaction_api.models.rollup import AccountTimeseries, Granularity, TimeseriesBucket, TransactionRollup
+from transaction_api.models.transaction import TransactionInput
+from transaction_api.services.database import db_service
+
+from . import archive
+from . import partitions
+from . import users as user_repo
+from .partitions import naive_utc
+
+GRANULARITIES: tuple[Granularity, ...] = ("day", "month")
+ROLLUP_KEY = ["user_id", "granularity", "bucket"]
+TIMESERIES_PROJECTION = {"_id": False, **{field: True for field in TimeseriesBucket.model_fields}}
+
+
+def bucket_start(timestamp: datetime, granularity: Granularity) -> datetime:
+    timestamp = naive_utc(timestamp)
+    if granularity == "month":
+        return datetime(timestamp.year, timestamp.month, 1)
+    return datetime(timestamp.year, timestamp.month, timestamp.day)
+
+
+def rollup_updates(transactions: Iterable[TransactionInput]) -> list[UpdateOne]:
+    """Folds the transactions into one upsert per affected bucket."""
+    updates = {}
+    for transaction in transactions:
+        amount = transaction.amount
+        for granularity in GRANULARITIES:
+            key = (transaction.user_id, granularity, bucket_start(transaction.timestamp, granularity))
+            if key not in updates:
+                updates[key] = {
+                    "$inc": {
+                        "transaction_count": 0,
+                        "total_credits": 0.0,
+                        "total_debits": 0.0,
+                        "net_flow": 0.0,
+                    },
+                    "$min": {"min_amount": amount},
+                    "$max": {"max_amount": amount},
+                }
+            update = updates[key]
+            update["$inc"]["transaction_count"] += 1
+            update["$inc"]["total_credits" if amount > 0 else "total_debits"] += abs(amount)
+            update["$inc"]["net_flow"] += amount
+            update["$min"]["min_amount"] = min(update["$min"]["min_amount"], amount)
+            update["$max"]["max_amount"] = max(update["$max"]["max_amount"], amount)
+    return [UpdateOne(dict(zip(ROLLUP_KEY, key)), update, upsert=True) for key, update in updates.items()]
+
+
+async def record_transactions(transactions: Iterable[TransactionInput], session=None) -> None:
+    if updates := rollup_updates(transactions):
+        await db_service.database.get_collection(TransactionRollup.collection_name).bulk_write(
+            updates, ordered=False, session=session
+        )
+
+
+async def get_timeseries(
+    user_id: str,
+    granularity: Granularity,
+    start_date: date | None = None,
+    end_date: date | None = None,
+) -> AccountTimeseries:
+    filters = {"user_id": user_id, "granularity": granularity}
+    if start_date or end_date:
+        filters["bucket"] = {}
+    if start_date:
+        filters["bucket"]["$gte"] = bucket_start(datetime.combine(start_date, time.min), granularity)
+    if end_date:
+        filters["bucket"]["$lte"] = bucket_start(datetime.combine(end_date, time.min), granularity)
+
+    buckets = (
+        await db_service.database.get_collection(TransactionRollup.collection_name)
+        .find(filters, projection=TIMESERIES_PROJECTION, sort=[("bucket", 1)])
+        .to_list()
+    )
+    if not buckets and not await user_repo.user_exists(user_id):
+        raise UserDoesNotExist(user_id)
+    return AccountTimeseries(
+        user_id=user_id, granularity=granularity, buckets=[TimeseriesBucket(**bucket) for bucket in buckets]
+    )
+
+
+async def rebuild_rollups() -> int:
+    """Recomputes every bucket of the transactions stored in MongoDB on the server."""
+    rollups = db_service.database.get_collection(TransactionRollup.collection_name)
+    # Archived months are immutable and whole, so their buckets are kept as they are.
+    hot = await archive.hot_filter()
+    await rollups.delete_many({"bucket": hot["timestamp"]} if hot else {})
+    # Day and month buckets never span two monthly partitions, so each partition merges its own buckets.
+    for name, granularity in product(await partitions.list_partitions(), GRANULARITIES):
+        cursor = await db_service.database.get_collection(name).aggregate(
+            [
+                *([{"$match": hot}] if hot else []),
+                {
+                    "$group": {
+                        "_id": {
+                            "user_id": "$user_id",
+                            "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": granularity}},
+                        },
+                        "transaction_count": {"$sum": 1},
+                        "total_credits": {"$sum": {"$cond": [{"$gt": ["$amount", 0]}, "$amount", 0]}},
+                        "total_debits": {
+                            "$sum": {"$cond": [{"$lt": ["$amount", 0]}, {"$abs": "$amount"}, 0]}
+                        },
+                        "net_flow": {"$sum": "$amount"},
+                        "min_amount": {"$min": "$amount"},
+                        "max_amount": {"$max": "$amount"},
+                    }
+                },
+                {
+                    "$project": {
+                        "_id": False,
+                        "user_id": "$_id.user_id",
+                        "granularity": {"$literal": granularity},
+                        "bucket": "$_id.bucket",
+                        "transaction_count": True,
+                        "total_credits": True,
+                        "total_debits": True,
+                        "net_flow": True,
+                        "min_amount": True,
+                        "max_amount": True,
+                    }
+                },
+                {
+                    "$merge": {
+                        "into": TransactionRollup.collection_name,
+                        "on": ROLLUP_KEY,
+                        "whenMatched": "replace",
+                        "whenNotMatched": "insert",
+                    }
+                },
+            ],
+            allowDiskUse=True,
+        )
+        await cursor.to_list()
+    return await rollups.count_documents({})
@@ -0,0 +1,180 @@
+import zlib
+from collections.abc import Iterable
+from datetime import date, datetime, time
+
+from pymongo import UpdateOne
+
+from transaction_api.exceptions import UserDoesNotExist
+from transaction_api.models.sketch import (
+    AmountDistribution,
+    AmountHistogram,
+    AmountSketchDocument,
+    HistogramBucket,
+)
+from transaction_api.models.transaction import TransactionInput
+from transaction_api.services.database import db_service
+from transaction_api.services.sketch import AmountSketch
+from transaction_api.settings import settings
+
+from . import archive
+from . import partitions
+from . import users as user_repo
+from .rollups import bucket_start
+from .statistics import REBUILD_BATCH_SIZE
+
+SKETCH_KEY = ["user_id", "month", "shard"]
+SKETCH_PROJECTION = {
+    "_id": False,
+    "count": True,
+    "zero_count": True,
+    "positive": True,
+    "negative": True,
+    "min": True,
+    "max": True,
+}
+DEFAULT_PERCENTILES = [50.0, 95.0, 99.0]
+DEFAULT_HISTOGRAM_EDGES = [-1000.0, -100.0, -10.0, 0.0, 10.0, 100.0, 1000.0]
+
+
+def new_sketch() -> AmountSketch:
+    return AmountSketch(settings.sketch_relative_accuracy)
+
+
+def global_shard(user_id: str) -> int:
+    # The all-users sketches are split so that concurrent writers of different users update different
+    # documents; readers merge the shards. crc32 rather than hash(), which is salted per process.
+    return zlib.crc32(user_id.encode()) % settings.sketch_shards
+
+
+def sketch_updates(transactions: Iterable[TransactionInput]) -> list[UpdateOne]:
+    """Folds the transactions into one upsert per affected (user or all users, month or all time) sketch."""
+    sketches = {}
+    for transaction in transactions:
+        month = bucket_start(transaction.timestamp, "month")
+        shard = global_shard(transaction.user_id)
+        for key in (
+            (transaction.user_id, None, None),
+            (transaction.user_id, month, None),
+            (None, None, shard),
+            (None, month, shard),
+        ):
+            if key not in sketches:
+                sketches[key] = new_sketch()
+            sketches[key].add(transaction.amount)
+
+    updates = []
+    for key, sketch in sketches.items():
+        increments = {"count": sketch.count, "zero_count": sketch.zero_count}
+        for field in ("positive", "negative"):
+            increments.update({f"{field}.{index}": count for index, count in getattr(sketch, field).items()})
+        update = {"$inc": increments, "$min": {"min": sketch.min}, "$max": {"max": sketch.max}}
+        filters = dict(zip(SKETCH_KEY, key))
+        if filters["shard"] is None:
+            del filters["shard"]
+        updates.append(UpdateOne(filters, update, upsert=True))
+    return updates
+
+
+async def record_transactions(transactions: Iterable[TransactionInput], session=None) -> None:
+    if updates := sketch_updates(transactions):
+        await db_service.database.get_collection(AmountSketchDocument.collection_name).bulk_write(
+            updates, ordered=False, session=session
+        )
+
+
+async def get_sketch(
+    user_id: str | None, start_date: date | None = None, end_date: date | None = None
+) -> AmountSketch:
+    """
+    Reads the all-time sketch, or merges the monthly sketches of the months the range touches; the
+    all-users sketches are merged from their shards.
+    """
+    sketches = db_service.database.get_collection(AmountSketchDocument.collection_name)
+    sketch = new_sketch()
+    if not start_date and not end_date and user_id is not None:
+        if document := await sketches.find_one(
+            {"user_id": user_id, "month": None}, projection=SKETCH_PROJECTION
+        ):
+            sketch.merge_document(document)
+    else:
+        month = {}
+        if start_date:
+            month["$gte"] = bucket_start(datetime.combine(start_date, time.min), "month")
+        if end_date:
+            month["$lte"] = bucket_start(datetime.combine(end_date, time.min), "month")
+        async for document in sketches.find(
+            {"user_id": user_id, "month": month or None}, projection=SKETCH_PROJECTION
+        ):
+            sketch.merge_document(document)
+
+    if not sketch.count and user_id is not None and not await user_repo.user_exists(user_id):
+        raise UserDoesNotExist(user_id)
+    return sketch
+
+
+async def get_distribution(
+    user_id: str | None,
+    percentiles: list[float] = DEFAULT_PERCENTILES,
+    start_date: date | None = None,
+    end_date: date | None = None,
+) -> AmountDistribution:
+    sketch = await get_sketch(user_id, start_date, end_date)
+    return AmountDistribution(
+        user_id=user_id,
+        count=sketch.count,
+        min=sketch.min,
+        max=sketch.max,
+        percentiles={f"p{percentile:g}": sketch.quantile(percentile / 100) for percentile in percentiles},
+    )
+
+
+async def get_histogram(
+    user_id: str | None,
+    edges: list[float] = DEFAULT_HISTOGRAM_EDGES,
+    start_date: date | None = None,
+    end_date: date | None = None,
+) -> AmountHistogram:
+    sketch = await get_sketch(user_id, start_date, end_date)
+    edges = sorted(set(edges))
+    bounds = [None, *edges, None]
+    return AmountHistogram(
+        user_id=user_id,
+        count=sketch.count,
+        buckets=[
+            HistogramBucket(lower=lower, upper=upper, count=count)
+            for lower, upper, count in zip(bounds, bounds[1:], sketch.histogram(edges))
+        ],
+    )
+
+
+async def rebuild_sketches() -> int:
+    """Recomputes every sketch by streaming the archived and stored transactions once."""
+    sketches = db_service.database.get_collection(AmountSketchDocument.collection_name)
+    await sketches.delete_many({})
+    sources = [archive.iter_archived(["user_id", "amount", "timestamp"])]
+    hot = await archive.hot_filter()
+    for name in await partitions.list_partitions():
+        sources.append(
+            db_service.database.get_collection(name).find(
+                hot,
+                projection={"_id": False, "user_id": True, "amount": True, "timestamp": True},
+                batch_size=REBUILD_BATCH_SIZE,
+            )
+        )
+    batch = []
+    for transactions in sources:
+        async for transaction in transactions:
+            batch.append(
+                TransactionInput(
+                    transactionId="",
+                    userId=transaction["user_id"],
+                    amount=transaction["amount"],
+                    timestamp=transaction["timestamp"],
+                )
+            )
+            if len(batch) == REBUILD_BATCH_SIZE:
+                await sketches.bulk_write(sketch_updates(batch), ordered=False)
+                batch = []
+    if batch:
+        await sketches.bulk_write(sketch_updates(batch), ordered=False)
+    return await sketches.count_documents({})
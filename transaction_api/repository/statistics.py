@@ -1,41 +1,193 @@
+from collections.abc import AsyncIterator
+from datetime import datetime
+
 from pydantic import BaseModel, ConfigDict, Field
+from pymongo import UpdateOne
 
 from transaction_api.exceptions import UserDoesNotExist
-from transaction_api.models.transaction import Transaction
 from transaction_api.models.user import User
+from transaction_api.services.cache import account_summary_cache
 from transaction_api.services.database import db_service
 
+from . import archive
+from . import users as user_repo
+from .pagination import MAX_PAGE_SIZE
+from . import partitions
+
+REBUILD_BATCH_SIZE = 1000
+REBUILT_COUNTERS = ["transaction_count", "total_credits", "total_debits"]
+
 
 class AccountSummary(BaseModel):
     user_id: str = Field(alias="userId")
     balance: float = Field(alias="currentBalance")
-    transaction_count: int = Field(alias="transactionCount")
+    transaction_count: int = Field(0, alias="transactionCount")
+    total_credits: float = Field(0.0, alias="totalCredits")
+    total_debits: float = Field(0.0, alias="totalDebits")
+    first_transaction_at: datetime | None = Field(None, alias="firstTransactionAt")
+    last_transaction_at: datetime | None = Field(None, alias="lastTransactionAt")
     model_config = ConfigDict(
         populate_by_name=True,
-        json_schema_extra={"examples": [{"userId": "user_id", "balance": 100.1, "transaction_count": 10}]},
+        json_schema_extra={
+            "examples": [
+                {
+                    "userId": "user_id",
+                    "currentBalance": 100.1,
+                    "transactionCount": 10,
+                    "totalCredits": 150.1,
+                    "totalDebits": 50.0,
+                    "firstTransactionAt": "2024-12-13T13:36:22.482935",
+                    "lastTransactionAt": "2024-12-14T19:03:09.027930",
+                }
+            ]
+        },
     )
 
 
-def get_account_summary(user_id: str) -> AccountSummary:
-    summary = (
-        db_service.database.get_collection(User.collection_name)
-        .aggregate(
-            pipeline=[
-                {"$match": {"user_id": user_id}},
+ACCOUNT_SUMMARY_PROJECTION = {
+    **{field: True for field in AccountSummary.model_fields},
+    **user_repo.USER_VERSION_PROJECTION,
+}
+
+
+class AccountSummaryBatchRequest(BaseModel):
+    user_ids: list[str] = Field(alias="userIds", min_length=1, max_length=MAX_PAGE_SIZE)
+    model_config = ConfigDict(
+        populate_by_name=True, json_schema_extra={"examples": [{"userIds": ["user1", "user2"]}]}
+    )
+
+
+class AccountSummaryBatch(BaseModel):
+    summaries: dict[str, AccountSummary]
+    missing: list[str]
+    model_config = ConfigDict(
+        json_schema_extra={
+            "examples": [
                 {
-                    "$lookup": {
-                        "from": Transaction.collection_name,
-                        "localField": "user_id",
-                        "foreignField": "user_id",
-                        "as": "transactions",
-                    }
-                },
-                {"$addFields": {"transaction_count": {"$size": "$transactions"}}},
-                {"$unset": ["transactions"]},
+                    "summaries": {
+                        "user1": {
+                            "userId": "user1",
+                            "currentBalance": 100.1,
+                            "transactionCount": 10,
+                            "totalCredits": 150.1,
+                            "totalDebits": 50.0,
+                            "firstTransactionAt": "2024-12-13T13:36:22.482935",
+                            "lastTransactionAt": "2024-12-14T19:03:09.027930",
+                        }
+                    },
+                    "missing": ["user2"],
+                }
             ]
+        },
+    )
+
+
+async def get_account_summary(user_id: str, version: str | None = None) -> AccountSummary:
+    """
+    Summaries are cached with the user version they were read with; given the ``version`` a response is
+    tagged with, an entry of another version is read again, so the body is never older than the tag.
+    """
+    if (cached := account_summary_cache.get(user_id)) and version in (None, cached[0]):
+        return cached[1]
+
+    token = account_summary_cache.reserve(user_id)
+    try:
+        user = await db_service.database.get_collection(User.collection_name).find_one(
+            {"user_id": user_id}, projection=ACCOUNT_SUMMARY_PROJECTION
+        )
+        if not user:
+            raise UserDoesNotExist(user_id)
+        summary = AccountSummary(**user)
+        account_summary_cache.set(user_id, (user_repo.user_version(user), summary), token)
+        return summary
+    finally:
+        account_summary_cache.release(user_id, token)
+
+
+async def get_account_summaries(user_ids: list[str]) -> AccountSummaryBatch:
+    """Summaries of many users from one ``$in`` read; unknown users are listed in ``missing``."""
+    user_ids = list(dict.fromkeys(user_ids))
+    summaries = {}
+    tokens = {}
+    for user_id in user_ids:
+        if cached := account_summary_cache.get(user_id):
+            summaries[user_id] = cached[1]
+        else:
+            tokens[user_id] = account_summary_cache.reserve(user_id)
+
+    try:
+        if tokens:
+            cursor = db_service.database.get_collection(User.collection_name).find(
+                {"user_id": {"$in": list(tokens)}}, projection=ACCOUNT_SUMMARY_PROJECTION
+            )
+            async for user in cursor:
+                summary = AccountSummary(**user)
+                account_summary_cache.set(
+                    summary.user_id, (user_repo.user_version(user), summary), tokens[summary.user_id]
+                )
+                summaries[summary.user_id] = summary
+    finally:
+        # The reservations of the missing users are never followed by a set.
+        for user_id, token in tokens.items():
+            account_summary_cache.release(user_id, token)
+    return AccountSummaryBatch(
+        summaries={user_id: summaries[user_id] for user_id in user_ids if user_id in summaries},
+        missing=[user_id for user_id in user_ids if user_id not in summaries],
+    )
+
+
+async def _accumulate_summaries(users, summaries: AsyncIterator[dict]) -> None:
+    updates = []
+    async for summary in summaries:
+        updates.append(
+            UpdateOne(
+                {"user_id": summary["_id"]},
+                {
+                    "$inc": {field: summary[field] for field in REBUILT_COUNTERS},
+                    "$min": {"first_transaction_at": summary["first_transaction_at"]},
+                    "$max": {"last_transaction_at": summary["last_transaction_at"]},
+                },
+            )
         )
-        .try_next()
+        if len(updates) == REBUILD_BATCH_SIZE:
+            await users.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await users.bulk_write(updates, ordered=False)
+
+
+async def rebuild_account_summaries() -> int:
+    users = db_service.database.get_collection(User.collection_name)
+    await users.update_many(
+        {},
+        {
+            "$set": {"transaction_count": 0, "total_credits": 0.0, "total_debits": 0.0},
+            "$unset": {"first_transaction_at": "", "last_transaction_at": ""},
+            "$inc": {"version": 1},
+        },
     )
-    if not summary:
-        raise UserDoesNotExist(user_id)
-    return AccountSummary(**summary)
+    # The archive and each partition add their share, so the counters are accumulated rather than set.
+    await _accumulate_summaries(users, archive.user_summaries())
+    hot = await archive.hot_filter()
+    for name in await partitions.list_partitions():
+        cursor = await db_service.database.get_collection(name).aggregate(
+            [
+                *([{"$match": hot}] if hot else []),
+                {
+                    "$group": {
+                        "_id": "$user_id",
+                        "transaction_count": {"$sum": 1},
+                        "total_credits": {"$sum": {"$cond": [{"$gt": ["$amount", 0]}, "$amount", 0]}},
+                        "total_debits": {
+                            "$sum": {"$cond": [{"$lt": ["$amount", 0]}, {"$abs": "$amount"}, 0]}
+                        },
+                        "first_transaction_at": {"$min": "$timestamp"},
+                        "last_transaction_at": {"$max": "$timestamp"},
+                    }
+                },
+            ],
+            allowDiskUse=True,
+        )
+        await _accumulate_summaries(users, cursor)
+    account_summary_cache.clear()
+    return await users.count_documents({"transaction_count": {"$gt": 0}})
@@ -1,38 +1,434 @@
-from datetime import date, datetime, time
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from functools import partial
+from datetime import date, datetime, time, timezone
 
-from fastapi import HTTPException
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-from transaction_api.exceptions import UserDoesNotExist
+from transaction_api.exceptions import (
+    InsufficientBalance,
+    TransactionArchived,
+    TransactionConflict,
+    UserDoesNotExist,
+)
+from transaction_api.models.page import Page
 from transaction_api.models.transaction import (
     Transaction,
+    TransactionBatchOut,
+    TransactionBatchResult,
+    TransactionId,
     TransactionInput,
     TransactionOut,
 )
+from transaction_api.services.broker import transaction_broker
 from transaction_api.services.database import db_service
+from transaction_api.settings import settings
 
+from . import archive
+from . import checkpoints as checkpoint_repo
+from . import partitions
+from . import rollups as rollup_repo
+from . import sketches as sketch_repo
 from . import users as user_repo
+from .pagination import (
+    DEFAULT_PAGE_SIZE,
+    SortOrder,
+    decode_cursor,
+    encode_cursor,
+    keyset_filter,
+    keyset_sort,
+)
+
+ALREADY_PROCESSED = "Transaction already processed"
+# Derived records written once a row is stored, in this order.
+DERIVED_STEPS = ["rollups", "sketches", "checkpoints"]
+# The derived steps a failed request left unwritten, kept on its rows until a replay writes them.
+PENDING_DERIVED = "pending_derived"
+REPLAY_PROJECTION = {
+    "_id": False,
+    "transaction_id": True,
+    "user_id": True,
+    "amount": True,
+    "timestamp": True,
+    PENDING_DERIVED: True,
+}
+TRANSACTION_KEYSET = {"timestamp": datetime, "_id": ObjectId}
+# Only fields of the (user_id, timestamp, _id, transaction_id, amount) index, so listings are index-covered.
+TRANSACTION_OUT_PROJECTION = {
+    "_id": True,
+    "transaction_id": True,
+    "user_id": True,
+    "timestamp": True,
+    "amount": True,
+}
+
+
+def _stored_timestamp(timestamp: datetime) -> datetime:
+    # Mongo keeps naive UTC datetimes with millisecond precision.
+    if timestamp.tzinfo:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+
+
+def _is_replay(stored: dict, transaction: TransactionInput) -> bool:
+    if (
+        stored["user_id"] != transaction.user_id
+        or stored["amount"] != transaction.amount
+        or _stored_timestamp(stored["timestamp"]) != _stored_timestamp(transaction.timestamp)
+    ):
+        raise TransactionConflict(transaction.transaction_id)
+    return True
+
+
+def _is_archived(transaction: TransactionInput, frozen: datetime | None) -> bool:
+    # Archived months are immutable: their files, rollups and checkpoints are never updated again.
+    return frozen is not None and partitions.naive_utc(transaction.timestamp) < frozen
+
+
+def _by_partition(transactions: list[TransactionInput]) -> dict[str, list[int]]:
+    positions = defaultdict(list)
+    for position, transaction in enumerate(transactions):
+        positions[partitions.partition_name(transaction.timestamp)].append(position)
+    return positions
+
+
+def _reservations():
+    return db_service.database.get_collection(TransactionId.collection_name)
+
+
+async def _find_stored(transactions: list[TransactionInput]) -> dict[str, dict]:
+    routes = defaultdict(set)
+    reserved = {}
+    if not partitions.partitioned():
+        routes[Transaction.collection_name] = {transaction.transaction_id for transaction in transactions}
+    else:
+        # The unique index of a partition only sees its month: ids are reserved across partitions, and the
+        # row is read where the reserved timestamp routes it.
+        cursor = _reservations().find(
+            {"transaction_id": {"$in": list({transaction.transaction_id for transaction in transactions})}},
+            projection={"_id": False, "transaction_id": True, "timestamp": True},
+        )
+        async for reservation in cursor:
+            reserved[reservation["transaction_id"]] = reservation
+            routes[partitions.partition_name(reservation["timestamp"])].add(reservation["transaction_id"])
+
+    stored = {}
+    for name, transaction_ids in routes.items():
+        cursor = db_service.database.get_collection(name).find(
+            {"transaction_id": {"$in": list(transaction_ids)}}, projection=REPLAY_PROJECTION
+        )
+        stored.update({transaction["transaction_id"]: transaction async for transaction in cursor})
+    # An id reserved without its row (dropped, archived, purged or not written yet) conflicts with any reuse.
+    for transaction_id, reservation in reserved.items():
+        stored.setdefault(transaction_id, {**reservation, "user_id": None, "amount": None})
+    return stored
 
 
-def add_transaction(transaction: TransactionInput) -> None:
-    if not (user := user_repo.get_user_by_id(transaction.user_id)):
-        raise UserDoesNotExist(transaction.user_id, 400)
+async def _release_ids(transaction_ids: list[str]) -> None:
+    if partitions.partitioned() and transaction_ids:
+        await _reservations().delete_many({"transaction_id": {"$in": transaction_ids}})
 
-    if user.balance + transaction.amount < 0:
-        raise HTTPException(
-            status_code=400,
-            detail=f"User with id '{transaction.user_id}' has insufficient balance",
+
+async def add_transaction(transaction: TransactionInput) -> bool:
+    """Returns False when the transaction was already stored by an earlier request with the same id."""
+    if _is_archived(transaction, await archive.frozen_before()):
+        raise TransactionArchived(transaction.transaction_id)
+    if partitions.partitioned():
+        stored = (await _find_stored([transaction])).get(transaction.transaction_id)
+    else:
+        stored = await partitions.collection(transaction.timestamp).find_one(
+            {"transaction_id": transaction.transaction_id}, projection=REPLAY_PROJECTION
         )
-    with db_service.client.start_session() as session:
-        with session.start_transaction():
-            db_service.database.get_collection(Transaction.collection_name).insert_one(
-                transaction.model_dump()
+    if stored:
+        _is_replay(stored, transaction)
+        await _resume_derived([(stored, transaction)])
+        return False
+
+    try:
+        if not settings.use_transactions:
+            document = await _apply_transaction(transaction)
+        else:
+            async with db_service.client.start_session() as session:
+                async with await session.start_transaction():
+                    document = await _apply_transaction(transaction, session)
+        _publish([document])
+        return True
+    except DuplicateKeyError:
+        # A concurrent request with the same id won the insert; our balance change was rolled back.
+        stored = await _find_stored([transaction])
+        if transaction.transaction_id in stored:
+            _is_replay(stored[transaction.transaction_id], transaction)
+            await _resume_derived([(stored[transaction.transaction_id], transaction)])
+            return False
+        raise
+
+
+def _publish(documents: list[dict]) -> None:
+    # With a change stream feed, every worker publishes the inserts it reads from MongoDB instead.
+    if documents and settings.transaction_feed == "local":
+        transaction_broker.publish(documents)
+
+
+async def _apply_transaction(transaction: TransactionInput, session=None) -> dict:
+    """
+    Returns the inserted document, with its ``_id``.
+
+    Without a session the writes are not atomic. The balance changes before the insert, so a crash between
+    the two leaves a balance without its row; ``rebuild-statistics`` recomputes the counters from the
+    stored rows. A derived write that fails after the insert is retried by a replay of the request, but one
+    lost to a crash is only repaired by ``rebuild-rollups`` and ``rebuild-sketches``.
+    """
+    change = user_repo.BalanceChange.from_transactions(transaction)
+    previous = await user_repo.apply_balance_change(transaction.user_id, change, session)
+    if not previous:
+        if await user_repo.user_exists(transaction.user_id):
+            raise InsufficientBalance(transaction.user_id)
+        raise UserDoesNotExist(transaction.user_id)
+
+    document = transaction.model_dump()
+    reserved = False
+    try:
+        await partitions.ensure_partition(partitions.partition_name(transaction.timestamp))
+        if partitions.partitioned():
+            await _reservations().insert_one(
+                {"transaction_id": transaction.transaction_id, "timestamp": transaction.timestamp},
+                session=session,
             )
-            user_repo.update_user_balance(transaction.user_id, transaction.amount)
+            reserved = True
+        await partitions.collection(transaction.timestamp).insert_one(document, session=session)
+    except Exception:
+        if session is None:
+            if reserved:
+                await _release_ids([transaction.transaction_id])
+            await user_repo.revert_balance_change(transaction.user_id, change)
+        raise
+    # Only once the row is stored, or in the same multi-document transaction, so a read tagged with the
+    # new version finds it.
+    await user_repo.bump_versions([transaction.user_id], session)
+    await _record_derived([transaction], DERIVED_STEPS, previous, session)
+    return document
 
 
-def get_all_transactions(
-    user_id: str, start_date: date | None = None, end_date: date | None = None
-) -> list[TransactionOut]:
+async def _record_derived(
+    transactions: list[TransactionInput], steps: list[str], previous: dict | None = None, session=None
+) -> None:
+    """
+    Writes the rollups, sketches and checkpoints of stored rows. Outside a multi-document transaction, the
+    steps left when one fails are kept on the rows, so that a replay of the request writes them.
+    """
+    for position, step in enumerate(steps):
+        try:
+            if step == "rollups":
+                await rollup_repo.record_transactions(transactions, session)
+            elif step == "sketches":
+                await sketch_repo.record_transactions(transactions, session)
+            elif previous is not None:
+                await checkpoint_repo.record_transaction(transactions[0], previous, session)
+            else:
+                await checkpoint_repo.record_transactions(transactions)
+        except Exception:
+            if session is None:
+                for name, positions in _by_partition(transactions).items():
+                    await db_service.database.get_collection(name).update_many(
+                        {
+                            "transaction_id": {
+                                "$in": [transactions[index].transaction_id for index in positions]
+                            }
+                        },
+                        {"$set": {PENDING_DERIVED: steps[position:]}},
+                    )
+            raise
+
+
+async def _resume_derived(replays: list[tuple[dict, TransactionInput]]) -> None:
+    """
+    Writes the derived steps left pending on replayed rows. Each row is claimed by unsetting its marker, so
+    concurrent replays never write a step twice.
+    """
+    pending = defaultdict(list)
+    for stored, transaction in replays:
+        if not stored.get(PENDING_DERIVED):
+            continue
+        claimed = await partitions.collection(transaction.timestamp).find_one_and_update(
+            {"transaction_id": transaction.transaction_id, PENDING_DERIVED: {"$exists": True}},
+            {"$unset": {PENDING_DERIVED: True}},
+            projection={"_id": False, PENDING_DERIVED: True},
+        )
+        if claimed:
+            pending[tuple(claimed[PENDING_DERIVED])].append(transaction)
+    for steps, transactions in pending.items():
+        # Checkpoints follow the batch path: the counters from before these rows are long gone.
+        await _record_derived(transactions, list(steps))
+
+
+def _replay_result(stored: dict, transaction: TransactionInput) -> TransactionBatchResult:
+    try:
+        _is_replay(stored, transaction)
+    except TransactionConflict as error:
+        return TransactionBatchResult(
+            transaction_id=transaction.transaction_id, success=False, detail=error.detail
+        )
+    return TransactionBatchResult(
+        transaction_id=transaction.transaction_id, success=True, detail=ALREADY_PROCESSED
+    )
+
+
+async def add_transactions(transactions: list[TransactionInput]) -> TransactionBatchOut:
+    frozen = await archive.frozen_before()
+    stored = await _find_stored(transactions)
+    balances = await user_repo.get_user_balances({transaction.user_id for transaction in transactions})
+    changes = defaultdict(user_repo.BalanceChange)
+    accepted = {}
+    duplicates = []
+    replays = []
+    results = []
+    for transaction in transactions:
+        if transaction.transaction_id in stored:
+            results.append(_replay_result(stored[transaction.transaction_id], transaction))
+            if results[-1].success:
+                replays.append((stored[transaction.transaction_id], transaction))
+            continue
+        if transaction.transaction_id in accepted:
+            original, original_result = accepted[transaction.transaction_id]
+            results.append(_replay_result(original.model_dump(), transaction))
+            duplicates.append((results[-1], original_result))
+            continue
+
+        error = None
+        if _is_archived(transaction, frozen):
+            error = TransactionArchived(transaction.transaction_id)
+        elif transaction.user_id not in balances:
+            error = UserDoesNotExist(transaction.user_id, 400)
+        elif balances[transaction.user_id] + transaction.amount < 0:
+            error = InsufficientBalance(transaction.user_id)
+
+        if error:
+            results.append(
+                TransactionBatchResult(
+                    transaction_id=transaction.transaction_id, success=False, detail=error.detail
+                )
+            )
+            continue
+        balances[transaction.user_id] += transaction.amount
+        changes[transaction.user_id].add(transaction)
+        results.append(TransactionBatchResult(transaction_id=transaction.transaction_id, success=True))
+        accepted[transaction.transaction_id] = (transaction, results[-1])
+
+    if changes:
+        applied = await user_repo.apply_balance_changes(changes)
+        rows = []
+        for transaction, result in accepted.values():
+            # The guard rejects a user's rows as a whole; a concurrent debit may still leave room for some
+            # of them, so they are re-checked one by one in batch order.
+            if transaction.user_id in applied or await user_repo.apply_balance_change(
+                transaction.user_id, user_repo.BalanceChange.from_transactions(transaction)
+            ):
+                rows.append((result, transaction))
+            else:
+                result.success = False
+                result.detail = InsufficientBalance(transaction.user_id).detail
+        if rows:
+            documents = await _insert_batch(rows)
+            inserted = [
+                transaction for result, transaction in rows if result.success and result.detail is None
+            ]
+            if inserted:
+                await user_repo.bump_versions({transaction.user_id for transaction in inserted})
+                await _record_derived(inserted, DERIVED_STEPS)
+            _publish(documents)
+    await _resume_derived(replays)
+
+    # A repeated id inside the batch shares the outcome of its first occurrence.
+    for result, original_result in duplicates:
+        if result.success and not original_result.success:
+            result.success, result.detail = False, original_result.detail
+
+    succeeded = sum(result.success for result in results)
+    return TransactionBatchOut(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+
+async def _insert_batch(rows: list[tuple[TransactionBatchResult, TransactionInput]]) -> list[dict]:
+    """Returns the inserted documents, with their ``_id``, in insertion order."""
+    documents = {}
+    failed = {}
+    for name, positions in _by_partition([transaction for _, transaction in rows]).items():
+        await partitions.ensure_partition(name)
+        batch = [rows[position][1].model_dump() for position in positions]
+        documents.update(zip(positions, batch))
+        if partitions.partitioned():
+            try:
+                await _reservations().insert_many(
+                    [
+                        {"transaction_id": row["transaction_id"], "timestamp": row["timestamp"]}
+                        for row in batch
+                    ],
+                    ordered=False,
+                )
+            except BulkWriteError as exc:
+                errors = {error["index"]: error for error in exc.details["writeErrors"]}
+                failed.update({positions[index]: error for index, error in errors.items()})
+                positions = [position for index, position in enumerate(positions) if index not in errors]
+                batch = [row for index, row in enumerate(batch) if index not in errors]
+                if not batch:
+                    continue
+        try:
+            await db_service.database.get_collection(name).insert_many(batch, ordered=False)
+        except BulkWriteError as exc:
+            errors = {positions[error["index"]]: error for error in exc.details["writeErrors"]}
+            failed.update(errors)
+            await _release_ids([rows[position][1].transaction_id for position in errors])
+    if not failed:
+        return list(documents.values())
+
+    stored = await _find_stored([rows[index][1] for index in failed])
+    replays = []
+    for index, error in failed.items():
+        result, transaction = rows[index]
+        if transaction.transaction_id in stored:
+            replay = _replay_result(stored[transaction.transaction_id], transaction)
+            result.success, result.detail = replay.success, replay.detail
+            if replay.success:
+                replays.append((stored[transaction.transaction_id], transaction))
+        else:
+            result.success, result.detail = False, error["errmsg"]
+    await _resume_derived(replays)
+    removed = set(failed)
+    for user_id in {rows[index][1].user_id for index in failed}:
+        removed.update(await _recheck_user(user_id, rows, documents, failed))
+    return [document for position, document in documents.items() if position not in removed]
+
+
+async def _recheck_user(
+    user_id: str,
+    rows: list[tuple[TransactionBatchResult, TransactionInput]],
+    documents: dict[int, dict],
+    failed: dict[int, dict],
+) -> set[int]:
+    """
+    The user's combined change was guarded as a whole: without a failed credit, a later debit may overdraw.
+    Reverts it and applies the inserted rows again one by one, then deletes and returns those the guard
+    now rejects.
+    """
+    positions = [position for position, (_, transaction) in enumerate(rows) if transaction.user_id == user_id]
+    await user_repo.revert_balance_change(
+        user_id, user_repo.BalanceChange.from_transactions(*(rows[position][1] for position in positions))
+    )
+    rejected = set()
+    for position in positions:
+        if position in failed:
+            continue
+        result, transaction = rows[position]
+        change = user_repo.BalanceChange.from_transactions(transaction)
+        if not await user_repo.apply_balance_change(user_id, change):
+            await partitions.collection(transaction.timestamp).delete_one({"_id": documents[position]["_id"]})
+            await _release_ids([transaction.transaction_id])
+            result.success, result.detail = False, InsufficientBalance(user_id).detail
+            rejected.add(position)
+    return rejected
+
+
+def transaction_filters(user_id: str, start_date: date | None = None, end_date: date | None = None) -> dict:
     filters = {"user_id": {"$eq": user_id}}
     if start_date or end_date:
         filters["timestamp"] = {}
@@ -40,7 +436,105 @@ def get_all_transactions(
             filters["timestamp"]["$gte"] = datetime.combine(start_date, time())
         if end_date:
             filters["timestamp"]["$lt"] = datetime.combine(end_date, time())
-    return [
-        Transaction(**transaction)
-        for transaction in db_service.database.get_collection(Transaction.collection_name).find(filters)
+    return filters
+
+
+def _range_bounds(start_date: date | None, end_date: date | None) -> tuple[datetime | None, datetime | None]:
+    return (
+        datetime.combine(start_date, time()) if start_date else None,
+        datetime.combine(end_date, time()) if end_date else None,
+    )
+
+
+async def find_transactions(
+    user_id: str,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+    order: SortOrder = "asc",
+) -> tuple[list[dict], str | None]:
+    filters = transaction_filters(user_id, start_date, end_date)
+    start, end = range_start, range_end = _range_bounds(start_date, end_date)
+    after = None
+    if cursor:
+        filters = {"$and": [filters, keyset_filter(TRANSACTION_KEYSET, cursor, order)]}
+        # Partitions entirely on the already returned side of the cursor are skipped.
+        after = decode_cursor(cursor, tuple(TRANSACTION_KEYSET.values()))
+        boundary = partitions.naive_utc(after[0])
+        if order == "asc":
+            start = max(start, boundary) if start else boundary
+        else:
+            end = min(end, boundary) if end else boundary
+    watermark = await archive.watermark()
+    hot = {"$and": [filters, await archive.hot_filter()]} if watermark else filters
+
+    async def read_partition(name: str, remaining: int) -> list[dict]:
+        return await (
+            db_service.database.get_collection(name)
+            .find(
+                hot,
+                projection=TRANSACTION_OUT_PROJECTION,
+                sort=keyset_sort(TRANSACTION_KEYSET, order),
+                limit=remaining,
+                batch_size=remaining,
+            )
+            .to_list()
+        )
+
+    async def read_archive(remaining: int) -> list[dict]:
+        # The keyset, not the pruned bounds, excludes the returned rows: the end bound is exclusive here.
+        return await archive.find_transactions(user_id, range_start, range_end, after, order, remaining)
+
+    # The archive and the partitions cover disjoint months, so reading them in order yields the merged order.
+    hot_start = max(start, watermark) if start and watermark else start or watermark
+    readers = [
+        partial(read_partition, name) for name in await partitions.partitions_between(hot_start, end, order)
     ]
+    if watermark and (start is None or start < watermark):
+        readers = [read_archive, *readers] if order == "asc" else [*readers, read_archive]
+
+    transactions = []
+    for read in readers:
+        transactions += await read(limit + 1 - len(transactions))
+        if len(transactions) > limit:
+            break
+    if len(transactions) <= limit:
+        return transactions, None
+    last = transactions[limit - 1]
+    return transactions[:limit], encode_cursor(last["timestamp"], last["_id"])
+
+
+async def get_all_transactions(
+    user_id: str,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+    order: SortOrder = "asc",
+) -> Page[TransactionOut]:
+    transactions, next_cursor = await find_transactions(user_id, start_date, end_date, limit, cursor, order)
+    return Page[TransactionOut](
+        items=[TransactionOut(**transaction) for transaction in transactions], next_cursor=next_cursor
+    )
+
+
+async def iter_transactions(
+    user_id: str, start_date: date | None = None, end_date: date | None = None
+) -> AsyncIterator[dict]:
+    start, end = _range_bounds(start_date, end_date)
+    async for transaction in archive.iter_transactions(user_id, start, end):
+        yield transaction
+    filters = transaction_filters(user_id, start_date, end_date)
+    if watermark := await archive.watermark():
+        filters = {"$and": [filters, await archive.hot_filter()]}
+        start = max(start, watermark) if start else watermark
+    for name in await partitions.partitions_between(start, end):
+        transactions = db_service.database.get_collection(name).find(
+            filters,
+            projection=TRANSACTION_OUT_PROJECTION,
+            sort=keyset_sort(TRANSACTION_KEYSET),
+            batch_size=settings.export_batch_size,
+        )
+        async for transaction in transactions:
+            yield transaction
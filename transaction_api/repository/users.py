@@ -1,53 +1,252 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
 from datetime import datetime
 
+from bson import ObjectId
 from fastapi import HTTPException
+from pymongo import ReturnDocument, UpdateOne
 
 from transaction_api.exceptions import UserDoesNotExist
+from transaction_api.models.page import Page
+from transaction_api.models.transaction import TransactionInput
 from transaction_api.models.user import User, UserInput, UserOut
+from transaction_api.services.cache import account_summary_cache, invalidate_user, user_cache
 from transaction_api.services.database import db_service
 
+from . import purges as purge_repo
+from .pagination import DEFAULT_PAGE_SIZE, encode_cursor, keyset_filter, keyset_sort
+from .partitions import naive_utc
 
-def get_user_by_id(user_id: str) -> User:
-    user = db_service.database.get_collection(User.collection_name).find_one({"user_id": user_id})
+
+async def get_user_by_id(user_id: str) -> User:
+    # Cached users are only served to readers: debits are approved by the guarded update in Mongo.
+    if cached := user_cache.get(user_id):
+        return cached
+
+    token = user_cache.reserve(user_id)
+    try:
+        user = await db_service.database.get_collection(User.collection_name).find_one({"user_id": user_id})
+        if not user:
+            raise UserDoesNotExist(user_id)
+
+        user = User(**user)
+        user_cache.set(user_id, user, token)
+        return user
+    finally:
+        user_cache.release(user_id, token)
+
+
+USER_KEYSET = {"user_id": str}
+USER_OUT_PROJECTION = {"user_id": 1, "name": 1, "email": 1, "created_at": 1}
+
+
+async def find_users(
+    limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None
+) -> tuple[list[dict], str | None]:
+    filters = keyset_filter(USER_KEYSET, cursor) if cursor else {}
+    users = await (
+        db_service.database.get_collection(User.collection_name)
+        .find(
+            filters,
+            projection=USER_OUT_PROJECTION,
+            sort=keyset_sort(USER_KEYSET),
+            limit=limit + 1,
+            batch_size=limit + 1,
+        )
+        .to_list()
+    )
+    if len(users) <= limit:
+        return users, None
+    return users[:limit], encode_cursor(users[limit - 1]["user_id"])
+
+
+async def get_all_users(limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None) -> Page[UserOut]:
+    users, next_cursor = await find_users(limit, cursor)
+    return Page[UserOut](items=[UserOut(**user) for user in users], next_cursor=next_cursor)
+
+
+USER_VERSION_PROJECTION = {"_id": True, "version": True}
+
+
+async def get_user_version(user_id: str) -> str | None:
+    """
+    Changes whenever the user's balance, counters or transactions do. The document id is part of it,
+    so a user re-created under the same id never repeats a version of the deleted one.
+    """
+    user = await db_service.database.get_collection(User.collection_name).find_one(
+        {"user_id": user_id}, projection=USER_VERSION_PROJECTION
+    )
     if not user:
-        raise UserDoesNotExist(user_id)
+        return None
+    return user_version(user)
 
-    return User(**user)
 
+def user_version(user: dict) -> str:
+    return f"{user['_id']}.{user.get('version', 0)}"
 
-def get_all_users() -> list[UserOut]:
-    users = db_service.database.get_collection(User.collection_name).find(
-        {}, projection={"user_id": 1, "name": 1, "email": 1, "created_at": 1}
+
+async def bump_versions(user_ids: Iterable[str] | None = None, session=None) -> None:
+    """
+    Invalidates the version of the given users, every user by default, once their transactions changed.
+    Runs after the transactions are inserted, so a read tagged with the new version sees them.
+    """
+    filters = {} if user_ids is None else {"user_id": {"$in": list(user_ids)}}
+    await db_service.database.get_collection(User.collection_name).update_many(
+        filters, {"$inc": {"version": 1}}, session=session
     )
-    return [UserOut(**user) for user in users]
 
 
-def user_exists(user_id: str) -> bool:
-    user = db_service.database.get_collection(User.collection_name).find_one(
+async def user_exists(user_id: str) -> bool:
+    user = await db_service.database.get_collection(User.collection_name).find_one(
         {"user_id": user_id}, projection={"_id": True}
     )
     return user is not None
 
 
-def add_user(user: UserInput) -> None:
-    if user_exists(user.user_id):
+async def add_user(user: UserInput) -> None:
+    if await user_exists(user.user_id):
         raise HTTPException(status_code=400, detail=f"User with id '{user.user_id}' already exists")
-    db_service.database.get_collection(User.collection_name).insert_one(
+    await db_service.database.get_collection(User.collection_name).insert_one(
         {
             **user.model_dump(),
             "created_at": datetime.now(),
             "balance": 0.0,
         }
     )
+    invalidate_user(user.user_id)
 
 
-def delete_user(user_id: str) -> None:
-    if not user_exists(user_id):
+async def delete_user(user_id: str) -> None:
+    deleted = await db_service.database.get_collection(User.collection_name).delete_one({"user_id": user_id})
+    if not deleted.deleted_count:
         raise UserDoesNotExist(user_id)
-    db_service.database.get_collection(User.collection_name).delete_one({"user_id": user_id})
+    invalidate_user(user_id)
+    await purge_repo.request_purge(user_id)
+
+
+async def update_user_balance(user_id: str, amount: float) -> None:
+    await db_service.database.get_collection(User.collection_name).update_one(
+        {"user_id": user_id}, {"$inc": {"balance": amount, "version": 1}}
+    )
+    invalidate_user(user_id)
+
 
+async def get_user_balances(user_ids: set[str]) -> dict[str, float]:
+    users = db_service.database.get_collection(User.collection_name).find(
+        {"user_id": {"$in": list(user_ids)}}, projection={"_id": False, "user_id": True, "balance": True}
+    )
+    return {user["user_id"]: user["balance"] async for user in users}
+
+
+@dataclass
+class BalanceChange:
+    amount: float = 0.0
+    transaction_count: int = 0
+    total_credits: float = 0.0
+    total_debits: float = 0.0
+    first_transaction_at: datetime | None = None
+    last_transaction_at: datetime | None = None
+    minimum_balance: float = 0.0
+
+    @classmethod
+    def from_transactions(cls, *transactions: TransactionInput) -> "BalanceChange":
+        change = cls()
+        for transaction in transactions:
+            change.add(transaction)
+        return change
+
+    def add(self, transaction: TransactionInput) -> None:
+        self.amount += transaction.amount
+        self.transaction_count += 1
+        if transaction.amount > 0:
+            self.total_credits += transaction.amount
+        else:
+            self.total_debits -= transaction.amount
+        self.minimum_balance = max(self.minimum_balance, -self.amount)
+        # A batch may mix naive and offset-aware timestamps, which cannot be compared with each other.
+        timestamp = naive_utc(transaction.timestamp)
+        if self.first_transaction_at is None or timestamp < self.first_transaction_at:
+            self.first_transaction_at = timestamp
+        if self.last_transaction_at is None or timestamp > self.last_transaction_at:
+            self.last_transaction_at = timestamp
+
+    def counters(self) -> dict:
+        return {
+            "balance": self.amount,
+            "transaction_count": self.transaction_count,
+            "total_credits": self.total_credits,
+            "total_debits": self.total_debits,
+        }
+
+    def as_update(self) -> dict:
+        return {
+            "$inc": self.counters(),
+            "$min": {"first_transaction_at": self.first_transaction_at},
+            "$max": {"last_transaction_at": self.last_transaction_at},
+        }
+
+    def as_revert(self) -> dict:
+        # The version moves forward on a revert too, so no version is ever reused.
+        return {"$inc": {**{field: -value for field, value in self.counters().items()}, "version": 1}}
 
-def update_user_balance(user_id: str, amount: float) -> None:
-    db_service.database.get_collection(User.collection_name).update_one(
-        {"user_id": user_id}, {"$inc": {"balance": amount}}
+    def guard(self, user_id: str) -> dict:
+        filters = {"user_id": user_id}
+        if self.minimum_balance > 0:
+            filters["balance"] = {"$gte": self.minimum_balance}
+        return filters
+
+
+BALANCE_CHANGE_PROJECTION = {
+    "_id": False,
+    "balance": True,
+    "transaction_count": True,
+    "total_credits": True,
+    "total_debits": True,
+    "first_transaction_at": True,
+    "last_transaction_at": True,
+    "checkpoint_invalidations": True,
+}
+
+
+async def apply_balance_change(user_id: str, change: BalanceChange, session=None) -> dict | None:
+    """Returns the counters as they were before the change, or None when the guard did not match."""
+    previous = await db_service.database.get_collection(User.collection_name).find_one_and_update(
+        change.guard(user_id),
+        change.as_update(),
+        projection=BALANCE_CHANGE_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
+        session=session,
+    )
+    if previous:
+        balance = previous["balance"] + change.amount
+        user_cache.update(user_id, lambda user: user.model_copy(update={"balance": balance}))
+        account_summary_cache.invalidate(user_id)
+    return previous
+
+
+async def revert_balance_change(user_id: str, change: BalanceChange) -> None:
+    await db_service.database.get_collection(User.collection_name).update_one(
+        {"user_id": user_id}, change.as_revert()
+    )
+    invalidate_user(user_id)
+
+
+async def apply_balance_changes(changes: dict[str, BalanceChange]) -> set[str]:
+    collection = db_service.database.get_collection(User.collection_name)
+    batch_id = ObjectId()
+    result = await collection.bulk_write(
+        [
+            UpdateOne(change.guard(user_id), change.as_update() | {"$set": {"balance_batch_id": batch_id}})
+            for user_id, change in changes.items()
+        ],
+        ordered=False,
+    )
+    for user_id in changes:
+        invalidate_user(user_id)
+    if result.matched_count == len(changes):
+        return set(changes)
+    users = collection.find(
+        {"user_id": {"$in": list(changes)}, "balance_batch_id": batch_id},
+        projection={"_id": False, "user_id": True},
     )
+    return {user["user_id"] async for user in users}
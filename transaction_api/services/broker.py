@@ -0,0 +1,79 @@
+import asyncio
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from transaction_api.services.metrics import feed_metrics
+
+
+class Subscription:
+    """The bounded buffer of committed transactions of one live feed."""
+
+    def __init__(self, buffer_size: int):
+        self.closed = False
+        self._queue: asyncio.Queue[dict | None] = asyncio.Queue(buffer_size)
+
+    def put(self, transaction: dict) -> bool:
+        """Returns False when the buffer is full; the feed then ends once it has sent what it holds."""
+        if self.closed:
+            return True
+        try:
+            self._queue.put_nowait(transaction)
+        except asyncio.QueueFull:
+            self.closed = True
+            return False
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+        if self._queue.empty():
+            # Wakes a reader waiting for the next transaction.
+            self._queue.put_nowait(None)
+
+    async def get(self) -> dict | None:
+        """The next transaction, or None once the subscription is closed and its buffer drained."""
+        if self.closed and self._queue.empty():
+            return None
+        return await self._queue.get()
+
+
+class TransactionBroker:
+    """
+    Fans committed transactions out to the live feeds of their users on this worker. Publishing never
+    waits: a feed whose buffer is full is cut off and its client resumes from the last event it received,
+    so a slow client holds back neither the writes nor the other feeds.
+    """
+
+    def __init__(self):
+        self._subscriptions: dict[str, set[Subscription]] = defaultdict(set)
+
+    @contextmanager
+    def subscribe(self, user_id: str, buffer_size: int) -> Iterator[Subscription]:
+        subscription = Subscription(buffer_size)
+        self._subscriptions[user_id].add(subscription)
+        feed_metrics.subscribers += 1
+        try:
+            yield subscription
+        finally:
+            feed_metrics.subscribers -= 1
+            self._subscriptions[user_id].discard(subscription)
+            if not self._subscriptions[user_id]:
+                del self._subscriptions[user_id]
+
+    def publish(self, transactions: list[dict]) -> None:
+        feed_metrics.published += len(transactions)
+        if not self._subscriptions:
+            return
+        for transaction in transactions:
+            for subscription in self._subscriptions.get(transaction["user_id"], ()):
+                if not subscription.put(transaction):
+                    feed_metrics.overflows += 1
+
+    def close(self) -> None:
+        """Ends every feed, e.g. on shutdown."""
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.close()
+
+
+transaction_broker = TransactionBroker()
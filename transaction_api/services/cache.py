@@ -0,0 +1,86 @@
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from time import monotonic
+from typing import Any
+
+from transaction_api.settings import settings
+
+
+class TTLCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._pending: dict[Hashable, object] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def reserve(self, key: Hashable) -> object:
+        # Taken before reading from the database; an invalidation in the meantime voids it,
+        # so a value read before a concurrent write is never cached.
+        self._pending[key] = token = object()
+        return token
+
+    def set(self, key: Hashable, value: Any, token: object) -> None:
+        if self._pending.get(key) is not token:
+            return
+        del self._pending[key]
+        if not self.enabled:
+            return
+        self._entries[key] = (monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def release(self, key: Hashable, token: object) -> None:
+        # Drops a reservation that is not followed by a set, e.g. when the read found nothing.
+        if self._pending.get(key) is token:
+            del self._pending[key]
+
+    def update(self, key: Hashable, func: Callable[[Any], Any]) -> None:
+        self._pending.pop(key, None)
+        if entry := self._entries.get(key):
+            self._entries[key] = (entry[0], func(entry[1]))
+
+    def invalidate(self, key: Hashable) -> None:
+        self._pending.pop(key, None)
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._pending.clear()
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+user_cache = TTLCache(settings.cache_max_entries, settings.cache_ttl_seconds)
+account_summary_cache = TTLCache(settings.cache_max_entries, settings.cache_ttl_seconds)
+
+
+def invalidate_user(user_id: str) -> None:
+    user_cache.invalidate(user_id)
+    account_summary_cache.invalidate(user_id)
@@ -1,16 +1,119 @@
-from os import environ
-from pymongo import MongoClient
+from fastapi.concurrency import run_in_threadpool
+from pymongo import AsyncMongoClient, MongoClient
 
+from transaction_api.settings import Settings, settings
 
-class DatabaseService:
-    def __init__(self):
-        config = {
-            "host": f"mongodb://{environ.get("MONGO_DB_HOST", "localhost")}:27017",
-            "username": "root",
-            "password": "password",
+from .monitoring import CommandMonitor, PoolStatistics
+from .threadpool import ThreadpoolClient, ThreadpoolDatabase
+
+
+def client_options(config: Settings) -> dict:
+    write_concern = config.mongo_write_concern
+    options = {
+        "host": config.mongo_db_uri or f"mongodb://{config.mongo_db_host}:{config.mongo_db_port}",
+        "username": config.mongo_db_username,
+        "password": config.mongo_db_password,
+        "appname": "transaction_api",
+        "maxPoolSize": config.mongo_max_pool_size,
+        "minPoolSize": config.mongo_min_pool_size,
+        "waitQueueTimeoutMS": config.mongo_wait_queue_timeout_ms,
+        "socketTimeoutMS": config.mongo_socket_timeout_ms,
+        "connectTimeoutMS": config.mongo_connect_timeout_ms,
+        "serverSelectionTimeoutMS": config.mongo_server_selection_timeout_ms,
+        "compressors": config.mongo_compressors,
+        "readConcernLevel": config.mongo_read_concern,
+        "w": int(write_concern) if write_concern and write_concern.isdigit() else write_concern,
+        "readPreference": config.mongo_read_preference,
+    }
+    return {option: value for option, value in options.items() if value is not None}
+
+
+class _LazyDatabaseService:
+    client_class: type
+
+    def __init__(self, config: Settings = settings):
+        self.config = config
+        self.pool_statistics = PoolStatistics()
+        self.command_monitor = CommandMonitor(config.slow_command_ms)
+        self._client = None
+        self._database = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.client_class(
+                **client_options(self.config), event_listeners=[self.pool_statistics, self.command_monitor]
+            )
+        return self._client
+
+    @property
+    def database(self):
+        if self._database is None:
+            self._database = self.client.get_database(self.config.mongo_db_name)
+        return self._database
+
+    def stats(self) -> dict:
+        return {
+            "driver": self.config.database_driver,
+            "connected": self._client is not None,
+            "pool": self.pool_statistics.stats(self.config.mongo_max_pool_size),
         }
-        self.client = MongoClient(**config)
-        self.database = self.client.get_database("transaction_api")
 
 
-db_service = DatabaseService()
+class DatabaseService(_LazyDatabaseService):
+    client_class = MongoClient
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+        self._client = self._database = None
+
+
+class AsyncDatabaseService(_LazyDatabaseService):
+    client_class = AsyncMongoClient
+
+    async def connect(self) -> None:
+        await self.client.aconnect()
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+        self._client = self._database = None
+
+
+class ThreadpoolDatabaseService:
+    def __init__(self, service: DatabaseService | None = None):
+        self.sync = service or DatabaseService()
+        self._client = None
+        self._database = None
+
+    @property
+    def client(self) -> ThreadpoolClient:
+        if self._client is None:
+            self._client = ThreadpoolClient(self.sync.client)
+        return self._client
+
+    @property
+    def database(self) -> ThreadpoolDatabase:
+        if self._database is None:
+            self._database = ThreadpoolDatabase(self.sync.database)
+        return self._database
+
+    async def connect(self) -> None:
+        await self.database.command("ping")
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync.close)
+        self._client = self._database = None
+
+    def stats(self) -> dict:
+        return self.sync.stats()
+
+
+def create_database_service() -> AsyncDatabaseService | ThreadpoolDatabaseService:
+    if settings.database_driver == "sync":
+        return ThreadpoolDatabaseService()
+    return AsyncDatabaseService()
+
+
+db_service = create_database_service()
@@ -0,0 +1,184 @@
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class RequestTimings:
+    __slots__ = ("started", "db", "commands", "handler_finished", "response_started")
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.db = 0.0
+        self.commands = 0
+        self.handler_finished = None
+        self.response_started = None
+
+    @property
+    def total(self) -> float:
+        return (self.response_started or perf_counter()) - self.started
+
+    @property
+    def serialization(self) -> float:
+        if self.handler_finished is None or self.response_started is None:
+            return 0.0
+        return self.response_started - self.handler_finished
+
+    @property
+    def app(self) -> float:
+        return max(self.total - self.db - self.serialization, 0.0)
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.db * 1000:.2f};desc="{self.commands} commands", ' + ", ".join(
+            f"{name};dur={seconds * 1000:.2f}"
+            for name, seconds in (
+                ("app", self.app),
+                ("serialization", self.serialization),
+                ("total", self.total),
+            )
+        )
+
+
+current_timings: ContextVar[RequestTimings | None] = ContextVar("current_timings", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str = "") -> list[str]:
+        lines = []
+        cumulative = 0
+        separator = "," if labels else ""
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+        labels = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{labels} {self.sum}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+HISTOGRAMS = {
+    "http_request_duration_seconds": ("Time until the response started, per route.", "total"),
+    "http_request_db_seconds": ("Time spent waiting on MongoDB commands, per route.", "db"),
+    "http_request_serialization_seconds": (
+        "Time spent validating and encoding the response, per route.",
+        "serialization",
+    ),
+}
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = Lock()
+        self._requests = defaultdict(int)
+        self._commands = defaultdict(int)
+        self._histograms = defaultdict(lambda: {name: Histogram() for name in HISTOGRAMS})
+
+    def observe(self, method: str, route: str, status: int, timings: RequestTimings) -> None:
+        with self._lock:
+            self._requests[(method, route, status)] += 1
+            self._commands[(method, route)] += timings.commands
+            for name, histogram in self._histograms[(method, route)].items():
+                histogram.observe(getattr(timings, HISTOGRAMS[name][1]))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._requests.clear()
+            self._commands.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP http_requests_total Requests handled, per route and status code.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self._requests.items()):
+                lines.append(
+                    f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}'
+                )
+            lines.append("# HELP http_request_db_commands_total MongoDB commands issued, per route.")
+            lines.append("# TYPE http_request_db_commands_total counter")
+            for (method, route), count in sorted(self._commands.items()):
+                lines.append(f'http_request_db_commands_total{{method="{method}",route="{route}"}} {count}')
+            for name, (description, _) in HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+                for (method, route), histograms in sorted(self._histograms.items()):
+                    lines.extend(histograms[name].render(name, f'method="{method}",route="{route}"'))
+        return "\n".join(lines) + "\n"
+
+
+class GroupCommitMetrics:
+    def __init__(self):
+        self.queue_depth = 0
+        self.rejected = 0
+        self.batch_size = Histogram(SIZE_BUCKETS)
+        self.flush_duration = Histogram()
+
+    def observe_flush(self, size: int, seconds: float) -> None:
+        self.batch_size.observe(size)
+        self.flush_duration.observe(seconds)
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def render(self) -> str:
+        lines = [
+            "# HELP transaction_group_commit_queue_depth Transactions waiting for the next group commit.",
+            "# TYPE transaction_group_commit_queue_depth gauge",
+            f"transaction_group_commit_queue_depth {self.queue_depth}",
+            "# HELP transaction_group_commit_rejected_total Transactions rejected because the queue was full.",
+            "# TYPE transaction_group_commit_rejected_total counter",
+            f"transaction_group_commit_rejected_total {self.rejected}",
+            "# HELP transaction_group_commit_batch_size Transactions written per group commit.",
+            "# TYPE transaction_group_commit_batch_size histogram",
+            *self.batch_size.render("transaction_group_commit_batch_size"),
+            "# HELP transaction_group_commit_flush_seconds Duration of a group commit.",
+            "# TYPE transaction_group_commit_flush_seconds histogram",
+            *self.flush_duration.render("transaction_group_commit_flush_seconds"),
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class FeedMetrics:
+    def __init__(self):
+        self.subscribers = 0
+        self.published = 0
+        self.overflows = 0
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def render(self) -> str:
+        lines = [
+            "# HELP transaction_feed_subscribers Live transaction feeds open on this worker.",
+            "# TYPE transaction_feed_subscribers gauge",
+            f"transaction_feed_subscribers {self.subscribers}",
+            "# HELP transaction_feed_published_total Committed transactions offered to the live feeds.",
+            "# TYPE transaction_feed_published_total counter",
+            f"transaction_feed_published_total {self.published}",
+            "# HELP transaction_feed_overflows_total Live feeds cut off because their buffer was full.",
+            "# TYPE transaction_feed_overflows_total counter",
+            f"transaction_feed_overflows_total {self.overflows}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
+group_commit_metrics = GroupCommitMetrics()
+feed_metrics = FeedMetrics()
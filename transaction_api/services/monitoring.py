@@ -0,0 +1,146 @@
+import logging
+from threading import Lock
+
+from pymongo import monitoring
+
+from transaction_api.services.metrics import current_timings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStatistics(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = Lock()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_queue_timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checked_out += 1
+            self.checkouts += 1
+            wait_ms = event.duration * 1000
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.wait_queue_timeouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self, max_pool_size: int) -> dict:
+        with self._lock:
+            return {
+                "openConnections": self.open_connections,
+                "checkedOut": self.checked_out,
+                "maxPoolSize": max_pool_size,
+                "utilization": self.checked_out / max_pool_size if max_pool_size else 0.0,
+                "waiting": self.waiting,
+                "maxWaiting": self.max_waiting,
+                "checkouts": self.checkouts,
+                "checkoutFailures": self.checkout_failures,
+                "waitQueueTimeouts": self.wait_queue_timeouts,
+                "averageWaitMs": self.total_wait_ms / self.checkouts if self.checkouts else 0.0,
+                "maxWaitMs": self.max_wait_ms,
+            }
+
+
+FILTER_FIELDS = {
+    "find": ("filter",),
+    "findAndModify": ("query",),
+    "count": ("query",),
+    "distinct": ("query",),
+    "aggregate": ("pipeline",),
+    "update": ("updates", "q"),
+    "delete": ("deletes", "q"),
+}
+
+
+def _shape(value):
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        return [_shape(item) for item in value]
+    return "?"
+
+
+def command_shape(command: dict) -> object:
+    """Returns the filter of a command with every value replaced by ``?``."""
+    name = next(iter(command))
+    match FILTER_FIELDS.get(name):
+        case (field,):
+            return _shape(command.get(field, {}))
+        case (field, statement_field):
+            return [_shape(statement.get(statement_field, {})) for statement in command.get(field, [])]
+    return None
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """Attributes every command to the request that issued it and logs slow commands with their filter shape."""
+
+    def __init__(self, slow_command_ms: float | None = None):
+        self.slow_command_ms = slow_command_ms
+        self._commands = {}
+
+    def started(self, event):
+        if timings := current_timings.get():
+            timings.commands += 1
+        if self.slow_command_ms is not None:
+            self._commands[event.request_id] = event.command
+
+    def succeeded(self, event):
+        if timings := current_timings.get():
+            timings.db += event.duration_micros / 1_000_000
+        command = self._commands.pop(event.request_id, None)
+        if command is not None and event.duration_micros >= self.slow_command_ms * 1000:
+            logger.warning(
+                "Slow MongoDB command %s on %s took %.1f ms, filter %s",
+                event.command_name,
+                command.get(event.command_name),
+                event.duration_micros / 1000,
+                command_shape(command),
+            )
+
+    def failed(self, event):
+        self.succeeded(event)
@@ -0,0 +1,111 @@
+from bisect import bisect_right
+from collections.abc import Iterable
+from math import ceil, log
+
+
+class AmountSketch:
+    """
+    DDSketch of transaction amounts: every quantile is answered within ``relative_accuracy`` of the
+    exact value. Amounts are counted in logarithmic bins keyed by a string index, so two sketches
+    (or a sketch and a MongoDB ``$inc``) merge by adding counts.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = log(self.gamma)
+        self.positive: dict[str, int] = {}
+        self.negative: dict[str, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min: float | None = None
+        self.max: float | None = None
+
+    @classmethod
+    def from_document(cls, document: dict, relative_accuracy: float = 0.01) -> "AmountSketch":
+        sketch = cls(relative_accuracy)
+        sketch.merge_document(document)
+        return sketch
+
+    def bin_key(self, value: float) -> str:
+        return str(ceil(log(abs(value)) / self._log_gamma))
+
+    def bin_value(self, key: str) -> float:
+        return 2 * self.gamma ** int(key) / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value > 0:
+            bins = self.positive
+        elif value < 0:
+            bins = self.negative
+        else:
+            self.zero_count += count
+            bins = None
+        if bins is not None:
+            key = self.bin_key(value)
+            bins[key] = bins.get(key, 0) + count
+        self.count += count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge_document(self, document: dict) -> None:
+        for bins, stored in (
+            (self.positive, document.get("positive", {})),
+            (self.negative, document.get("negative", {})),
+        ):
+            for key, count in stored.items():
+                bins[key] = bins.get(key, 0) + count
+        self.zero_count += document.get("zero_count", 0)
+        self.count += document.get("count", 0)
+        for bound, pick in (("min", min), ("max", max)):
+            if document.get(bound) is not None:
+                current = getattr(self, bound)
+                setattr(self, bound, document[bound] if current is None else pick(current, document[bound]))
+
+    def merge(self, other: "AmountSketch") -> None:
+        self.merge_document(other.as_document())
+
+    def as_document(self) -> dict:
+        return {
+            "count": self.count,
+            "zero_count": self.zero_count,
+            "positive": dict(self.positive),
+            "negative": dict(self.negative),
+            "min": self.min,
+            "max": self.max,
+        }
+
+    def _bins(self) -> Iterable[tuple[float, int]]:
+        # Ascending order of value: the largest negative magnitudes come first.
+        for key in sorted(self.negative, key=int, reverse=True):
+            yield -self.bin_value(key), self.negative[key]
+        if self.zero_count:
+            yield 0.0, self.zero_count
+        for key in sorted(self.positive, key=int):
+            yield self.bin_value(key), self.positive[key]
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self._bins():
+            seen += count
+            if seen > rank:
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def histogram(self, edges: list[float]) -> list[int]:
+        """Counts per interval ``(-inf, edges[0]), [edges[0], edges[1]), ..., [edges[-1], inf)``.
+
+        Amounts are placed by the value of their bin, so an amount within the relative accuracy
+        of an edge may be counted on the other side of it.
+        """
+        counts = [0] * (len(edges) + 1)
+        for value, count in self._bins():
+            counts[bisect_right(edges, value)] += count
+        return counts
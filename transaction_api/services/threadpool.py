@@ -0,0 +1,132 @@
+"""Exposes the sync pymongo driver through the ``AsyncMongoClient`` interface by running
+every blocking call in the threadpool."""
+
+from itertools import islice
+
+from fastapi.concurrency import run_in_threadpool
+
+CURSOR_CHUNK_SIZE = 100
+
+
+class ThreadpoolContextManager:
+    def __init__(self, context_manager):
+        self._context_manager = context_manager
+
+    async def __aenter__(self):
+        return await run_in_threadpool(self._context_manager.__enter__)
+
+    async def __aexit__(self, *exc_info):
+        return await run_in_threadpool(self._context_manager.__exit__, *exc_info)
+
+
+class ThreadpoolSession:
+    def __init__(self, session):
+        self.session = session
+
+    async def __aenter__(self):
+        await run_in_threadpool(self.session.__enter__)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await run_in_threadpool(self.session.__exit__, *exc_info)
+
+    async def start_transaction(self, **kwargs):
+        return ThreadpoolContextManager(self.session.start_transaction(**kwargs))
+
+
+class ThreadpoolCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        method = getattr(self._cursor, name)
+
+        def modifier(*args, **kwargs):
+            method(*args, **kwargs)
+            return self
+
+        return modifier
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        iterator = iter(self._cursor)
+        while chunk := await run_in_threadpool(lambda: list(islice(iterator, CURSOR_CHUNK_SIZE))):
+            for document in chunk:
+                yield document
+
+    async def to_list(self, length: int | None = None) -> list:
+        if length is None:
+            return await run_in_threadpool(list, self._cursor)
+        return await run_in_threadpool(lambda: list(islice(self._cursor, length)))
+
+    async def try_next(self):
+        return await run_in_threadpool(self._cursor.try_next)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self._cursor.close)
+
+
+def _unwrap_session(kwargs: dict) -> dict:
+    if isinstance(session := kwargs.get("session"), ThreadpoolSession):
+        kwargs["session"] = session.session
+    return kwargs
+
+
+class ThreadpoolCollection:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs) -> ThreadpoolCursor:
+        return ThreadpoolCursor(self._collection.find(*args, **_unwrap_session(kwargs)))
+
+    async def aggregate(self, *args, **kwargs) -> ThreadpoolCursor:
+        return ThreadpoolCursor(
+            await run_in_threadpool(self._collection.aggregate, *args, **_unwrap_session(kwargs))
+        )
+
+    async def list_indexes(self, *args, **kwargs) -> ThreadpoolCursor:
+        return ThreadpoolCursor(
+            await run_in_threadpool(self._collection.list_indexes, *args, **_unwrap_session(kwargs))
+        )
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return await run_in_threadpool(method, *args, **_unwrap_session(kwargs))
+
+        return call
+
+
+class ThreadpoolDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def get_collection(self, name: str, **kwargs) -> ThreadpoolCollection:
+        return ThreadpoolCollection(self._database.get_collection(name, **kwargs))
+
+    async def watch(self, *args, **kwargs) -> ThreadpoolCursor:
+        return ThreadpoolCursor(
+            await run_in_threadpool(self._database.watch, *args, **_unwrap_session(kwargs))
+        )
+
+    def __getattr__(self, name):
+        method = getattr(self._database, name)
+
+        async def call(*args, **kwargs):
+            return await run_in_threadpool(method, *args, **_unwrap_session(kwargs))
+
+        return call
+
+
+class ThreadpoolClient:
+    def __init__(self, client):
+        self._client = client
+
+    def start_session(self, **kwargs) -> ThreadpoolSession:
+        return ThreadpoolSession(self._client.start_session(**kwargs))
+
+    async def close(self) -> None:
+        await run_in_threadpool(self._client.close)
@@ -0,0 +1,58 @@
+from os import environ
+from typing import Literal
+
+from pydantic import BaseModel
+
+
+class Settings(BaseModel):
+    mongo_db_host: str = "localhost"
+    mongo_db_port: int = 27017
+    mongo_db_uri: str | None = None
+    mongo_db_username: str | None = "root"
+    mongo_db_password: str | None = "password"
+    mongo_db_name: str = "transaction_api"
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_wait_queue_timeout_ms: int | None = None
+    mongo_socket_timeout_ms: int | None = None
+    mongo_connect_timeout_ms: int = 20000
+    mongo_server_selection_timeout_ms: int = 30000
+    mongo_compressors: str | None = None
+    mongo_read_concern: str | None = None
+    mongo_write_concern: str | None = None
+    mongo_read_preference: str | None = None
+    database_driver: Literal["async", "sync"] = "async"
+    use_transactions: bool = False
+    export_batch_size: int = 1000
+    raw_responses: bool = False
+    compression_minimum_size: int | None = 1024
+    cache_max_entries: int = 10000
+    cache_ttl_seconds: float = 5.0
+    checkpoint_interval: int = 100
+    sketch_relative_accuracy: float = 0.01
+    sketch_shards: int = 16
+    transaction_partitioning: Literal["none", "month"] = "none"
+    archive_path: str | None = None
+    archive_user_buckets: int = 16
+    archive_batch_size: int = 10000
+    purge_batch_size: int = 1000
+    group_commit: bool = False
+    group_commit_flush_size: int = 500
+    group_commit_flush_interval_ms: float = 2.0
+    group_commit_max_queue_depth: int = 10000
+    purge_batch_pause_ms: float = 10.0
+    transaction_feed: Literal["local", "change_stream"] = "local"
+    feed_buffer_size: int = 1000
+    feed_heartbeat_seconds: float = 15.0
+    server_timing: bool = False
+    slow_command_ms: float | None = 100.0
+    # A plain POST /transactions issues six: replay lookup, balance update, insert, version bump after the
+    # insert, rollup and sketch upserts.
+    max_commands_per_request: int | None = 6
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(**{name: environ[name.upper()] for name in cls.model_fields if name.upper() in environ})
+
+
+settings = Settings.from_env()